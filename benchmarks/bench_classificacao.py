@@ -0,0 +1,88 @@
+"""Compara a classificação vetorizada com a versão antiga linha a linha.
+
+Confere que ``SLA_Status`` e ``Status_Circuito`` saem idênticos aos da
+implementação com ``apply`` e mostra o ganho de tempo::
+
+    python -m benchmarks.bench_classificacao --linhas 10000 100000 1000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from validacao.colunas import COL_CIRCUITO, COL_DISP_MENSAL, COL_SLA_DISP
+from validacao.motor import chaves_circuito, classificar_sla, indexar_base, status_circuitos
+
+
+# Implementação original (linha a linha), mantida como referência -------------
+
+def classificar_sla_antigo(previa):
+    def verificar_sla(row):
+        if pd.isna(row.get(COL_DISP_MENSAL)) or pd.isna(row.get(COL_SLA_DISP)):
+            return "Dados faltando"
+        return "Excedido" if row[COL_DISP_MENSAL] < row[COL_SLA_DISP] else "Não Excedido"
+
+    return previa.apply(verificar_sla, axis=1)
+
+
+def classificar_circuitos_antigo(circuitos, circuitos_base):
+    def status_circuito(circ):
+        if pd.isna(circ):
+            return "Circuito ausente"
+        return "OK" if str(circ).strip() in circuitos_base else "Extra na Prévia"
+
+    return circuitos.apply(status_circuito)
+
+
+# -----------------------------------------------------------------------------
+
+def gerar_previa(linhas, seed=0):
+    rng = np.random.default_rng(seed)
+    circuitos = pd.Series([f"CIRC{i:07d}" for i in range(linhas)], dtype=object)
+    # Alguns circuitos com espaços nas pontas, ausentes ou extras
+    circuitos[rng.random(linhas) < 0.02] = circuitos.str.pad(12, side="both")
+    circuitos[rng.random(linhas) < 0.01] = np.nan
+    disp = pd.Series(rng.uniform(0.95, 1.0, linhas))
+    disp[rng.random(linhas) < 0.01] = np.nan
+    previa = pd.DataFrame({COL_CIRCUITO: circuitos, COL_DISP_MENSAL: disp, COL_SLA_DISP: 0.99})
+    circuitos_base = {f"CIRC{i:07d}" for i in range(0, linhas, 1) if i % 20}
+    return previa, circuitos_base
+
+
+def status_pelo_indice(circuitos, indice):
+    chaves = chaves_circuito(circuitos)
+    return status_circuitos(chaves, indice.presentes(chaves))
+
+
+def medir(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args(argv)
+
+    print(f"{'linhas':>10} {'etapa':<16} {'apply (s)':>10} {'vetor. (s)':>10} {'ganho':>8}")
+    for linhas in args.linhas:
+        previa, circuitos_base = gerar_previa(linhas)
+
+        antigo, t_antigo = medir(classificar_sla_antigo, previa)
+        novo, t_novo = medir(classificar_sla, previa)
+        assert (novo.astype(object) == antigo).all(), "SLA_Status divergente"
+        print(f"{linhas:>10} {'SLA_Status':<16} {t_antigo:>10.3f} {t_novo:>10.3f} {t_antigo / t_novo:>7.0f}x")
+
+        antigo, t_antigo = medir(classificar_circuitos_antigo, previa[COL_CIRCUITO], circuitos_base)
+        # Como em ``validar``: consulta ao índice da Base (montado fora da medida)
+        indice = indexar_base(pd.DataFrame({COL_CIRCUITO: sorted(circuitos_base)}))
+        novo, t_novo = medir(status_pelo_indice, previa[COL_CIRCUITO], indice)
+        assert (novo.astype(object) == antigo).all(), "Status_Circuito divergente"
+        print(f"{linhas:>10} {'Status_Circuito':<16} {t_antigo:>10.3f} {t_novo:>10.3f} {t_antigo / t_novo:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Gerador de Prévias e Bases sintéticas para testes de desempenho.
+
+As planilhas reais dos clientes não podem sair de casa; este gerador monta
+arquivos com a mesma forma (Base com várias abas e as colunas F/G nas
+posições esperadas, Prévia com as porcentagens de disponibilidade) e com as
+imperfeições que importam para o desempenho: circuitos repetidos entre abas
+da Base, valores faltando, circuitos extras/ausentes e espaços nas pontas::
+
+    python -m benchmarks.gerador --linhas 100000 --abas 8 --saida dados/sinteticos
+    python -m benchmarks.gerador --linhas 1000000 --formato parquet --disponibilidade porcentagem
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from validacao.colunas import COL_CIRCUITO, COL_DISP_MENSAL, COL_SLA_DISP, COL_VALOR_CONTRATADO
+
+# fracao: 0.9812; porcentagem: 98.12 (as duas aparecem nas Prévias reais)
+FORMATOS_DISPONIBILIDADE = ("fracao", "porcentagem")
+FORMATOS_ARQUIVO = ("xlsx", "parquet")
+
+# Colunas da Base na ordem real: F e G (posições 5 e 6) são Velocidade e Endereço
+COLUNAS_BASE = [
+    COL_CIRCUITO, "Cliente", "Cidade", "UF", "Tecnologia", "Velocidade", "Endereço",
+    COL_VALOR_CONTRATADO, "Data Ativação",
+]
+
+_UFS = np.array(["SP", "RJ", "MG", "RS", "PR", "SC", "BA", "PE", "CE", "GO", "DF"])
+_TECNOLOGIAS = np.array(["Fibra", "Rádio", "MPLS", "Satélite"])
+_VELOCIDADES = np.array(["10 Mbps", "50 Mbps", "100 Mbps", "500 Mbps", "1 Gbps"])
+
+
+def _circuitos(inicio, quantidade):
+    return np.array([f"CIRC{i:08d}" for i in range(inicio, inicio + quantidade)], dtype=object)
+
+
+def _com_faltantes(valores, taxa, rng):
+    valores = pd.Series(valores)
+    if taxa:
+        valores[rng.random(len(valores)) < taxa] = None
+    return valores
+
+
+def gerar_base(linhas, abas=8, taxa_duplicados=0.01, taxa_faltantes=0.01, seed=0):
+    """Abas da Base (``{nome: DataFrame}``) com ``linhas`` circuitos distintos.
+
+    ``taxa_duplicados`` dos circuitos reaparece numa aba seguinte, com outro
+    Valor Contratado, como acontece nas Bases reais.
+    """
+    rng = np.random.default_rng(seed)
+    circuitos = _circuitos(0, linhas)
+    aba_de = rng.integers(0, abas, linhas)
+
+    repetidos = np.flatnonzero(rng.random(linhas) < taxa_duplicados)
+    circuitos = np.concatenate([circuitos, circuitos[repetidos]])
+    aba_de = np.concatenate([aba_de, (aba_de[repetidos] + 1) % abas])
+    total = len(circuitos)
+
+    dados = pd.DataFrame({
+        COL_CIRCUITO: circuitos,
+        "Cliente": [f"Cliente {i}" for i in rng.integers(1, max(2, total // 50), total)],
+        "Cidade": [f"Cidade {i}" for i in rng.integers(1, 500, total)],
+        "UF": _UFS[rng.integers(0, len(_UFS), total)],
+        "Tecnologia": _TECNOLOGIAS[rng.integers(0, len(_TECNOLOGIAS), total)],
+        "Velocidade": _VELOCIDADES[rng.integers(0, len(_VELOCIDADES), total)],
+        "Endereço": [f"Rua {i}, {n}" for i, n in zip(rng.integers(1, 5000, total), rng.integers(1, 2000, total))],
+        COL_VALOR_CONTRATADO: _com_faltantes(rng.uniform(150, 25_000, total).round(2), taxa_faltantes, rng),
+        "Data Ativação": pd.Timestamp("2018-01-01") + pd.to_timedelta(rng.integers(0, 2500, total), unit="D"),
+    }, columns=COLUNAS_BASE)
+    return {f"Regional {i + 1}": dados[aba_de == i].reset_index(drop=True) for i in range(abas)}
+
+
+def gerar_previa(linhas, taxa_faltantes=0.01, disponibilidade="fracao", taxa_extras=0.02,
+                 taxa_ausentes=0.02, taxa_espacos=0.02, seed=0):
+    """Prévia para uma Base de ``linhas`` circuitos (ver ``gerar_base``).
+
+    ``taxa_ausentes`` dos circuitos da Base não aparece na Prévia e
+    ``taxa_extras`` (em relação a ``linhas``) são circuitos que a Base não tem.
+    """
+    if disponibilidade not in FORMATOS_DISPONIBILIDADE:
+        raise ValueError(
+            f"Formato de disponibilidade desconhecido: {disponibilidade!r} "
+            f"(opções: {', '.join(FORMATOS_DISPONIBILIDADE)})"
+        )
+    rng = np.random.default_rng(seed + 1)
+    circuitos = _circuitos(0, linhas)[rng.random(linhas) >= taxa_ausentes]
+    circuitos = np.concatenate([circuitos, _circuitos(linhas, int(linhas * taxa_extras))])
+    rng.shuffle(circuitos)
+    total = len(circuitos)
+
+    com_espacos = rng.random(total) < taxa_espacos
+    circuitos[com_espacos] = [f" {c} " for c in circuitos[com_espacos]]
+
+    # Maioria dentro do SLA; uma cauda de circuitos com quedas longas
+    disp = np.where(rng.random(total) < 0.85, rng.uniform(0.99, 1.0, total), rng.uniform(0.90, 0.99, total))
+    sla = rng.choice([0.98, 0.99, 0.995], total)
+    if disponibilidade == "porcentagem":
+        disp, sla = disp * 100, sla * 100
+
+    return pd.DataFrame({
+        COL_CIRCUITO: _com_faltantes(circuitos, taxa_faltantes, rng),
+        COL_DISP_MENSAL: _com_faltantes(disp.round(4), taxa_faltantes, rng),
+        COL_SLA_DISP: _com_faltantes(sla, taxa_faltantes, rng),
+    })
+
+
+def gravar_xlsx(abas, caminho):
+    """Grava ``{aba: DataFrame}`` em streaming (xlsxwriter ``constant_memory``)."""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(caminho, {"constant_memory": True, "default_date_format": "dd/mm/yyyy"})
+    for nome, df in abas.items():
+        worksheet = workbook.add_worksheet(nome)
+        worksheet.write_row(0, 0, [str(c) for c in df.columns])
+        valores = df.astype(object).where(df.notna(), None)
+        for numero, linha in enumerate(valores.itertuples(index=False, name=None), start=1):
+            worksheet.write_row(numero, 0, linha)
+    workbook.close()
+
+
+def gravar(previa, abas_base, diretorio, formato="xlsx"):
+    """Grava ``previa`` e ``base`` no ``diretorio``; devolve os dois caminhos.
+
+    Em Parquet a Base sai consolidada (todas as abas em sequência), como num
+    snapshot.
+    """
+    if formato not in FORMATOS_ARQUIVO:
+        raise ValueError(f"Formato desconhecido: {formato!r} (opções: {', '.join(FORMATOS_ARQUIVO)})")
+    os.makedirs(diretorio, exist_ok=True)
+    caminho_previa = os.path.join(diretorio, f"previa.{formato}")
+    caminho_base = os.path.join(diretorio, f"base.{formato}")
+    if formato == "xlsx":
+        gravar_xlsx({"Prévia": previa}, caminho_previa)
+        gravar_xlsx(abas_base, caminho_base)
+    else:
+        previa.to_parquet(caminho_previa, index=False)
+        pd.concat(abas_base.values(), ignore_index=True).to_parquet(caminho_base, index=False)
+    return caminho_previa, caminho_base
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.gerador",
+        description="Gera uma Prévia e uma Base sintéticas.",
+    )
+    parser.add_argument("--linhas", type=int, default=100_000, help="Circuitos distintos na Base")
+    parser.add_argument("--abas", type=int, default=8, help="Abas da Base")
+    parser.add_argument("--duplicados", type=float, default=0.01, help="Fração de circuitos repetidos na Base")
+    parser.add_argument("--faltantes", type=float, default=0.01, help="Fração de valores faltando por coluna")
+    parser.add_argument("--extras", type=float, default=0.02, help="Circuitos da Prévia que não estão na Base")
+    parser.add_argument("--ausentes", type=float, default=0.02, help="Circuitos da Base que não estão na Prévia")
+    parser.add_argument("--disponibilidade", choices=FORMATOS_DISPONIBILIDADE, default="fracao",
+                        help="Disponibilidade e SLA em fração (0-1) ou porcentagem (0-100)")
+    parser.add_argument("--formato", choices=FORMATOS_ARQUIVO, nargs="+", default=["xlsx"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--saida", default=os.path.join("dados", "sinteticos"), help="Diretório de saída")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    abas = gerar_base(args.linhas, args.abas, args.duplicados, args.faltantes, args.seed)
+    previa = gerar_previa(
+        args.linhas, args.faltantes, args.disponibilidade, args.extras, args.ausentes, seed=args.seed,
+    )
+    for formato in args.formato:
+        caminhos = gravar(previa, abas, args.saida, formato)
+        print(f"{formato}: {', '.join(caminhos)}")
+    linhas_base = sum(len(df) for df in abas.values())
+    print(f"Prévia: {len(previa):,} linhas; Base: {linhas_base:,} linhas em {args.abas} abas "
+          f"({time.perf_counter() - inicio:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Tempo de inicialização do painel, medido com ``python -X importtime``.
+
+Roda ``streamlit_app.py`` num processo novo, em modo bare (sem servidor e
+sem arquivos enviados: só as importações e a montagem da tela vazia), como
+na subida de um pod, e soma o tempo de importação dos módulos de primeiro
+nível. Também confere que os módulos carregados sob demanda (gráficos,
+engines de Excel, DuckDB) continuam fora da inicialização::
+
+    python -m benchmarks.importacao --saida importacao.json
+    python -m benchmarks.importacao --comparar importacao.json
+
+Com ``--comparar``, o total é confrontado com o de um resultado anterior
+(mesma regra de ``benchmarks.suite``); o comando termina com código 1 se
+piorar além da ``--tolerancia`` ou se um módulo sob demanda for importado
+na inicialização.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from benchmarks.suite import comparar
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "streamlit_app.py")
+
+# Só podem ser importados quando um gráfico, uma leitura ou uma exportação pede.
+# ``plotly.graph_objects`` fica de fora: o próprio Streamlit o importa (e ele
+# só carrega as figuras quando usadas)
+MODULOS_SOB_DEMANDA = (
+    "matplotlib", "seaborn", "plotly.express", "plotly.subplots",
+    "openpyxl", "xlsxwriter", "python_calamine", "duckdb", "pyinstrument",
+)
+
+
+def ler_importtime(saida):
+    """``[(módulo, próprio_s, acumulado_s, nível)]`` das linhas de ``-X importtime``."""
+    modulos = []
+    for linha in saida.splitlines():
+        if not linha.startswith("import time:") or "self [us]" in linha:
+            continue
+        proprio, acumulado, nome = linha[len("import time:"):].split("|")
+        nivel = (len(nome) - len(nome.lstrip()) - 1) // 2
+        modulos.append((nome.strip(), int(proprio) / 1e6, int(acumulado) / 1e6, nivel))
+    return modulos
+
+
+def medir(app=APP):
+    """Uma execução: (segundos de importação, segundos do processo, módulos)."""
+    inicio = time.perf_counter()
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", app],
+        capture_output=True, text=True, cwd=os.path.dirname(app),
+    )
+    duracao = time.perf_counter() - inicio
+    if processo.returncode != 0:
+        raise RuntimeError(f"{app} terminou com código {processo.returncode}:\n{processo.stderr[-2000:]}")
+    modulos = ler_importtime(processo.stderr)
+    return sum(m[2] for m in modulos if m[3] == 0), duracao, modulos
+
+
+def rodar(repeticoes=5, app=APP):
+    """Mede ``repeticoes`` inicializações (depois de uma de aquecimento, que
+    compila os .pyc); fica com a mais rápida."""
+    medir(app)
+    execucoes = [medir(app) for _ in range(repeticoes)]
+    importacao, processo, modulos = min(execucoes, key=lambda e: e[0])
+    carregados = {m[0] for m in modulos}
+    mais_pesados = sorted((m for m in modulos if m[3] == 0), key=lambda m: m[2], reverse=True)[:10]
+    return {
+        "resultados": {
+            "importacao.total": {"segundos": importacao},
+            "importacao.processo": {"segundos": min(e[1] for e in execucoes)},
+        },
+        "mais_pesados": {nome: acumulado for nome, _, acumulado, _ in mais_pesados},
+        "sob_demanda_carregados": [m for m in MODULOS_SOB_DEMANDA if m in carregados],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.importacao", description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--saida", help="Grava o resultado em JSON")
+    parser.add_argument("--comparar", metavar="ANTERIOR.json", help="Resultado anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2,
+                        help="Piora relativa aceita antes de acusar regressão (padrão: 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    medida = rodar(args.repeticoes)
+    resultados = medida["resultados"]
+    print(f"{'Importações na inicialização':<40} {resultados['importacao.total']['segundos']:>9.3f} s")
+    print(f"{'Processo inteiro (bare)':<40} {resultados['importacao.processo']['segundos']:>9.3f} s")
+    for nome, segundos in medida["mais_pesados"].items():
+        print(f"  {nome:<38} {segundos:>9.3f} s")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "maquina": platform.machine(),
+                "cpus": os.cpu_count(),
+                **medida,
+            }, f, ensure_ascii=False, indent=2)
+
+    codigo = 0
+    if medida["sob_demanda_carregados"]:
+        print("Importados na inicialização (deveriam ser sob demanda): " + ", ".join(medida["sob_demanda_carregados"]))
+        codigo = 1
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anteriores = json.load(f)["resultados"]
+        regressoes = comparar(resultados, anteriores, args.tolerancia)
+        for nome, antes, agora, razao in regressoes:
+            print(f"REGRESSÃO {nome}: {antes:.4f} s -> {agora:.4f} s ({razao:.2f}x)")
+        if regressoes:
+            codigo = 1
+        else:
+            print(f"Sem regressões acima de {args.tolerancia:.0%}.")
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""Suíte de benchmarks do pipeline com dados sintéticos (``benchmarks.gerador``).
+
+Cobre leitura, classificação, junção, penalidades, compactação, os agregados dos gráficos,
+as exportações e o histórico de SLA, de 10 mil a 1 milhão de linhas. As classes seguem as
+convenções do asv (``params``, ``setup`` e métodos ``time_*``), mas a suíte
+roda sozinha::
+
+    python -m benchmarks.suite --linhas 10000 100000 --saida resultados.json
+    python -m benchmarks.suite --linhas 100000 --comparar resultados.json
+
+Com ``--comparar``, cada medida é confrontada com a de um resultado anterior
+e o comando termina com código 1 se alguma ficar mais lenta que a
+``--tolerancia``. As planilhas .xlsx geradas ficam em cache em disco (a
+geração de 1 milhão de linhas leva minutos).
+"""
+
+import argparse
+import functools
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmarks.gerador import gerar_base, gerar_previa, gravar
+from validacao.agregados import contar_categorias, histograma
+from validacao.colunas import COL_CIRCUITO
+from validacao.exportacao import exportar_faturamento, exportar_validacao
+from validacao.faturamento import mes_referencia, montar_faturamento
+from validacao.historico import HistoricoSLA
+from validacao.instrumentacao import Instrumentacao
+from validacao.leitura import ler_base, ler_previa, normalizar_porcentagens
+from validacao.memoria import compactar
+from validacao.motor import (
+    calcular_penalidades,
+    chaves_circuito,
+    classificar_sla,
+    indexar_base,
+    status_circuitos,
+    validar,
+)
+
+LINHAS = [10_000, 100_000, 1_000_000]
+ABAS = 8
+
+DIRETORIO_CACHE = os.environ.get(
+    "VALIDACAO_BENCH_DIR", os.path.join(tempfile.gettempdir(), "validacao_bench")
+)
+
+
+@functools.lru_cache(maxsize=2)
+def dados(linhas):
+    """(Prévia normalizada, Base consolidada) em memória."""
+    abas = gerar_base(linhas, ABAS)
+    previa = normalizar_porcentagens(gerar_previa(linhas))
+    base = pd.concat(abas.values(), ignore_index=True)
+    base.attrs["colunas_fg"] = list(base.columns[5:7])
+    return previa, base
+
+
+def arquivos(linhas):
+    """Caminhos de previa.xlsx e base.xlsx, gerados uma vez e reaproveitados."""
+    diretorio = os.path.join(DIRETORIO_CACHE, f"{linhas}_{ABAS}")
+    caminhos = (os.path.join(diretorio, "previa.xlsx"), os.path.join(diretorio, "base.xlsx"))
+    if not all(os.path.exists(c) for c in caminhos):
+        gravar(gerar_previa(linhas), gerar_base(linhas, ABAS), diretorio, "xlsx")
+    return caminhos
+
+
+class Leitura:
+    params = [LINHAS]
+    param_names = ["linhas"]
+
+    def setup(self, linhas):
+        self.previa, self.base = arquivos(linhas)
+
+    def time_ler_previa(self, linhas):
+        ler_previa(self.previa)
+
+    def time_ler_base(self, linhas):
+        ler_base(self.base)
+
+
+class Classificacao:
+    params = [LINHAS]
+    param_names = ["linhas"]
+
+    def setup(self, linhas):
+        self.previa, base = dados(linhas)
+        self.chaves = chaves_circuito(self.previa[COL_CIRCUITO])
+        self.indice = indexar_base(base)
+
+    def time_classificar_sla(self, linhas):
+        classificar_sla(self.previa)
+
+    def time_status_circuito(self, linhas):
+        # Como em ``validar``: consulta ao índice da Base
+        status_circuitos(self.chaves, self.indice.presentes(self.chaves))
+
+
+class Juncao:
+    params = [LINHAS]
+    param_names = ["linhas"]
+
+    def setup(self, linhas):
+        self.previa, self.base = dados(linhas)
+        self.indice = indexar_base(self.base)
+        self.chaves = chaves_circuito(self.previa[COL_CIRCUITO])
+
+    def time_indexar_base(self, linhas):
+        indexar_base(self.base)
+
+    def time_juntar(self, linhas):
+        self.indice.juntar(self.previa, self.chaves)
+
+
+class Penalidades:
+    params = [LINHAS]
+    param_names = ["linhas"]
+
+    def setup(self, linhas):
+        self.previa_final = validar(*dados(linhas)).previa_final
+
+    def time_calcular_penalidades(self, linhas):
+        # O cálculo sobrescreve as mesmas colunas: repetir é idempotente
+        calcular_penalidades(self.previa_final)
+
+
+class Compactacao:
+    params = [LINHAS]
+    param_names = ["linhas"]
+
+    def setup(self, linhas):
+        # A Prévia validada como sai da junção, antes de compactada
+        previa, base = dados(linhas)
+        previa = previa.assign(SLA_Status=classificar_sla(previa))
+        juntada = indexar_base(base).juntar(previa, chaves_circuito(previa[COL_CIRCUITO]))
+        self.previa_final = calcular_penalidades(juntada)
+
+    def time_compactar(self, linhas):
+        compactar(self.previa_final)
+
+
+class Validacao:
+    params = [LINHAS]
+    param_names = ["linhas"]
+
+    def setup(self, linhas):
+        self.previa, self.base = dados(linhas)
+
+    def time_validar(self, linhas):
+        validar(self.previa, self.base)
+
+
+class Graficos:
+    params = [LINHAS]
+    param_names = ["linhas"]
+
+    def setup(self, linhas):
+        self.previa_final = validar(*dados(linhas)).previa_final
+        self.faturamento = montar_faturamento(self.previa_final)
+
+    def time_contar_categorias(self, linhas):
+        contar_categorias(self.previa_final["Status_Circuito"])
+        contar_categorias(self.previa_final["SLA_Status"])
+
+    def time_histograma(self, linhas):
+        histograma(self.faturamento["Valor Contratado"], 20)
+
+
+class Exportacao:
+    params = [LINHAS, ["xlsx", "csv", "parquet"]]
+    param_names = ["linhas", "formato"]
+
+    def setup(self, linhas, formato):
+        self.previa_final = validar(*dados(linhas)).previa_final
+        self.faturamento = montar_faturamento(self.previa_final)
+
+    def time_exportar_validacao(self, linhas, formato):
+        exportar_validacao(self.previa_final, formato)
+
+    def time_exportar_faturamento(self, linhas, formato):
+        exportar_faturamento(self.faturamento, mes_referencia(), formato)
+
+
+class Historico:
+    params = [LINHAS]
+    param_names = ["linhas"]
+
+    # Meses registrados antes das medidas (o mesmo resultado em cada mês)
+    MESES = 24
+
+    def setup(self, linhas):
+        self.previa_final = validar(*dados(linhas)).previa_final
+        self.meses = [f"{2024 + i // 12}-{i % 12 + 1:02d}" for i in range(self.MESES)]
+        self.diretorio = tempfile.mkdtemp(prefix="validacao_historico_")
+        historico = HistoricoSLA(self.diretorio)
+        for mes in self.meses:
+            historico.registrar(self.previa_final, mes, "sintetico", atualizar=False)
+        historico.atualizar_resumos()
+        self.circuitos = list(historico.reincidentes(limite=5)[COL_CIRCUITO])
+
+    def teardown(self, linhas):
+        shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def time_registrar_mes(self, linhas):
+        # Regrava o último mês e refaz os resumos, como a cada validação no painel
+        HistoricoSLA(self.diretorio).registrar(self.previa_final, self.meses[-1], "sintetico")
+
+    # Instâncias novas: mede a leitura dos resumos, sem o que já ficou em memória
+    def time_resumo_mensal(self, linhas):
+        HistoricoSLA(self.diretorio).resumo_mensal()
+
+    def time_reincidentes(self, linhas):
+        HistoricoSLA(self.diretorio).reincidentes(2)
+
+    def time_serie(self, linhas):
+        HistoricoSLA(self.diretorio).serie(self.circuitos)
+
+
+SUITE = [Leitura, Classificacao, Juncao, Penalidades, Compactacao, Validacao, Graficos, Exportacao, Historico]
+
+
+def _combinacoes(classe, linhas):
+    """Parâmetros de cada execução, com ``linhas`` no lugar do primeiro eixo."""
+    combinacoes = [(n,) for n in linhas]
+    for eixo in classe.params[1:]:
+        combinacoes = [c + (valor,) for c in combinacoes for valor in eixo]
+    return combinacoes
+
+
+def rodar(linhas, repeticoes=3, filtro=""):
+    """Mede cada ``time_*`` da suíte; devolve ``{nome: medida}``.
+
+    ``segundos`` é o menor tempo entre as repetições (o menos afetado por
+    ruído da máquina), usado nas comparações.
+    """
+    resultados = {}
+    for classe in SUITE:
+        metodos = sorted(m for m in dir(classe) if m.startswith("time_"))
+        for parametros in _combinacoes(classe, linhas):
+            rotulo = "-".join(str(p) for p in parametros)
+            nomes = {m: f"{classe.__name__}.{m}[{rotulo}]" for m in metodos}
+            nomes = {m: nome for m, nome in nomes.items() if filtro.lower() in nome.lower()}
+            if not nomes:
+                continue
+            instancia = classe()
+            instancia.setup(*parametros)
+            for metodo, nome in nomes.items():
+                medicoes = []
+                for _ in range(repeticoes):
+                    instrumentacao = Instrumentacao(exclusiva=True)
+                    with instrumentacao.etapa(nome):
+                        getattr(instancia, metodo)(*parametros)
+                    medicoes.append(instrumentacao.medicoes[nome])
+                tempos = [m.parede_s for m in medicoes]
+                resultados[nome] = {
+                    "segundos": min(tempos),
+                    "mediana_s": statistics.median(tempos),
+                    "cpu_s": min(m.cpu_s for m in medicoes),
+                    "pico_memoria_mb": max(m.pico_memoria_mb for m in medicoes),
+                }
+                print(
+                    f"{nome:<58} {min(tempos):>9.4f} s (mediana {statistics.median(tempos):.4f} s) "
+                    f"{resultados[nome]['pico_memoria_mb']:>7.0f} MB",
+                    flush=True,
+                )
+            if hasattr(instancia, "teardown"):
+                instancia.teardown(*parametros)
+    return resultados
+
+
+def comparar(atuais, anteriores, tolerancia):
+    """Linhas (nome, antes, agora, razão) das medidas que pioraram além da tolerância."""
+    regressoes = []
+    for nome, atual in atuais.items():
+        anterior = anteriores.get(nome)
+        if anterior is None or anterior["segundos"] <= 0:
+            continue
+        razao = atual["segundos"] / anterior["segundos"]
+        if razao > 1 + tolerancia:
+            regressoes.append((nome, anterior["segundos"], atual["segundos"], razao))
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__.splitlines()[0])
+    parser.add_argument("--linhas", type=int, nargs="+", default=[10_000, 100_000],
+                        help="Tamanhos a medir (padrão: 10000 100000; a suíte completa vai até 1000000)")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--filtro", default="", help="Só os benchmarks cujo nome contém este texto")
+    parser.add_argument("--saida", help="Grava os resultados em JSON")
+    parser.add_argument("--comparar", metavar="ANTERIOR.json", help="Resultado anterior para detectar regressões")
+    parser.add_argument("--tolerancia", type=float, default=0.2,
+                        help="Piora relativa aceita antes de acusar regressão (padrão: 0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    resultados = rodar(args.linhas, args.repeticoes, args.filtro)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "maquina": platform.machine(),
+                "cpus": os.cpu_count(),
+                "resultados": resultados,
+            }, f, ensure_ascii=False, indent=2)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anteriores = json.load(f)["resultados"]
+        regressoes = comparar(resultados, anteriores, args.tolerancia)
+        for nome, antes, agora, razao in regressoes:
+            print(f"REGRESSÃO {nome}: {antes:.4f} s -> {agora:.4f} s ({razao:.2f}x)")
+        if regressoes:
+            return 1
+        print(f"Sem regressões acima de {args.tolerancia:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
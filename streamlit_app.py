@@ -1,11 +1,28 @@
 import pandas as pd
 import streamlit as st
-import matplotlib.pyplot as plt
-import seaborn as sns
+import datetime
+import functools
+import importlib.util
+import inspect
+import os
 from io import BytesIO
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+
+from validacao import CacheLRU, Resultado, hash_conteudo, ler_base, ler_previa, validar
+from validacao.cache import chave_cache_resultado
+from validacao.colunas import COL_CIRCUITO, COL_DISP_MENSAL, COL_SLA_DISP
+from validacao.em_disco import BaseEmDisco, duckdb_disponivel
+from validacao.exportacao import FORMATOS_EXPORTACAO, exportar_faturamento, exportar_validacao
+from validacao.faturamento import mes_referencia
+from validacao.grade import TAMANHOS_PAGINA, fatiar_pagina, filtrar, ordenar, total_paginas
+from validacao.historico import COL_MES, HistoricoSLA
+from validacao.incremental import ETAPAS_INCREMENTAIS, validar_incremental
+from validacao.indice import POLITICAS_CONFLITO, ConflitoCircuitos
+from validacao.instrumentacao import Instrumentacao, medir
+from validacao.leitura import MOTORES_LEITURA
+from validacao.lote import extrair_zip, parear_arquivos, processar_lote, resumo_combinado
+from validacao.motor import ETAPAS_VALIDACAO, STATUS_CIRCUITO, STATUS_SLA, VERSAO_MOTOR
+from validacao.snapshots import ArmazemSnapshots, mes_atual, validar_mes
+from validacao.tarefas import RegistroTarefas
 
 # Configuração da página
 st.set_page_config(
@@ -56,336 +73,621 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Título principal
-st.markdown("<div class=\"main-header\"><h1>📊 Painel de Validação Prévia x Base com SLA</h1></div>", unsafe_allow_html=True)
+# Cache de leitura compartilhado entre reruns e sessões (chave = hash do conteúdo);
+# em disco só com VALIDACAO_CACHE_DIR
+@st.cache_resource
+def obter_cache_leitura():
+    return CacheLRU(
+        limite_bytes=int(os.environ.get("VALIDACAO_CACHE_MEMORIA_MB", "512")) * 1024 ** 2,
+        diretorio=os.environ.get("VALIDACAO_CACHE_DIR"),
+        limite_disco_bytes=int(os.environ.get("VALIDACAO_CACHE_DISCO_MB", "2048")) * 1024 ** 2,
+    )
 
-# Criação das abas
-tab1, tab2 = st.tabs(["🔍 Validação SLA", "💰 Faturamento"])
 
-# Variável global para armazenar dados processados
-dados_processados = None
+def ler_com_cache(cache, dados, tipo, leitor, motor="auto", hash_arquivo=None):
+    """Devolve o DataFrame lido de ``dados`` (bytes do arquivo) e o hash do conteúdo."""
+    hash_arquivo = hash_arquivo or hash_conteudo(dados)
+    chave = (tipo, hash_arquivo, motor)
+    return cache.obter_ou_calcular(chave, lambda: leitor(BytesIO(dados), motor=motor)), hash_arquivo
 
-with tab1:
-    # Upload dos arquivos
-    st.sidebar.header("📂 Upload dos Arquivos Excel")
-    arquivo_previa = st.sidebar.file_uploader("Arquivo da Prévia (.xlsx)", type=["xlsx"])
-    arquivo_base = st.sidebar.file_uploader("Arquivo Base (.xlsx)", type=["xlsx"])
 
-    if arquivo_previa and arquivo_base:
-        try:
-            # Configurações
-            col_circuito = "Circuito"
-            col_disp_mensal = "Disponibilidade"
-            col_sla_disp = "SLA disponibilidade"
-            col_valor_contratado = "Valor Contratado"
-
-            # Ler Prévia
-            previa = pd.read_excel(arquivo_previa)
-            previa.columns = previa.columns.str.strip()
-
-            # Garantir que as colunas de porcentagem sejam tratadas como decimais
-            for col in [col_disp_mensal, col_sla_disp]:
-                if col in previa.columns:
-                    previa[col] = pd.to_numeric(previa[col], errors='coerce')
-                    if (previa[col] > 1).any():
-                        previa[col] = previa[col] / 100
-
-            # Ler Base (todas as abas e concatenar)
-            abas_base = pd.read_excel(arquivo_base, sheet_name=None)
-            base_all = pd.concat(abas_base.values(), ignore_index=True)
-            base_all.columns = base_all.columns.str.strip()
-
-            # Colunas F e G da base (posições 5 e 6, zero-indexed)
-            base_cols_to_merge = [col_circuito, base_all.columns[5], base_all.columns[6]]
-            if col_valor_contratado in base_all.columns:
-                base_cols_to_merge.append(col_valor_contratado)
-
-            base_subset = base_all[base_cols_to_merge].copy()
-
-            # Verificação SLA
-            def verificar_sla(row):
-                if pd.isna(row.get(col_disp_mensal)) or pd.isna(row.get(col_sla_disp)):
-                    return "Dados faltando"
-                return "Excedido" if row[col_disp_mensal] < row[col_sla_disp] else "Não Excedido"
-
-            previa["SLA_Status"] = previa.apply(verificar_sla, axis=1)
-
-            # Status dos circuitos
-            circuitos_previa = set(previa[col_circuito].dropna().astype(str).str.strip())
-            circuitos_base = set(base_all[col_circuito].dropna().astype(str).str.strip())
-
-            def status_circuito(circ):
-                if pd.isna(circ):
-                    return "Circuito ausente"
-                return "OK" if str(circ).strip() in circuitos_base else "Extra na Prévia"
-
-            previa["Status_Circuito"] = previa[col_circuito].apply(status_circuito)
-
-            faltantes_na_previa = circuitos_base - circuitos_previa
-            extras_na_previa = circuitos_previa - circuitos_base
-
-            # Merge para juntar colunas F, G e Valor Contratado na prévia
-            previa_final = pd.merge(
-                previa,
-                base_subset,
-                on=col_circuito,
-                how="left",
-                suffixes=("", "_Base")
+# Bases em disco (DuckDB) compartilhadas entre reruns e sessões, por hash do
+# arquivo ou id do snapshot; só as duas mais recentes ficam abertas
+@st.cache_resource
+def obter_bases_em_disco():
+    return CacheLRU(limite_bytes=float("inf"), limite_entradas=2)
+
+
+# Resultados de validação compartilhados entre sessões (e, com
+# VALIDACAO_RESULTADOS_DIR, entre os processos do servidor)
+@st.cache_resource
+def obter_cache_resultados():
+    diretorio = os.environ.get("VALIDACAO_RESULTADOS_DIR")
+    return CacheLRU(
+        limite_bytes=int(os.environ.get("VALIDACAO_RESULTADOS_MEMORIA_MB", "1024")) * 1024 ** 2,
+        diretorio=diretorio,
+        limite_disco_bytes=int(os.environ.get("VALIDACAO_RESULTADOS_DISCO_MB", "4096")) * 1024 ** 2,
+        validade_s=float(os.environ.get("VALIDACAO_RESULTADOS_VALIDADE_H", "12")) * 3600,
+    )
+
+
+@st.cache_resource
+def obter_armazem_snapshots():
+    return ArmazemSnapshots(os.environ.get(
+        "VALIDACAO_SNAPSHOTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados", "snapshots")
+    ))
+
+
+# Histórico mensal do SLA por circuito (aba Histórico)
+@st.cache_resource
+def obter_historico():
+    return HistoricoSLA(os.environ.get(
+        "VALIDACAO_HISTORICO_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados", "historico")
+    ))
+
+
+# Validações em andamento no processo, compartilhadas entre reruns e sessões
+@st.cache_resource
+def obter_registro_tarefas():
+    return RegistroTarefas(
+        max_simultaneas=int(os.environ.get("VALIDACAO_TAREFAS_SIMULTANEAS", "2")),
+        max_terminadas=8,
+    )
+
+
+# Base consolidada (arquivo enviado ou snapshot), sempre pelos caches compartilhados.
+# Roda dentro das tarefas em segundo plano, onde não há ``st.*``: os caches
+# (``st.cache_resource``) são obtidos no script e chegam prontos
+def carregar_base(dados_base, hash_base, snapshot_base, em_disco, motor_leitura,
+                  cache_leitura, bases_em_disco, armazem, instrumentacao):
+    with instrumentacao.etapa("leitura_base"):
+        if snapshot_base is not None and em_disco:
+            # Snapshot carregado em lotes para o banco em disco
+            return bases_em_disco.obter_ou_calcular(
+                ("snapshot", snapshot_base.id),
+                lambda: BaseEmDisco.de_parquet(
+                    snapshot_base.caminho, snapshot_base.colunas_fg, instrumentacao=instrumentacao,
+                ),
+            )
+        if snapshot_base is not None:
+            # Base de um snapshot salvo (Parquet mapeado em memória)
+            return cache_leitura.obter_ou_calcular(
+                ("snapshot", snapshot_base.id),
+                lambda: armazem.carregar(snapshot_base.id),
             )
+        if em_disco:
+            # Base lida aba por aba, em blocos, direto para o banco em disco
+            return bases_em_disco.obter_ou_calcular(
+                ("base", hash_base),
+                lambda: BaseEmDisco.de_excel(BytesIO(dados_base), instrumentacao=instrumentacao),
+            )
+        # Todas as abas concatenadas, só as colunas usadas
+        base_all, _ = ler_com_cache(
+            cache_leitura, dados_base, "base",
+            lambda arquivo, motor: ler_base(arquivo, motor=motor, instrumentacao=instrumentacao),
+            motor_leitura, hash_base,
+        )
+        return base_all
 
-            # Calcular Penalidade
-            previa_final["Valor Contratado"] = pd.to_numeric(previa_final["Valor Contratado"], errors='coerce')
-            previa_final["Penalidade"] = 0.0
-
-            # Aplica a fórmula apenas quando o SLA for excedido
-            condicao_sla_excedido = (previa_final["SLA_Status"] == "Excedido") & \
-                                   (previa_final[col_valor_contratado].notna()) & \
-                                   (previa_final[col_disp_mensal].notna())
-
-            previa_final.loc[condicao_sla_excedido, "Penalidade"] = \
-                (previa_final[col_valor_contratado] * previa_final[col_disp_mensal]) - previa_final[col_valor_contratado]
-
-            # Cálculo adicional de desconto (novo)
-            previa_final["Desconto_Alternativo"] = 0.0
-            # Fórmula alternativa: (1 - disponibilidade) * valor_contratado
-            condicao_desconto = (previa_final["SLA_Status"] == "Excedido") & \
-                               (previa_final[col_valor_contratado].notna()) & \
-                               (previa_final[col_disp_mensal].notna())
-            
-            previa_final.loc[condicao_desconto, "Desconto_Alternativo"] = \
-                (1 - previa_final[col_disp_mensal]) * previa_final[col_valor_contratado]
-
-            # Armazenar dados processados para usar na aba de faturamento
-            dados_processados = previa_final.copy()
-
-            # Resumo
-            resumo = {
-                "Total linhas prévia": len(previa_final),
-                "Total linhas base (todas abas)": len(base_all),
-                "SLA Excedido": (previa_final["SLA_Status"] == "Excedido").sum(),
-                "SLA Não Excedido": (previa_final["SLA_Status"] == "Não Excedido").sum(),
-                "SLA Dados faltando/erro": (~previa_final["SLA_Status"].isin(["Excedido", "Não Excedido"])).sum(),
-                "Circuitos extras na prévia": len(extras_na_previa),
-                "Circuitos faltando na prévia": len(faltantes_na_previa),
-                "Total Penalidade Calculada": previa_final["Penalidade"].sum(),
-                "Total Desconto Alternativo": previa_final["Desconto_Alternativo"].sum()
-            }
-
-            # Mostrar resumo com métricas melhoradas
-            st.subheader("📈 Resumo Geral")
-            
-            col1, col2, col3, col4 = st.columns(4)
-            with col1:
-                st.metric(
-                    "Total linhas Prévia", 
-                    resumo["Total linhas prévia"],
-                    help="Número total de registros na prévia"
-                )
-            with col2:
-                st.metric(
-                    "Total linhas Base", 
-                    resumo["Total linhas base (todas abas)"],
-                    help="Número total de registros na base"
-                )
-            with col3:
-                st.metric(
-                    "SLA Excedido", 
-                    resumo["SLA Excedido"],
-                    delta=f"-{resumo['SLA Excedido']} problemas",
-                    delta_color="inverse"
-                )
-            with col4:
-                st.metric(
-                    "SLA Não Excedido", 
-                    resumo["SLA Não Excedido"],
-                    delta=f"+{resumo['SLA Não Excedido']} OK",
-                    delta_color="normal"
-                )
 
-            col5, col6, col7 = st.columns(3)
-            with col5:
-                st.metric("SLA Dados faltando/erro", resumo["SLA Dados faltando/erro"])
-            with col6:
-                st.metric("Circuitos extras na Prévia", resumo["Circuitos extras na prévia"])
-            with col7:
-                st.metric("Circuitos faltando na Prévia", resumo["Circuitos faltando na prévia"])
-
-            # Métricas financeiras
-            col8, col9 = st.columns(2)
-            with col8:
-                st.metric(
-                    "Total Penalidade Calculada", 
-                    f"R$ {resumo['Total Penalidade Calculada']:,.2f}",
-                    help="Cálculo: (Valor Contratado × Disponibilidade) - Valor Contratado"
-                )
-            with col9:
-                st.metric(
-                    "Total Desconto Alternativo", 
-                    f"R$ {resumo['Total Desconto Alternativo']:,.2f}",
-                    help="Cálculo: (1 - Disponibilidade) × Valor Contratado"
-                )
+# Tarefa da validação: lê a Prévia e a Base (dos caches, se já lidas) e valida,
+# só nas linhas alteradas quando há um resultado ``anterior`` com a mesma Base.
+# Devolve (resultado, delta)
+def processar_validacao(dados_previa, hash_previa, carregar, motor_leitura, politica_conflito, anterior,
+                        chave_compartilhada, cache_leitura, cache_resultados, instrumentacao):
+    with instrumentacao.etapa("leitura_previa"):
+        previa, _ = ler_com_cache(cache_leitura, dados_previa, "previa", ler_previa, motor_leitura, hash_previa)
+    if anterior is not None:
+        resultado, delta = validar_incremental(previa, anterior, carregar(instrumentacao), instrumentacao, politica_conflito)
+        cache_resultados.guardar(chave_compartilhada, resultado.compartilhavel())
+        return resultado, delta
+    with instrumentacao.etapa("cache_resultados"):
+        resultado = cache_resultados.obter_ou_calcular(
+            chave_compartilhada,
+            lambda: validar(previa, carregar(instrumentacao), politica_conflito, instrumentacao=instrumentacao),
+            guardar_como=Resultado.compartilhavel,
+        )
+    return resultado, None
 
-            # Gráficos melhorados com Plotly
-            st.subheader("📊 Visualizações")
-            
-            # Gráfico 1: Status dos Circuitos (Pizza)
-            col_graf1, col_graf2 = st.columns(2)
-            
-            with col_graf1:
-                st.markdown("**Status dos Circuitos**")
-                status_counts = previa_final["Status_Circuito"].value_counts()
-                
-                fig_pie = px.pie(
-                    values=status_counts.values,
-                    names=status_counts.index,
-                    color_discrete_sequence=['#2E8B57', '#FF6B6B', '#FFD93D'],
-                    title="Distribuição dos Status dos Circuitos"
-                )
-                fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-                fig_pie.update_layout(height=400)
-                st.plotly_chart(fig_pie, use_container_width=True)
-
-            # Gráfico 2: SLA Status (Barras)
-            with col_graf2:
-                st.markdown("**Status do SLA**")
-                sla_counts = previa_final["SLA_Status"].value_counts()
-                
-                fig_bar = px.bar(
-                    x=sla_counts.index,
-                    y=sla_counts.values,
-                    color=sla_counts.index,
-                    color_discrete_map={
-                        'Não Excedido': '#2E8B57',
-                        'Excedido': '#FF6B6B',
-                        'Dados faltando': '#FFD93D'
-                    },
-                    title="Status do SLA por Quantidade"
-                )
-                fig_bar.update_layout(showlegend=False, height=400)
-                fig_bar.update_traces(texttemplate='%{y}', textposition='outside')
-                st.plotly_chart(fig_bar, use_container_width=True)
-
-            # Gráfico 3: Comparação de Penalidades
-            if resumo["SLA Excedido"] > 0:
-                st.markdown("**Comparação dos Cálculos de Desconto**")
-                
-                penalidades_df = pd.DataFrame({
-                    'Tipo de Cálculo': ['Penalidade Original', 'Desconto Alternativo'],
-                    'Valor': [resumo['Total Penalidade Calculada'], resumo['Total Desconto Alternativo']]
+
+# Tarefa do snapshot: grava a Base consolidada em Parquet
+def processar_snapshot(carregar, armazem, mes, hash_base, nome_arquivo, instrumentacao):
+    base = carregar(instrumentacao)
+    with instrumentacao.etapa("snapshot"):
+        return armazem.salvar(base, mes, hash_base, nome_arquivo)
+
+
+# Tarefa do histórico: grava o mês com as linhas da Prévia validada e refaz os resumos
+def processar_historico(historico, previa_final, mes, origem, assinatura, instrumentacao):
+    with instrumentacao.etapa("historico"):
+        return historico.registrar(previa_final, mes, origem, assinatura)
+
+
+# Seções que rodam de novo sozinhas quando um controle delas muda, sem refazer
+# o resto do painel (st.experimental_fragment antes do Streamlit 1.37)
+fragmento = getattr(st, "fragment", None) or st.experimental_fragment
+
+
+# Tabela paginada: filtro, ordenação e formatação feitos no servidor, só para a página visível
+@fragmento
+def exibir_grade(df, slot, formatos):
+    """``formatos``: lista de (colunas, formato, texto para vazios)."""
+    col_sla, col_circ, col_busca, col_ordem = st.columns(4)
+    status_sla = status_circuito = None
+    if "SLA_Status" in df.columns:
+        status_sla = col_sla.multiselect("Status do SLA", STATUS_SLA, key=f"grade_sla_{slot}")
+    if "Status_Circuito" in df.columns:
+        status_circuito = col_circ.multiselect("Status do circuito", STATUS_CIRCUITO, key=f"grade_circ_{slot}")
+    busca = col_busca.text_input("Circuito contém", key=f"grade_busca_{slot}")
+    ordenar_por = col_ordem.selectbox(
+        "Ordenar por", [None] + list(df.columns), format_func=lambda c: "—" if c is None else c,
+        key=f"grade_ordem_{slot}",
+    )
+
+    posicoes = filtrar(df, status_sla, status_circuito, busca)
+    col_decrescente, col_tamanho, col_pagina, col_info = st.columns(4, vertical_alignment="bottom")
+    decrescente = col_decrescente.toggle("Decrescente", key=f"grade_desc_{slot}")
+    posicoes = ordenar(df, posicoes, ordenar_por, decrescente)
+    tamanho_pagina = col_tamanho.selectbox("Linhas por página", TAMANHOS_PAGINA, index=1, key=f"grade_tamanho_{slot}")
+
+    # Volta para a primeira página quando os filtros mudam
+    chave_pagina = f"grade_pagina_{slot}"
+    assinatura = (tuple(status_sla or ()), tuple(status_circuito or ()), busca, ordenar_por, decrescente, tamanho_pagina)
+    if st.session_state.get(f"grade_filtros_{slot}") != assinatura:
+        st.session_state[f"grade_filtros_{slot}"] = assinatura
+        st.session_state[chave_pagina] = 1
+    paginas = total_paginas(len(posicoes), tamanho_pagina)
+    st.session_state[chave_pagina] = min(st.session_state.get(chave_pagina, 1), paginas)
+    pagina = col_pagina.number_input("Página", min_value=1, max_value=paginas, key=chave_pagina)
+    col_info.caption(f"{len(posicoes):,} linhas · página {pagina} de {paginas}")
+
+    pagina_df = fatiar_pagina(df, posicoes, pagina, tamanho_pagina)
+    estilo = pagina_df.style
+    for colunas, formato, vazio in formatos:
+        presentes = [c for c in colunas if c in pagina_df.columns]
+        if presentes:
+            estilo = estilo.format(formato, subset=presentes, na_rep=vazio)
+    st.dataframe(estilo, use_container_width=True)
+
+
+# Exportação sob demanda: o arquivo só é gerado quando o usuário pede, e fica
+# guardado na sessão enquanto o resultado (chave) não mudar
+@fragmento
+def botao_exportacao(slot, chave, rotulo, nome_arquivo, gerar, instrumentacao=None):
+    col_formato, col_gerar, col_baixar = st.columns([1, 1, 2], vertical_alignment="bottom")
+    with col_formato:
+        formato = st.selectbox(
+            "Formato",
+            list(FORMATOS_EXPORTACAO),
+            key=f"formato_{slot}",
+            help="xlsx é o mais lento para arquivos grandes; csv e parquet são bem mais baratos.",
+        )
+    extensao, mime = FORMATOS_EXPORTACAO[formato]
+    id_arquivo = (chave, formato)
+    guardado = st.session_state.get(f"exportacao_{slot}")
+
+    with col_gerar:
+        if st.button(f"📦 Gerar {formato}", key=f"gerar_{slot}"):
+            with st.spinner("Gerando arquivo..."), medir(instrumentacao, f"exportacao_{slot}"):
+                guardado = (id_arquivo, gerar(formato))
+            st.session_state[f"exportacao_{slot}"] = guardado
+
+    with col_baixar:
+        if guardado is not None and guardado[0] == id_arquivo:
+            st.download_button(
+                label=rotulo,
+                data=guardado[1],
+                file_name=f"{nome_arquivo}.{extensao}",
+                mime=mime,
+                key=f"baixar_{slot}",
+            )
+        else:
+            st.caption("Clique em gerar para preparar o arquivo.")
+
+
+# Progresso de uma tarefa em segundo plano, atualizado a cada segundo sem refazer
+# o painel; quando a tarefa termina, o painel inteiro roda de novo e pega o resultado
+@fragmento(run_every=1)
+def acompanhar_tarefa(tarefa, slot):
+    if tarefa.terminada:
+        st.rerun()
+    etapa = tarefa.etapa or "na fila"
+    st.progress(tarefa.progresso, text=f"{tarefa.descricao} · {etapa} · {tarefa.duracao_s:,.0f} s")
+    if tarefa.cancelamento_pedido:
+        st.caption("Cancelando ao fim da etapa atual...")
+    elif st.button("⏹️ Cancelar", key=f"cancelar_{slot}"):
+        tarefa.cancelar()
+        st.rerun()
+
+
+# Vários pares Prévia/Base de uma vez, cada par num processo separado
+def painel_lote(arquivos, motor, politica_conflito):
+    st.subheader("📚 Validação em lote")
+    if not arquivos:
+        st.info("⏳ Envie os pares (previa_<contrato>.xlsx e base_<contrato>.xlsx) ou um .zip com eles.")
+        return
+
+    conteudo = {}
+    for arquivo in arquivos:
+        dados = arquivo.getvalue()
+        if arquivo.name.lower().endswith(".zip"):
+            conteudo.update(extrair_zip(dados))
+        else:
+            conteudo[arquivo.name] = dados
+    pares, avisos = parear_arquivos(conteudo)
+    for aviso in avisos:
+        st.warning(aviso)
+    if not pares:
+        st.error("❌ Nenhum par Prévia/Base encontrado nos arquivos enviados.")
+        return
+    st.caption(f"{len(pares)} par(es): " + ", ".join(par.nome for par in pares))
+
+    chave = (tuple((par.nome, hash_conteudo(par.previa), hash_conteudo(par.base)) for par in pares), motor, politica_conflito)
+    if st.button("▶️ Processar lote"):
+        barra = st.progress(0.0, text="Processando pares...")
+
+        def progresso(concluidos, total, resultado):
+            barra.progress(concluidos / total, text=f"{concluidos}/{total} · {resultado.nome}")
+
+        resultados = processar_lote(pares, motor=motor, politica_conflito=politica_conflito, progresso=progresso)
+        st.session_state["resultado_lote"] = (chave, resultados)
+
+    guardado = st.session_state.get("resultado_lote")
+    if guardado is None or guardado[0] != chave:
+        st.caption("Clique em processar para validar todos os pares.")
+        return
+
+    resultados = guardado[1]
+    com_erro = [r for r in resultados if not r.ok]
+    col_ok, col_erro = st.columns(2)
+    col_ok.metric("Pares validados", len(resultados) - len(com_erro))
+    col_erro.metric("Pares com erro", len(com_erro))
+
+    resumo = resumo_combinado(resultados)
+    st.dataframe(resumo, use_container_width=True, hide_index=True)
+    st.download_button(
+        label="💾 Baixar resumo do lote (csv)",
+        data=resumo.to_csv(index=False).encode("utf-8-sig"),
+        file_name="resumo_lote.csv",
+        mime="text/csv",
+    )
+    for resultado in com_erro:
+        st.error(f"❌ {resultado.nome}: {resultado.erro}")
+
+
+# O que mudou em relação à Prévia validada anteriormente (modo incremental)
+def exibir_delta(delta):
+    with st.expander("🔄 O que mudou desde a Prévia anterior", expanded=True):
+        if delta.completo:
+            st.caption(f"Prévia validada por inteiro: {delta.motivo}.")
+            return
+        col_alt, col_inc, col_rem, col_pen = st.columns(4)
+        col_alt.metric("Linhas alteradas", delta.alterados)
+        col_inc.metric("Linhas incluídas", delta.incluidos)
+        col_rem.metric("Linhas removidas", delta.removidos)
+        col_pen.metric("Variação da penalidade", f"R$ {delta.variacao_penalidade:,.2f}")
+        if delta.tabela.empty:
+            st.success("✅ Nenhuma linha mudou; resultado anterior reaproveitado.")
+            return
+        st.caption(f"{delta.inalterados:,} linhas sem mudança reaproveitadas; só as demais foram recalculadas.")
+        st.dataframe(
+            delta.tabela.head(1000).style.format(
+                {"Penalidade antes": "R$ {:,.2f}", "Penalidade depois": "R$ {:,.2f}"}, na_rep="—",
+            ),
+            use_container_width=True,
+            hide_index=True,
+        )
+        if len(delta.tabela) > 1000:
+            st.caption(f"Mostrando 1.000 de {len(delta.tabela):,} linhas.")
+
+
+# Medições do rerun atual: tempo de parede, CPU e pico de memória por etapa,
+# e a memória por coluna do resultado na sessão
+def painel_instrumentacao(instrumentacao, resultado=None):
+    with st.sidebar.expander("⏱️ Instrumentação"):
+        if resultado is not None:
+            memoria = resultado.memoria
+            total = memoria.iloc[-1]
+            st.caption(
+                f"Resultado na sessão: {total['Bytes depois'] / 1024 ** 2:,.1f} MB "
+                f"(antes da compactação: {total['Bytes antes'] / 1024 ** 2:,.1f} MB)"
+            )
+            st.dataframe(
+                memoria.style.format({"Bytes antes": "{:,}", "Bytes depois": "{:,}", "Economia": "{:.0%}"}, na_rep="—"),
+                use_container_width=True,
+                hide_index=True,
+            )
+        if not instrumentacao.medicoes:
+            st.caption("Nenhuma etapa medida nesta execução.")
+            return
+        total = instrumentacao.total()
+        col_parede, col_cpu, col_memoria = st.columns(3)
+        col_parede.metric("Parede", f"{total['parede_s']:.2f} s")
+        col_cpu.metric("CPU", f"{total['cpu_s']:.2f} s")
+        col_memoria.metric("Pico", f"{total['pico_memoria_mb']:,.0f} MB")
+
+        tabela = instrumentacao.tabela()
+        tabela["etapa"] = ["↳ " * nivel + etapa for nivel, etapa in zip(tabela["nivel"], tabela["etapa"])]
+        st.dataframe(
+            tabela.drop(columns="nivel").style.format({
+                "parede_s": "{:.3f}", "cpu_s": "{:.3f}", "pico_memoria_mb": "{:,.0f}", "variacao_memoria_mb": "{:+,.0f}",
+            }),
+            use_container_width=True,
+            hide_index=True,
+        )
+        st.download_button(
+            "Baixar medições (JSON)",
+            data=instrumentacao.para_json(),
+            file_name="instrumentacao.json",
+            mime="application/json",
+        )
+        perfil = instrumentacao.perfil()
+        if perfil:
+            extensao, dados = perfil
+            st.download_button(
+                f"Baixar perfil ({instrumentacao.perfilador})",
+                data=dados,
+                file_name=f"perfil.{extensao}",
+                mime="text/html" if extensao == "html" else "application/octet-stream",
+            )
+
+
+# Aba de validação: resumo, gráficos, listas de circuitos, tabela e exportação
+def exibir_validacao(resultado, delta, chave_resultado, politica_conflito, instrumentacao):
+    previa_final = resultado.previa_final
+    resumo = resultado.resumo
+    faltantes_na_previa = resultado.faltantes_na_previa
+    extras_na_previa = resultado.extras_na_previa
+
+    if delta is not None:
+        exibir_delta(delta)
+
+    # Mostrar resumo com métricas melhoradas
+    st.subheader("📈 Resumo Geral")
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric(
+            "Total linhas Prévia", 
+            resumo["Total linhas prévia"],
+            help="Número total de registros na prévia"
+        )
+    with col2:
+        st.metric(
+            "Total linhas Base", 
+            resumo["Total linhas base (todas abas)"],
+            help="Número total de registros na base"
+        )
+    with col3:
+        st.metric(
+            "SLA Excedido", 
+            resumo["SLA Excedido"],
+            delta=f"-{resumo['SLA Excedido']} problemas",
+            delta_color="inverse"
+        )
+    with col4:
+        st.metric(
+            "SLA Não Excedido", 
+            resumo["SLA Não Excedido"],
+            delta=f"+{resumo['SLA Não Excedido']} OK",
+            delta_color="normal"
+        )
+
+    col5, col6, col7 = st.columns(3)
+    with col5:
+        st.metric("SLA Dados faltando/erro", resumo["SLA Dados faltando/erro"])
+    with col6:
+        st.metric("Circuitos extras na Prévia", resumo["Circuitos extras na prévia"])
+    with col7:
+        st.metric("Circuitos faltando na Prévia", resumo["Circuitos faltando na prévia"])
+
+    # Métricas financeiras
+    col8, col9 = st.columns(2)
+    with col8:
+        st.metric(
+            "Total Penalidade Calculada", 
+            f"R$ {resumo['Total Penalidade Calculada']:,.2f}",
+            help="Cálculo: (Valor Contratado × Disponibilidade) - Valor Contratado"
+        )
+    with col9:
+        st.metric(
+            "Total Desconto Alternativo", 
+            f"R$ {resumo['Total Desconto Alternativo']:,.2f}",
+            help="Cálculo: (1 - Disponibilidade) × Valor Contratado"
+        )
+
+    # Gráficos melhorados com Plotly (importado só aqui: não pesa na inicialização)
+    import plotly.express as px
+
+    st.subheader("📊 Visualizações")
+
+    # Gráfico 1: Status dos Circuitos (Pizza)
+    col_graf1, col_graf2 = st.columns(2)
+
+    with col_graf1:
+        st.markdown("**Status dos Circuitos**")
+        with instrumentacao.etapa("graficos_validacao"):
+            # Contagens guardadas no resultado; categorias sem ocorrência ficam fora do gráfico
+            status_counts = resultado.contagens["Status_Circuito"]
+
+            fig_pie = px.pie(
+                values=status_counts.values,
+                names=status_counts.index,
+                color_discrete_sequence=['#2E8B57', '#FF6B6B', '#FFD93D'],
+                title="Distribuição dos Status dos Circuitos"
+            )
+            fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+            fig_pie.update_layout(height=400)
+            st.plotly_chart(fig_pie, use_container_width=True)
+
+    # Gráfico 2: SLA Status (Barras)
+    with col_graf2:
+        st.markdown("**Status do SLA**")
+        with instrumentacao.etapa("graficos_validacao"):
+            sla_counts = resultado.contagens["SLA_Status"]
+
+            fig_bar = px.bar(
+                x=sla_counts.index,
+                y=sla_counts.values,
+                color=sla_counts.index,
+                color_discrete_map={
+                    'Não Excedido': '#2E8B57',
+                    'Excedido': '#FF6B6B',
+                    'Dados faltando': '#FFD93D'
+                },
+                title="Status do SLA por Quantidade"
+            )
+            fig_bar.update_layout(showlegend=False, height=400)
+            fig_bar.update_traces(texttemplate='%{y}', textposition='outside')
+            st.plotly_chart(fig_bar, use_container_width=True)
+
+    # Gráfico 3: Comparação de Penalidades
+    if resumo["SLA Excedido"] > 0:
+        st.markdown("**Comparação dos Cálculos de Desconto**")
+
+        with instrumentacao.etapa("graficos_validacao"):
+            penalidades_df = pd.DataFrame({
+                'Tipo de Cálculo': ['Penalidade Original', 'Desconto Alternativo'],
+                'Valor': [resumo['Total Penalidade Calculada'], resumo['Total Desconto Alternativo']]
+            })
+
+            fig_comp = px.bar(
+                penalidades_df,
+                x='Tipo de Cálculo',
+                y='Valor',
+                color='Tipo de Cálculo',
+                color_discrete_sequence=['#667eea', '#764ba2'],
+                title="Comparação entre Métodos de Cálculo de Desconto"
+            )
+            fig_comp.update_traces(texttemplate='R$ %{y:,.2f}', textposition='outside')
+            fig_comp.update_layout(showlegend=False, height=400)
+            st.plotly_chart(fig_comp, use_container_width=True)
+
+    # Mostrar circuitos extras e faltantes
+    col_extra, col_faltante = st.columns(2)
+
+    with col_extra:
+        st.subheader("⚠️ Circuitos Extras na Prévia")
+        if extras_na_previa:
+            st.write(sorted(list(extras_na_previa)))
+        else:
+            st.success("✅ Nenhum circuito extra.")
+
+    with col_faltante:
+        st.subheader("⚠️ Circuitos Faltando na Prévia")
+        if faltantes_na_previa:
+            st.write(sorted(list(faltantes_na_previa)))
+        else:
+            st.success("✅ Nenhum circuito faltando.")
+
+    # Circuitos repetidos na Base (uma única linha por circuito entra na junção)
+    if len(resultado.duplicados_base):
+        with st.expander(f"🔁 Circuitos repetidos na Base ({len(resultado.duplicados_base)}) — política: {politica_conflito}"):
+            st.dataframe(resultado.duplicados_base, use_container_width=True)
+
+    # Mostrar tabela completa
+    st.subheader("📋 Dados Completos (Prévia + Base)")
+
+    with instrumentacao.etapa("tabela_validacao"):
+        exibir_grade(previa_final, "validacao", [
+            ([COL_DISP_MENSAL, COL_SLA_DISP], "{:.2%}", None),
+            (["Penalidade", "Desconto_Alternativo"], "R$ {:,.2f}", None),
+        ])
+
+    # Botão para download (arquivo gerado só quando pedido)
+    botao_exportacao(
+        "validacao",
+        chave_resultado,
+        "💾 Baixar arquivo com resultado",
+        "validacao_completa_melhorada",
+        lambda formato: exportar_validacao(previa_final, formato),
+        instrumentacao,
+    )
+
+
+# Gráficos do faturamento a partir dos totais e das faixas guardados no resultado;
+# mudar o número de faixas refaz só esta seção
+@fragmento
+def graficos_faturamento(resultado, instrumentacao):
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    totais = resultado.totais_faturamento
+    total_penalidade = totais['Penalidade']
+    total_desconto_alternativo = totais['Desconto Alternativo']
+
+    col_graf1, col_graf2 = st.columns(2)
+
+    with col_graf1:
+        # Gráfico de comparação entre métodos de desconto
+        if total_penalidade != 0 or total_desconto_alternativo != 0:
+            with instrumentacao.etapa("graficos_faturamento"):
+                comparacao_df = pd.DataFrame({
+                    'Método': ['Penalidade Original', 'Desconto Alternativo'],
+                    'Valor': [abs(total_penalidade), abs(total_desconto_alternativo)]
                 })
-                
+
                 fig_comp = px.bar(
-                    penalidades_df,
-                    x='Tipo de Cálculo',
+                    comparacao_df,
+                    x='Método',
                     y='Valor',
-                    color='Tipo de Cálculo',
-                    color_discrete_sequence=['#667eea', '#764ba2'],
-                    title="Comparação entre Métodos de Cálculo de Desconto"
+                    color='Método',
+                    color_discrete_sequence=['#FF6B6B', '#4ECDC4'],
+                    title="Comparação dos Métodos de Desconto"
                 )
-                fig_comp.update_traces(texttemplate='R$ %{y:,.2f}', textposition='outside')
+                fig_comp.update_traces(texttemplate='R$ %{y:,.0f}', textposition='outside')
                 fig_comp.update_layout(showlegend=False, height=400)
                 st.plotly_chart(fig_comp, use_container_width=True)
 
-            # Mostrar circuitos extras e faltantes
-            col_extra, col_faltante = st.columns(2)
-            
-            with col_extra:
-                st.subheader("⚠️ Circuitos Extras na Prévia")
-                if extras_na_previa:
-                    st.write(sorted(list(extras_na_previa)))
-                else:
-                    st.success("✅ Nenhum circuito extra.")
-
-            with col_faltante:
-                st.subheader("⚠️ Circuitos Faltando na Prévia")
-                if faltantes_na_previa:
-                    st.write(sorted(list(faltantes_na_previa)))
-                else:
-                    st.success("✅ Nenhum circuito faltando.")
-
-            # Mostrar tabela completa
-            st.subheader("📋 Dados Completos (Prévia + Base)")
-            
-            # Formatar colunas para exibição
-            df_display = previa_final.copy()
-            for col in [col_disp_mensal, col_sla_disp]:
-                if col in df_display.columns:
-                    df_display[col] = df_display[col].apply(lambda x: f"{x:.2%}" if pd.notna(x) else x)
-            
-            df_display["Penalidade"] = df_display["Penalidade"].apply(lambda x: f"R$ {x:,.2f}" if pd.notna(x) else x)
-            df_display["Desconto_Alternativo"] = df_display["Desconto_Alternativo"].apply(lambda x: f"R$ {x:,.2f}" if pd.notna(x) else x)
-
-            st.dataframe(df_display, use_container_width=True)
-
-            # Botão para download Excel
-            def to_excel(df):
-                output = BytesIO()
-                writer = pd.ExcelWriter(output, engine='openpyxl')
-                df.to_excel(writer, index=False, sheet_name='Validacao_Completa')
-                writer.close()
-                processed_data = output.getvalue()
-                return processed_data
-
-            excel_data = to_excel(previa_final)
-
-            st.download_button(
-                label="💾 Baixar arquivo Excel com resultado",
-                data=excel_data,
-                file_name="validacao_completa_melhorada.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
-        except Exception as e:
-            st.error(f"❌ Ocorreu um erro: {e}")
-            st.exception(e)
+    with col_graf2:
+        # Gráfico de distribuição de valores, desenhado a partir das faixas já contadas
+        if 'Valor Contratado' in resultado.faturamento.columns:
+            faixas = st.select_slider("Faixas do histograma", [10, 20, 50, 100], value=20, key="faixas_faturamento")
+            with instrumentacao.etapa("graficos_faturamento"):
+                faixas_df = resultado.histograma_faturamento('Valor Contratado', faixas)
+                fig_hist = go.Figure(go.Bar(
+                    x=(faixas_df['inicio'] + faixas_df['fim']) / 2,
+                    y=faixas_df['Quantidade'],
+                    width=faixas_df['fim'] - faixas_df['inicio'],
+                    customdata=faixas_df[['inicio', 'fim']],
+                    hovertemplate='R$ %{customdata[0]:,.2f} a R$ %{customdata[1]:,.2f}<br>%{y} circuitos<extra></extra>',
+                    marker_color='#667eea',
+                ))
+                fig_hist.update_layout(
+                    title="Distribuição dos Valores Contratados",
+                    xaxis_title='Valor Contratado',
+                    yaxis_title='Quantidade',
+                    bargap=0,
+                    height=400,
+                )
+                st.plotly_chart(fig_hist, use_container_width=True)
 
-    else:
-        st.info("⏳ Por favor, envie os dois arquivos Excel para começar a validação.")
 
-# Aba de Faturamento
-with tab2:
+# Aba de faturamento, derivada do mesmo resultado (montada uma vez por resultado)
+def exibir_faturamento(resultado, chave_resultado, instrumentacao):
     st.header("💰 Planilha de Faturamento Pronto")
-    
-    # Verificar se há dados processados da aba anterior
-    if dados_processados is not None:
+
+    # Verificar se há dados processados na aba de validação
+    if resultado is not None:
         try:
-            # Criar planilha de faturamento baseada nos dados processados
-            df_faturamento = dados_processados.copy()
-            
-            # Selecionar e renomear colunas para o formato de faturamento
-            colunas_faturamento = {
-                'Circuito': 'Circuito',
-                'Valor Contratado': 'Valor Contratado',
-                'Disponibilidade': 'Disponibilidade',
-                'SLA disponibilidade': 'SLA Disponibilidade',
-                'Penalidade': 'Penalidade',
-                'Desconto_Alternativo': 'Desconto Alternativo'
-            }
-            
-            # Filtrar apenas as colunas necessárias
-            df_faturamento_final = pd.DataFrame()
-            for col_original, col_nova in colunas_faturamento.items():
-                if col_original in df_faturamento.columns:
-                    df_faturamento_final[col_nova] = df_faturamento[col_original]
-            
-            # Calcular Valor Final (Valor Contratado + Penalidade)
-            if 'Valor Contratado' in df_faturamento_final.columns and 'Penalidade' in df_faturamento_final.columns:
-                df_faturamento_final['Valor Final'] = df_faturamento_final['Valor Contratado'] + df_faturamento_final['Penalidade']
-            
+            # Planilha de faturamento guardada no próprio resultado
+            with instrumentacao.etapa("faturamento"):
+                df_faturamento_final = resultado.faturamento
+                totais = resultado.totais_faturamento
+
             # Adicionar cabeçalho da planilha (como no exemplo)
-            import datetime
-            mes_atual = datetime.datetime.now().strftime("%B de %Y")
-            
-            st.markdown(f"### 📋 Planilha de faturamento referente aos serviços prestados em {mes_atual}")
-            
+            mes = mes_referencia()
+
+            st.markdown(f"### 📋 Planilha de faturamento referente aos serviços prestados em {mes}")
+
             # Métricas de resumo
             col1, col2, col3, col4 = st.columns(4)
-            
-            total_valor_contratado = df_faturamento_final['Valor Contratado'].sum() if 'Valor Contratado' in df_faturamento_final.columns else 0
-            total_penalidade = df_faturamento_final['Penalidade'].sum() if 'Penalidade' in df_faturamento_final.columns else 0
-            total_desconto_alternativo = df_faturamento_final['Desconto Alternativo'].sum() if 'Desconto Alternativo' in df_faturamento_final.columns else 0
-            total_valor_final = df_faturamento_final['Valor Final'].sum() if 'Valor Final' in df_faturamento_final.columns else 0
-            
+
+            total_valor_contratado = totais['Valor Contratado']
+            total_penalidade = totais['Penalidade']
+            total_desconto_alternativo = totais['Desconto Alternativo']
+            total_valor_final = totais['Valor Final']
+
             with col1:
                 st.metric("💰 Total Valor Contratado", f"R$ {total_valor_contratado:,.2f}")
             with col2:
@@ -394,121 +696,37 @@ with tab2:
                 st.metric("🔄 Total Desconto Alternativo", f"R$ {total_desconto_alternativo:,.2f}")
             with col4:
                 st.metric("✅ Total Valor Final", f"R$ {total_valor_final:,.2f}")
-            
+
             # Gráficos de faturamento
             st.subheader("📊 Visualizações do Faturamento")
-            
-            col_graf1, col_graf2 = st.columns(2)
-            
-            with col_graf1:
-                # Gráfico de comparação entre métodos de desconto
-                if total_penalidade != 0 or total_desconto_alternativo != 0:
-                    comparacao_df = pd.DataFrame({
-                        'Método': ['Penalidade Original', 'Desconto Alternativo'],
-                        'Valor': [abs(total_penalidade), abs(total_desconto_alternativo)]
-                    })
-                    
-                    fig_comp = px.bar(
-                        comparacao_df,
-                        x='Método',
-                        y='Valor',
-                        color='Método',
-                        color_discrete_sequence=['#FF6B6B', '#4ECDC4'],
-                        title="Comparação dos Métodos de Desconto"
-                    )
-                    fig_comp.update_traces(texttemplate='R$ %{y:,.0f}', textposition='outside')
-                    fig_comp.update_layout(showlegend=False, height=400)
-                    st.plotly_chart(fig_comp, use_container_width=True)
-            
-            with col_graf2:
-                # Gráfico de distribuição de valores
-                if 'Valor Contratado' in df_faturamento_final.columns:
-                    fig_hist = px.histogram(
-                        df_faturamento_final,
-                        x='Valor Contratado',
-                        nbins=20,
-                        title="Distribuição dos Valores Contratados",
-                        color_discrete_sequence=['#667eea']
-                    )
-                    fig_hist.update_layout(height=400)
-                    st.plotly_chart(fig_hist, use_container_width=True)
-            
+            graficos_faturamento(resultado, instrumentacao)
+
             # Tabela de faturamento formatada
             st.subheader("📋 Planilha de Faturamento Detalhada")
-            
-            # Formatar dados para exibição
-            df_display_faturamento = df_faturamento_final.copy()
-            
-            # Formatar colunas monetárias
-            for col in ['Valor Contratado', 'Penalidade', 'Desconto Alternativo', 'Valor Final']:
-                if col in df_display_faturamento.columns:
-                    df_display_faturamento[col] = df_display_faturamento[col].apply(
-                        lambda x: f"R$ {x:,.2f}" if pd.notna(x) else "R$ 0,00"
-                    )
-            
-            # Formatar colunas de porcentagem
-            for col in ['Disponibilidade', 'SLA Disponibilidade']:
-                if col in df_display_faturamento.columns:
-                    df_display_faturamento[col] = df_display_faturamento[col].apply(
-                        lambda x: f"{x:.2%}" if pd.notna(x) else "0,00%"
-                    )
-            
-            st.dataframe(df_display_faturamento, use_container_width=True)
-            
-            # Botão para download da planilha de faturamento
-            def criar_planilha_faturamento(df):
-                output = BytesIO()
-                writer = pd.ExcelWriter(output, engine='openpyxl')
-                
-                # Criar a planilha com formatação similar ao exemplo
-                df_export = df_faturamento_final.copy()
-                
-                # Adicionar linhas de cabeçalho
-                header_rows = pd.DataFrame({
-                    'Circuito': ['', '', f'Planilha de faturamento referente aos serviços prestados em {mes_atual}', ''],
-                    'Valor Contratado': ['', '', '', ''],
-                    'Disponibilidade': ['', '', '', ''],
-                    'SLA Disponibilidade': ['', '', '', ''],
-                    'Penalidade': ['', '', '', ''],
-                    'Desconto Alternativo': ['', '', '', ''],
-                    'Valor Final': ['', '', '', '']
-                })
-                
-                # Adicionar linhas de totais no final
-                total_row = pd.DataFrame({
-                    'Circuito': ['TOTAL'],
-                    'Valor Contratado': [total_valor_contratado],
-                    'Disponibilidade': [''],
-                    'SLA Disponibilidade': [''],
-                    'Penalidade': [total_penalidade],
-                    'Desconto Alternativo': [total_desconto_alternativo],
-                    'Valor Final': [total_valor_final]
-                })
-                
-                # Combinar tudo
-                df_final_export = pd.concat([header_rows, df_export, total_row], ignore_index=True)
-                
-                df_final_export.to_excel(writer, index=False, sheet_name='Faturamento_Pronto')
-                writer.close()
-                processed_data = output.getvalue()
-                return processed_data
-            
-            excel_faturamento_data = criar_planilha_faturamento(df_faturamento_final)
-            
-            st.download_button(
-                label="💾 Baixar Planilha de Faturamento Pronto",
-                data=excel_faturamento_data,
-                file_name=f"faturamento_pronto_{datetime.datetime.now().strftime('%Y%m%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+            with instrumentacao.etapa("tabela_faturamento"):
+                exibir_grade(df_faturamento_final, "faturamento", [
+                    (['Valor Contratado', 'Penalidade', 'Desconto Alternativo', 'Valor Final'], "R$ {:,.2f}", "R$ 0,00"),
+                    (['Disponibilidade', 'SLA Disponibilidade'], "{:.2%}", "0,00%"),
+                ])
+
+            # Botão para download da planilha de faturamento (gerada só quando pedida)
+            botao_exportacao(
+                "faturamento",
+                chave_resultado,
+                "💾 Baixar Planilha de Faturamento Pronto",
+                f"faturamento_pronto_{datetime.datetime.now().strftime('%Y%m%d')}",
+                lambda formato: exportar_faturamento(df_faturamento_final, mes, formato, totais),
+                instrumentacao,
             )
-            
+
         except Exception as e:
             st.error(f"❌ Erro ao processar planilha de faturamento: {e}")
             st.exception(e)
-    
+
     else:
         st.info("⏳ Por favor, processe os dados na aba 'Validação SLA' primeiro para gerar a planilha de faturamento.")
-        
+
         # Mostrar exemplo de como será a estrutura da planilha
         st.subheader("📝 Estrutura da Planilha de Faturamento")
         exemplo_df = pd.DataFrame({
@@ -521,4 +739,426 @@ with tab2:
             'Valor Final': ['R$ 9.825,00', 'R$ 14.625,00', 'R$ 8.000,00']
         })
         st.dataframe(exemplo_df)
-        st.info("💡 Esta será a estrutura da planilha de faturamento gerada com base nos dados processados.")
\ No newline at end of file
+        st.info("💡 Esta será a estrutura da planilha de faturamento gerada com base nos dados processados.")
+
+
+# Tendências do histórico, mês a mês, a partir do resumo mensal
+def graficos_historico(mensal, instrumentacao):
+    import plotly.express as px
+
+    with instrumentacao.etapa("graficos_historico"):
+        col_graf1, col_graf2 = st.columns(2)
+        with col_graf1:
+            fig_penalidade = px.bar(
+                mensal.assign(Penalidades=mensal["Penalidade total"].abs()),
+                x=COL_MES, y="Penalidades", title="Penalidades por Mês", color_discrete_sequence=["#FF6B6B"],
+            )
+            fig_penalidade.update_traces(texttemplate="R$ %{y:,.0f}", textposition="outside")
+            fig_penalidade.update_layout(height=400, xaxis_type="category")
+            st.plotly_chart(fig_penalidade, use_container_width=True)
+        with col_graf2:
+            fig_sla = px.line(
+                mensal, x=COL_MES, y=["% SLA Excedido", "Disponibilidade média"], markers=True,
+                title="SLA Excedido e Disponibilidade Média",
+            )
+            fig_sla.update_layout(height=400, xaxis_type="category", yaxis_tickformat=".1%", legend_title_text="")
+            st.plotly_chart(fig_sla, use_container_width=True)
+
+
+# Série de um ou mais circuitos em todos os meses (lida do resumo das séries);
+# trocar os circuitos refaz só esta seção
+@fragmento
+def serie_historico(historico, sugestao, instrumentacao):
+    import plotly.express as px
+
+    circuitos = st.text_input(
+        "Circuitos (separados por vírgula)", sugestao or "", key="historico_circuitos",
+        help="Mostra a disponibilidade, o SLA e a penalidade de cada circuito em todos os meses registrados.",
+    )
+    circuitos = [c.strip() for c in circuitos.split(",") if c.strip()]
+    if not circuitos:
+        return
+    with instrumentacao.etapa("historico_serie"):
+        serie = historico.serie(circuitos)
+    if not len(serie):
+        st.caption("Nenhum registro desses circuitos no histórico.")
+        return
+    fig_serie = px.line(
+        serie, x=COL_MES, y=COL_DISP_MENSAL, color=COL_CIRCUITO, markers=True, title="Disponibilidade por Mês",
+        hover_data={COL_SLA_DISP: ":.2%", "SLA_Status": True, "Penalidade": ":,.2f"},
+    )
+    if len(circuitos) == 1:
+        fig_serie.add_scatter(
+            x=serie[COL_MES], y=serie[COL_SLA_DISP], mode="lines", name="SLA", line={"dash": "dash", "color": "#FF6B6B"},
+        )
+    fig_serie.update_layout(height=400, xaxis_type="category", yaxis_tickformat=".2%")
+    st.plotly_chart(fig_serie, use_container_width=True)
+    st.dataframe(
+        serie.style.format("{:.2%}", subset=[COL_DISP_MENSAL, COL_SLA_DISP], na_rep="")
+        .format("R$ {:,.2f}", subset=["Penalidade"], na_rep=""),
+        use_container_width=True, hide_index=True,
+    )
+
+
+# Aba de histórico: tendências, reincidentes e séries por circuito, tudo a partir
+# dos resumos pré-calculados (nenhum mês registrado é relido)
+def exibir_historico(historico, instrumentacao):
+    st.subheader("📈 Histórico de SLA")
+    with instrumentacao.etapa("historico_resumos"):
+        mensal = historico.resumo_mensal()
+    if not len(mensal):
+        st.info(
+            "⏳ Nenhum mês no histórico ainda. Valide uma Prévia com \"Registrar no histórico\" marcado "
+            "para começar a acompanhar os circuitos mês a mês."
+        )
+        return
+
+    ultimo = mensal.iloc[-1]
+    anterior = mensal.iloc[-2] if len(mensal) > 1 else None
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Meses registrados", len(mensal), help=f"De {mensal[COL_MES].iloc[0]} a {ultimo[COL_MES]}")
+    col2.metric(
+        f"Circuitos em {ultimo[COL_MES]}", f"{ultimo['Circuitos']:,}",
+        delta=None if anterior is None else f"{ultimo['Circuitos'] - anterior['Circuitos']:+,}",
+    )
+    col3.metric(
+        f"SLA excedido em {ultimo[COL_MES]}", f"{ultimo['% SLA Excedido']:.2%}",
+        delta=None if anterior is None else f"{(ultimo['% SLA Excedido'] - anterior['% SLA Excedido']) * 100:+.2f} p.p.",
+        delta_color="inverse",
+    )
+    col4.metric("Penalidades no período", f"R$ {abs(mensal['Penalidade total'].sum()):,.2f}")
+
+    graficos_historico(mensal, instrumentacao)
+    with st.expander("📅 Resumo por mês"):
+        st.dataframe(
+            mensal.style.format("{:.2%}", subset=["Disponibilidade média", "% SLA Excedido"], na_rep="")
+            .format("R$ {:,.2f}", subset=["Penalidade total", "Desconto Alternativo total", "Valor Contratado total"]),
+            use_container_width=True, hide_index=True,
+        )
+
+    # Reincidentes: o resumo por circuito já vem ordenado, então é só o começo da tabela
+    st.subheader("🔁 Reincidentes")
+    minimo_meses = st.slider(
+        "Mínimo de meses com SLA excedido", 1, max(2, len(mensal)), min(2, len(mensal)), key="historico_minimo",
+    )
+    with instrumentacao.etapa("historico_reincidentes"):
+        reincidentes = historico.reincidentes(minimo_meses)
+    if len(reincidentes):
+        st.caption(
+            f"{len(reincidentes):,} circuitos com SLA excedido em {minimo_meses} meses ou mais · "
+            f"penalidade acumulada R$ {abs(reincidentes['Penalidade total'].sum()):,.2f}"
+        )
+        exibir_grade(reincidentes, "historico", [
+            (["Disponibilidade média", "Disponibilidade mínima"], "{:.2%}", None),
+            (["Penalidade total"], "R$ {:,.2f}", None),
+        ])
+    else:
+        st.success(f"✅ Nenhum circuito com SLA excedido em {minimo_meses} meses ou mais.")
+
+    st.subheader("📉 Tendência por circuito")
+    serie_historico(historico, reincidentes[COL_CIRCUITO].iloc[0] if len(reincidentes) else None, instrumentacao)
+
+
+# Abas com estado: só a aba selecionada executa. Versões do Streamlit sem
+# ``on_change`` nas abas executam as duas, como antes
+def criar_abas(rotulos, chave):
+    if "on_change" in inspect.signature(st.tabs).parameters:
+        return st.tabs(rotulos, key=chave, on_change="rerun")
+    return st.tabs(rotulos)
+
+
+def aba_aberta(aba):
+    return getattr(aba, "open", None) is not False
+
+
+# Título principal
+st.markdown("<div class=\"main-header\"><h1>📊 Painel de Validação Prévia x Base com SLA</h1></div>", unsafe_allow_html=True)
+
+# Criação das abas
+tab1, tab2, tab3 = criar_abas(["🔍 Validação SLA", "💰 Faturamento", "📈 Histórico"], "aba")
+
+# Upload dos arquivos e opções na barra lateral (valem para todas as abas)
+st.sidebar.header("📂 Upload dos Arquivos Excel")
+modo_lote = st.sidebar.radio("Modo", ["Individual", "Lote"], horizontal=True) == "Lote"
+arquivo_previa = None
+arquivo_base = None
+snapshot_base = None
+salvar_snapshot = False
+registrar_historico = False
+if modo_lote:
+    arquivos_lote = st.sidebar.file_uploader(
+        "Pares Prévia/Base (.xlsx ou .zip)",
+        type=["xlsx", "zip"],
+        accept_multiple_files=True,
+        help="Os pares são casados pelo nome: previa_<contrato>.xlsx com base_<contrato>.xlsx.",
+    )
+else:
+    arquivo_previa = st.sidebar.file_uploader("Arquivo da Prévia (.xlsx)", type=["xlsx"])
+    fonte_base = st.sidebar.radio("Fonte da Base", ["Enviar arquivo", "Snapshot salvo"], horizontal=True)
+    if fonte_base == "Enviar arquivo":
+        arquivo_base = st.sidebar.file_uploader("Arquivo Base (.xlsx)", type=["xlsx"])
+        salvar_snapshot = st.sidebar.checkbox(
+            "Salvar snapshot desta Base",
+            help="Grava a Base consolidada em Parquet para os próximos meses, sem novo upload.",
+        )
+        mes_snapshot = st.sidebar.text_input("Mês de referência (AAAA-MM)", mes_atual(), disabled=not salvar_snapshot)
+    else:
+        snapshots = obter_armazem_snapshots().listar()
+        if snapshots:
+            snapshot_base = st.sidebar.selectbox("Snapshot da Base", snapshots, format_func=lambda s: s.rotulo)
+        else:
+            st.sidebar.caption("Nenhum snapshot salvo ainda. Envie uma Base marcando \"Salvar snapshot\".")
+    registrar_historico = st.sidebar.checkbox(
+        "Registrar no histórico",
+        help="Grava disponibilidade, SLA e penalidade de cada circuito no mês informado (aba Histórico). "
+             "Cada arquivo da Prévia é um registro do mês: outros contratos no mesmo mês se somam, e validar "
+             "de novo um arquivo com o mesmo nome substitui só o registro dele.",
+    )
+    # Sem mês padrão: o mês é sempre confirmado por quem registra
+    mes_historico = st.sidebar.text_input(
+        "Mês da Prévia (AAAA-MM)", placeholder=mes_atual(), disabled=not registrar_historico
+    ).strip()
+    if registrar_historico:
+        if not mes_historico:
+            st.sidebar.caption("Informe o mês da Prévia para registrar no histórico.")
+            registrar_historico = False
+        else:
+            try:
+                validar_mes(mes_historico)
+            except ValueError as e:
+                st.sidebar.warning(f"Não registrado no histórico: {e}")
+                registrar_historico = False
+
+with st.sidebar.expander("⚙️ Opções de processamento"):
+    motor_leitura = st.selectbox(
+        "Motor de leitura do Excel",
+        MOTORES_LEITURA,
+        help="auto: calamine se instalado, senão openpyxl em streaming. "
+             "padrao: pd.read_excel de todas as colunas (mais lento).",
+    )
+    politica_conflito = st.selectbox(
+        "Circuito repetido na Base",
+        POLITICAS_CONFLITO,
+        help="Qual linha da Base vale quando o mesmo circuito aparece mais de uma vez: "
+             "a primeira, a última, a de maior Valor Contratado, ou recusar a Base (erro).",
+    )
+    incremental = st.checkbox(
+        "Validação incremental",
+        value=True,
+        help="Com a mesma Base, uma nova versão da Prévia só recalcula as linhas alteradas ou incluídas "
+             "em relação à Prévia validada anteriormente.",
+    )
+    em_disco = st.checkbox(
+        "Base em disco (DuckDB)",
+        disabled=not duckdb_disponivel(),
+        help="Para Bases que não cabem na memória: as abas são lidas em blocos para um banco em disco "
+             "e a junção é feita lá. Requer o pacote duckdb.",
+    )
+    perfilador = st.selectbox(
+        "Perfil detalhado",
+        [None, "cprofile"] + (["pyinstrument"] if importlib.util.find_spec("pyinstrument") else []),
+        format_func=lambda p: "Desligado" if p is None else p,
+        help="Grava um perfil completo da execução, para download no painel de instrumentação. "
+             "Deixa o processamento mais lento; use só para investigar.",
+    )
+
+# Tempo e memória de cada etapa deste rerun (painel no fim da barra lateral)
+instrumentacao = Instrumentacao(perfilador)
+
+# Leitura e validação ficam fora das abas: o resultado é o mesmo objeto para
+# as duas e, com as mesmas entradas, vem da sessão sem recalcular nada.
+# O processamento roda em segundo plano (``validacao.tarefas``): um clique no
+# meio de uma leitura longa só faz o rerun encontrar a tarefa em andamento
+resultado = delta = chave_resultado = erro = tarefa = None
+if not modo_lote and arquivo_previa and (arquivo_base or snapshot_base):
+    try:
+        registro = obter_registro_tarefas()
+        cache_leitura = obter_cache_leitura()
+        cache_resultados = obter_cache_resultados()
+        armazem = obter_armazem_snapshots()
+
+        dados_previa = arquivo_previa.getvalue()
+        hash_previa = hash_conteudo(dados_previa)
+        dados_base = arquivo_base.getvalue() if snapshot_base is None else None
+        hash_base = snapshot_base.hash if snapshot_base is not None else hash_conteudo(dados_base)
+        carregar = functools.partial(
+            carregar_base, dados_base, hash_base, snapshot_base, em_disco, motor_leitura,
+            cache_leitura, obter_bases_em_disco(), armazem,
+        )
+
+        if salvar_snapshot and snapshot_base is None:
+            if em_disco:
+                st.sidebar.warning("O snapshot não é salvo com a Base em disco.")
+            elif armazem.existe(mes_snapshot, hash_base):
+                snapshot = armazem.obter(ArmazemSnapshots.gerar_id(mes_snapshot, hash_base))
+                st.sidebar.success(f"📦 Snapshot salvo: {snapshot.rotulo}")
+            else:
+                # A leitura da Base é a mesma da validação (cache de leitura): é feita uma vez só
+                chave_snapshot = ("snapshot", mes_snapshot, hash_base)
+                tarefa_snapshot = registro.submeter(
+                    chave_snapshot,
+                    functools.partial(processar_snapshot, carregar, armazem, mes_snapshot, hash_base, arquivo_base.name),
+                    etapas=("leitura_base", "snapshot"),
+                    descricao="Snapshot da Base",
+                )
+                if tarefa_snapshot.estado == "erro":
+                    st.sidebar.error(f"❌ Snapshot não salvo: {tarefa_snapshot.erro}")
+                    registro.descartar(chave_snapshot)
+                elif tarefa_snapshot.terminada:
+                    registro.descartar(chave_snapshot)
+                else:
+                    with st.sidebar:
+                        acompanhar_tarefa(tarefa_snapshot, "snapshot")
+
+        # Validação SLA, status dos circuitos, merge com a base e penalidades. O último
+        # resultado fica na sessão: mesma Prévia reaproveita, nova versão da Prévia com
+        # a mesma Base é revalidada só nas linhas que mudaram. Os resultados também vão
+        # para o cache compartilhado: quem abrir as mesmas Prévia e Base (em qualquer
+        # sessão) recebe o resultado pronto, sem esperar tarefa nenhuma
+        chave_base = (hash_base, motor_leitura, politica_conflito, em_disco)
+        chave_compartilhada = chave_cache_resultado(
+            hash_previa, hash_base, VERSAO_MOTOR, motor_leitura, politica_conflito, em_disco, snapshot_base is not None,
+        )
+        anterior = st.session_state.get("validacao_anterior")
+        if anterior is not None and anterior[0] == chave_base and anterior[1] == hash_previa:
+            resultado, delta = anterior[2], anterior[3]
+        else:
+            if not (incremental and anterior is not None and anterior[0] == chave_base):
+                anterior = None
+            # Tarefas incrementais dependem também da Prévia anterior
+            chave_tarefa = chave_compartilhada + (anterior[1] if anterior is not None else None,)
+            tarefa = registro.obter(chave_tarefa)
+            if tarefa is None:
+                resultado = cache_resultados.obter(chave_compartilhada)
+            if resultado is None and tarefa is None:
+                tarefa = registro.submeter(
+                    chave_tarefa,
+                    functools.partial(
+                        processar_validacao, dados_previa, hash_previa, carregar, motor_leitura, politica_conflito,
+                        anterior[2] if anterior is not None else None,
+                        chave_compartilhada, cache_leitura, cache_resultados,
+                    ),
+                    etapas=(
+                        ("leitura_previa", "leitura_base") + ETAPAS_INCREMENTAIS if anterior is not None
+                        else ("leitura_previa", "cache_resultados", "leitura_base") + ETAPAS_VALIDACAO
+                    ),
+                    descricao="Validação",
+                    perfilador=perfilador,
+                )
+            if tarefa is not None and tarefa.estado == "concluida":
+                resultado, delta = tarefa.resultado
+                instrumentacao.incorporar(tarefa.instrumentacao)
+                registro.descartar(chave_tarefa)
+                tarefa = None
+            elif tarefa is not None and tarefa.estado == "erro":
+                erro = tarefa.erro
+        if resultado is not None:
+            st.session_state["validacao_anterior"] = (chave_base, hash_previa, resultado, delta)
+            chave_resultado = (hash_previa, hash_base, motor_leitura, politica_conflito, em_disco)
+
+        # Histórico: cada arquivo da Prévia é um registro do mês (a origem), gravado
+        # uma vez por resultado (a assinatura identifica a Prévia, a Base e as opções)
+        if registrar_historico and resultado is not None:
+            historico = obter_historico()
+            origem = arquivo_previa.name
+            assinatura = ":".join(str(parte) for parte in chave_resultado)
+            registro_mes = historico.registro(mes_historico, origem)
+            if registro_mes is not None and registro_mes["assinatura"] == assinatura:
+                st.sidebar.caption(
+                    f"📈 {origem} registrado no histórico de {mes_historico} "
+                    f"({len(historico.registros(mes_historico))} registro(s) no mês)."
+                )
+            else:
+                chave_historico = ("historico", mes_historico, origem, assinatura)
+                tarefa_historico = registro.submeter(
+                    chave_historico,
+                    functools.partial(
+                        processar_historico, historico, resultado.previa_final, mes_historico, origem, assinatura,
+                    ),
+                    etapas=("historico",),
+                    descricao="Histórico",
+                )
+                if tarefa_historico.estado == "erro":
+                    st.sidebar.error(f"❌ Histórico não registrado: {tarefa_historico.erro}")
+                    registro.descartar(chave_historico)
+                elif tarefa_historico.terminada:
+                    registro.descartar(chave_historico)
+                else:
+                    with st.sidebar:
+                        acompanhar_tarefa(tarefa_historico, "historico")
+
+    except Exception as e:
+        erro = e
+
+with tab1:
+    if aba_aberta(tab1):
+        if modo_lote:
+            painel_lote(arquivos_lote, motor_leitura, politica_conflito)
+        elif isinstance(erro, ConflitoCircuitos):
+            st.error(f"❌ {erro}. Escolha outra política para circuitos repetidos ou corrija a Base.")
+            st.dataframe(erro.duplicados, use_container_width=True)
+        elif erro is not None:
+            st.error(f"❌ Ocorreu um erro: {erro}")
+            st.exception(erro)
+            if tarefa is not None and st.button("🔁 Tentar novamente"):
+                registro.descartar(tarefa.chave)
+                st.rerun()
+        elif resultado is not None:
+            exibir_validacao(resultado, delta, chave_resultado, politica_conflito, instrumentacao)
+        elif tarefa is not None and tarefa.estado == "cancelada":
+            st.warning("⏹️ Validação cancelada.")
+            if st.button("▶️ Processar novamente"):
+                registro.descartar(tarefa.chave)
+                st.rerun()
+        elif tarefa is not None:
+            st.info("⏳ Processando em segundo plano. Pode continuar usando o painel; o resultado aparece aqui ao terminar.")
+            acompanhar_tarefa(tarefa, "validacao")
+        else:
+            st.info("⏳ Por favor, envie os dois arquivos Excel (ou escolha um snapshot da Base) para começar a validação.")
+
+# Contadores do cache de leitura (depois do processamento, para refletir este rerun)
+with st.sidebar.expander("🗄️ Cache de leitura"):
+    estatisticas_cache = obter_cache_leitura().estatisticas()
+    col_acertos, col_falhas = st.columns(2)
+    col_acertos.metric("Acertos", estatisticas_cache["Acertos (memória)"] + estatisticas_cache["Acertos (disco)"])
+    col_falhas.metric("Falhas", estatisticas_cache["Falhas"])
+    st.caption(
+        f"Entradas: {estatisticas_cache['Entradas']} · "
+        f"{estatisticas_cache['Memória usada (MB)']:,.1f} / {estatisticas_cache['Limite de memória (MB)']:,.0f} MB · "
+        f"Despejos: {estatisticas_cache['Despejos']}"
+    )
+    if st.button("Limpar cache"):
+        obter_cache_leitura().limpar()
+
+# Resultados de validação compartilhados entre as sessões
+with st.sidebar.expander("🗃️ Cache de resultados"):
+    estatisticas_resultados = obter_cache_resultados().estatisticas()
+    col_acertos, col_falhas = st.columns(2)
+    col_acertos.metric(
+        "Acertos", estatisticas_resultados["Acertos (memória)"] + estatisticas_resultados["Acertos (disco)"]
+    )
+    col_falhas.metric("Falhas", estatisticas_resultados["Falhas"])
+    st.caption(
+        f"Entradas: {estatisticas_resultados['Entradas']} · "
+        f"{estatisticas_resultados['Memória usada (MB)']:,.1f} / "
+        f"{estatisticas_resultados['Limite de memória (MB)']:,.0f} MB · "
+        f"Despejos: {estatisticas_resultados['Despejos']} · Expirados: {estatisticas_resultados['Expiradas']}"
+    )
+    if st.button("Limpar resultados"):
+        obter_cache_resultados().limpar()
+
+# Aba de Faturamento
+with tab2:
+    if aba_aberta(tab2):
+        if resultado is None and tarefa is not None and not tarefa.terminada:
+            st.info("⏳ A validação está em andamento; a planilha de faturamento aparece aqui ao terminar.")
+            acompanhar_tarefa(tarefa, "faturamento")
+        else:
+            exibir_faturamento(resultado, chave_resultado, instrumentacao)
+
+# Aba de Histórico (independe dos arquivos enviados)
+with tab3:
+    if aba_aberta(tab3):
+        exibir_historico(obter_historico(), instrumentacao)
+
+painel_instrumentacao(instrumentacao, resultado)
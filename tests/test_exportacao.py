@@ -0,0 +1,39 @@
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from validacao.exportacao import exportar
+
+
+def _ler_parquet(conteudo):
+    return pd.read_parquet(BytesIO(conteudo))
+
+
+def test_parquet_com_coluna_f_mista_vira_texto():
+    df = pd.DataFrame({
+        "Circuito": ["A1", "A2", "A3"],
+        "F": pd.Series([1, "sem acesso", None], dtype=object),
+        "Valor": [10.5, 20.0, 30.25],
+    })
+
+    lido = _ler_parquet(exportar(df, "parquet"))
+
+    assert lido["F"].iloc[:2].tolist() == ["1", "sem acesso"]
+    assert pd.isna(lido["F"].iloc[2])
+    assert lido["Circuito"].tolist() == ["A1", "A2", "A3"]
+    assert lido["Valor"].tolist() == [10.5, 20.0, 30.25]
+
+
+def test_parquet_sem_colunas_mistas_mantem_tipos():
+    df = pd.DataFrame({"Circuito": ["A1", "A2"], "F": [1, 2]})
+
+    lido = _ler_parquet(exportar(df, "parquet"))
+
+    assert lido["F"].tolist() == [1, 2]
+    assert pd.api.types.is_integer_dtype(lido["F"])
+
+
+def test_formato_desconhecido():
+    with pytest.raises(ValueError, match="Formato de exportação desconhecido"):
+        exportar(pd.DataFrame({"F": [1]}), "ods")
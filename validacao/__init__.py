@@ -0,0 +1,17 @@
+"""Núcleo de validação Prévia x Base usado pelo painel Streamlit."""
+
+from validacao.cache import CacheLRU, hash_conteudo
+from validacao.indice import ConflitoCircuitos, IndiceCircuitos
+from validacao.leitura import ler_base, ler_previa
+from validacao.motor import Resultado, validar
+
+__all__ = [
+    "CacheLRU",
+    "ConflitoCircuitos",
+    "IndiceCircuitos",
+    "hash_conteudo",
+    "ler_base",
+    "ler_previa",
+    "Resultado",
+    "validar",
+]
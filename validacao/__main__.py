@@ -0,0 +1,197 @@
+"""Validação Prévia x Base pela linha de comando, sem o Streamlit.
+
+Uso::
+
+    python -m validacao previa.xlsx base.xlsx --saida resultados/
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+import pandas as pd
+
+from validacao.cache import hash_conteudo
+from validacao.em_disco import LIMITE_MEMORIA, BaseEmDisco
+from validacao.exportacao import FORMATOS_EXPORTACAO, exportar_faturamento, exportar_validacao
+from validacao.faturamento import mes_referencia
+from validacao.historico import HistoricoSLA
+from validacao.indice import POLITICAS_CONFLITO, ConflitoCircuitos
+from validacao.instrumentacao import PERFILADORES, Instrumentacao
+from validacao.leitura import MOTORES_LEITURA, ler_base, ler_previa
+from validacao.motor import validar
+from validacao.snapshots import ArmazemSnapshots, validar_mes
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m validacao",
+        description="Valida a Prévia contra a Base e grava as planilhas consolidada e de faturamento.",
+    )
+    parser.add_argument("previa", help="Arquivo da Prévia (.xlsx)")
+    parser.add_argument(
+        "base", nargs="?", help="Arquivo Base (.xlsx, todas as abas são consolidadas); omita ao usar --snapshot"
+    )
+    parser.add_argument("--saida", default=".", help="Diretório de saída (padrão: diretório atual)")
+    parser.add_argument(
+        "--formato", choices=list(FORMATOS_EXPORTACAO), default="xlsx", help="Formato dos arquivos de saída"
+    )
+    parser.add_argument("--motor", choices=MOTORES_LEITURA, default="auto", help="Motor de leitura do Excel")
+    parser.add_argument(
+        "--processos", type=int, default=None, help="Processos para ler as abas da Base (padrão: número de CPUs)"
+    )
+    parser.add_argument(
+        "--conflito", choices=POLITICAS_CONFLITO, default="primeira",
+        help="Linha da Base usada quando um circuito se repete (padrão: primeira)",
+    )
+    parser.add_argument("--snapshot", metavar="ID", help="Usa a Base de um snapshot salvo em vez do .xlsx")
+    parser.add_argument(
+        "--salvar-snapshot", metavar="AAAA-MM", help="Grava a Base lida como snapshot do mês informado"
+    )
+    parser.add_argument(
+        "--snapshots", default=os.path.join("dados", "snapshots"), help="Diretório dos snapshots da Base"
+    )
+    parser.add_argument(
+        "--registrar-historico", metavar="AAAA-MM",
+        help="Registra a Prévia validada no histórico de SLA no mês informado (substitui só o registro "
+             "de uma Prévia com o mesmo nome de arquivo nesse mês)",
+    )
+    parser.add_argument(
+        "--historico", default=os.path.join("dados", "historico"), help="Diretório do histórico de SLA"
+    )
+    parser.add_argument(
+        "--em-disco", action="store_true",
+        help="Lê a Base em blocos para um banco DuckDB em disco, para Bases que não cabem na memória",
+    )
+    parser.add_argument(
+        "--limite-memoria", default=LIMITE_MEMORIA,
+        help=f"Memória do DuckDB no modo em disco; o excedente vai para o disco (padrão: {LIMITE_MEMORIA})",
+    )
+    parser.add_argument(
+        "--tempos", action="store_true", help="Mostra tempo de parede, CPU e pico de memória de cada etapa"
+    )
+    parser.add_argument(
+        "--memoria", action="store_true",
+        help="Mostra os bytes por coluna da Prévia validada antes e depois da compactação",
+    )
+    parser.add_argument("--metricas", metavar="ARQUIVO.json", help="Grava as medições de cada etapa em JSON")
+    parser.add_argument(
+        "--perfil", choices=PERFILADORES, help="Grava um perfil detalhado da execução no diretório de saída"
+    )
+    return parser
+
+
+def main(argv=None):
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+    if bool(args.base) == bool(args.snapshot):
+        parser.error("informe o arquivo Base ou --snapshot (apenas um dos dois)")
+    if args.em_disco and args.salvar_snapshot:
+        parser.error("--salvar-snapshot não funciona com --em-disco")
+    if args.registrar_historico:
+        try:
+            validar_mes(args.registrar_historico)
+        except ValueError as e:
+            parser.error(str(e))
+    instrumentacao = Instrumentacao(perfilador=args.perfil, exclusiva=True)
+
+    with instrumentacao.etapa("leitura_previa"):
+        previa = ler_previa(args.previa, motor=args.motor)
+    with instrumentacao.etapa("leitura_base"):
+        if args.snapshot and args.em_disco:
+            snapshot = ArmazemSnapshots(args.snapshots).obter(args.snapshot)
+            base = BaseEmDisco.de_parquet(
+                snapshot.caminho, snapshot.colunas_fg, limite_memoria=args.limite_memoria, instrumentacao=instrumentacao,
+            )
+        elif args.snapshot:
+            base = ArmazemSnapshots(args.snapshots).carregar(args.snapshot)
+        elif args.em_disco:
+            base = BaseEmDisco.de_excel(args.base, limite_memoria=args.limite_memoria, instrumentacao=instrumentacao)
+        else:
+            base = ler_base(args.base, motor=args.motor, processos=args.processos, instrumentacao=instrumentacao)
+
+    if args.salvar_snapshot and not args.snapshot:
+        with open(args.base, "rb") as f:
+            hash_base = hash_conteudo(f.read())
+        snapshot = ArmazemSnapshots(args.snapshots).salvar(
+            base, args.salvar_snapshot, hash_base, os.path.basename(args.base)
+        )
+        print(f"Snapshot da Base: {snapshot.id}")
+
+    try:
+        resultado = validar(previa, base, args.conflito, instrumentacao=instrumentacao)
+    except ConflitoCircuitos as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 2
+
+    with instrumentacao.etapa("faturamento"):
+        df_faturamento = resultado.faturamento
+
+    if args.registrar_historico:
+        with instrumentacao.etapa("historico"):
+            try:
+                HistoricoSLA(args.historico).registrar(
+                    resultado.previa_final, args.registrar_historico, os.path.basename(args.previa)
+                )
+            except ValueError as e:
+                print(f"Erro: {e}", file=sys.stderr)
+                return 2
+        print(f"Histórico de SLA: {args.registrar_historico} registrado em {args.historico}")
+
+    os.makedirs(args.saida, exist_ok=True)
+    hoje = datetime.datetime.now()
+    extensao = FORMATOS_EXPORTACAO[args.formato][0]
+    caminho_validacao = os.path.join(args.saida, f"validacao_completa_melhorada.{extensao}")
+    caminho_faturamento = os.path.join(args.saida, f"faturamento_pronto_{hoje.strftime('%Y%m%d')}.{extensao}")
+
+    with instrumentacao.etapa("exportacao_validacao"):
+        with open(caminho_validacao, "wb") as f:
+            f.write(exportar_validacao(resultado.previa_final, args.formato))
+    with instrumentacao.etapa("exportacao_faturamento"):
+        with open(caminho_faturamento, "wb") as f:
+            f.write(exportar_faturamento(df_faturamento, mes_referencia(hoje), args.formato))
+
+    for chave, valor in resultado.resumo.items():
+        print(f"{chave}: {valor:,.2f}" if isinstance(valor, float) else f"{chave}: {valor}")
+    if len(resultado.duplicados_base):
+        caminho_duplicados = os.path.join(args.saida, "circuitos_repetidos_base.csv")
+        resultado.duplicados_base.to_csv(caminho_duplicados, index=False)
+        print(f"Circuitos repetidos na Base: {caminho_duplicados}")
+    print(f"Arquivos gravados: {caminho_validacao}, {caminho_faturamento}")
+
+    if args.metricas:
+        with open(args.metricas, "w", encoding="utf-8") as f:
+            f.write(instrumentacao.para_json())
+    perfil = instrumentacao.perfil()
+    if perfil:
+        extensao_perfil, dados_perfil = perfil
+        caminho_perfil = os.path.join(args.saida, f"perfil.{extensao_perfil}")
+        with open(caminho_perfil, "wb") as f:
+            f.write(dados_perfil)
+        print(f"Perfil: {caminho_perfil}")
+
+    if args.tempos:
+        print()
+        print(f"{'etapa':<26} {'parede':>9} {'cpu':>9} {'pico mem':>10}")
+        for medicao in instrumentacao.medicoes.values():
+            nome = "  " * medicao.nivel + medicao.etapa
+            print(f"{nome:<26} {medicao.parede_s:>7.3f} s {medicao.cpu_s:>7.3f} s {medicao.pico_memoria_mb:>7.0f} MB")
+        total = instrumentacao.total()
+        print(f"{'total':<26} {total['parede_s']:>7.3f} s {total['cpu_s']:>7.3f} s {total['pico_memoria_mb']:>7.0f} MB")
+
+    if args.memoria:
+        print()
+        print(f"{'coluna':<26} {'tipo antes':<10} {'antes':>10} {'tipo depois':<11} {'depois':>10} {'economia':>9}")
+        for linha in resultado.memoria.to_dict("records"):
+            economia = "" if pd.isna(linha["Economia"]) else f"{linha['Economia']:.0%}"
+            print(
+                f"{linha['Coluna']:<26} {linha['Tipo antes']:<10} {linha['Bytes antes'] / 1024 ** 2:>7.1f} MB "
+                f"{linha['Tipo depois']:<11} {linha['Bytes depois'] / 1024 ** 2:>7.1f} MB {economia:>9}"
+            )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""Dados já agregados para os gráficos do painel.
+
+O Plotly manda para o navegador cada ponto que recebe; com a Prévia inteira
+(centenas de milhares de linhas) isso domina o tempo do rerun. Os gráficos
+recebem aqui só as contagens por categoria e as faixas do histograma.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def contar_categorias(serie):
+    """Linhas por categoria, sem as categorias que não ocorrem."""
+    contagens = serie.value_counts()
+    return contagens[contagens > 0]
+
+
+def histograma(valores, faixas=20):
+    """Faixas de ``valores`` (ignorando vazios): DataFrame com ``inicio``,
+    ``fim`` e ``Quantidade``, uma linha por faixa."""
+    valores = pd.to_numeric(valores, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    valores = valores[np.isfinite(valores)]
+    if not len(valores):
+        return pd.DataFrame({"inicio": [], "fim": [], "Quantidade": []})
+    contagens, bordas = np.histogram(valores, bins=faixas)
+    return pd.DataFrame({"inicio": bordas[:-1], "fim": bordas[1:], "Quantidade": contagens})
@@ -0,0 +1,321 @@
+"""Cache LRU por hash de conteúdo para os DataFrames já lidos e normalizados.
+
+Cada rerun do Streamlit executa o script inteiro de novo; sem este cache os
+arquivos Excel seriam relidos a cada interação com qualquer widget. O mesmo
+cache guarda, numa instância à parte, os resultados de validação
+compartilhados entre sessões (ver ``chave_cache_resultado``).
+"""
+
+import dataclasses
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos
+    fcntl = None
+
+
+def hash_conteudo(dados):
+    """Hash estável dos bytes de um arquivo enviado."""
+    return hashlib.blake2b(dados, digest_size=20).hexdigest()
+
+
+def chave_cache_resultado(hash_previa, hash_base, versao_motor, *opcoes):
+    """Chave de um resultado de validação no cache compartilhado.
+
+    ``versao_motor`` (``validacao.motor.VERSAO_MOTOR``) separa resultados de
+    versões do motor que calculam diferente; ``opcoes`` são as demais
+    escolhas que mudam o resultado (motor de leitura, política de conflito...).
+    """
+    return ("resultado", versao_motor, hash_previa, hash_base) + tuple(opcoes)
+
+
+def tamanho_em_bytes(valor):
+    """Estimativa do espaço ocupado em memória por um valor do cache."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(index=True, deep=True))
+    if isinstance(valor, (tuple, list)):
+        return sum(tamanho_em_bytes(v) for v in valor)
+    if isinstance(valor, dict):
+        return sum(tamanho_em_bytes(v) for v in valor.values())
+    if isinstance(valor, (set, frozenset)):
+        return sys.getsizeof(valor) + sum(sys.getsizeof(v) for v in valor)
+    if dataclasses.is_dataclass(valor) and not isinstance(valor, type):
+        return sum(tamanho_em_bytes(getattr(valor, campo.name)) for campo in dataclasses.fields(valor))
+    return sys.getsizeof(valor)
+
+
+@dataclasses.dataclass
+class _EntradaDisco:
+    criado_em: float
+    valor: object
+
+
+def _preparar_diretorio(diretorio):
+    os.makedirs(diretorio, mode=0o700, exist_ok=True)
+    if hasattr(os, "getuid") and os.stat(diretorio).st_uid != os.getuid():
+        raise PermissionError(f"Diretório do cache pertence a outro usuário: {diretorio}")
+
+
+class CacheLRU:
+    """Cache em memória (e opcionalmente em disco) com orçamento de bytes.
+
+    As entradas menos usadas recentemente são descartadas quando o orçamento
+    é ultrapassado. Quando ``diretorio`` é informado, as entradas também são
+    gravadas em disco (pickle) e sobrevivem a reinícios do processo, com
+    orçamento e despejo LRU próprios baseados na data de acesso do arquivo;
+    vários processos (workers) podem usar o mesmo diretório. Com
+    ``validade_s``, entradas mais antigas que isso (desde o cálculo) são
+    tratadas como ausentes, na memória e no disco; ``limite_entradas``
+    limita também o número de entradas em memória. O diretório é criado só
+    para o usuário do processo (pickle carregado de lá executa código), e um
+    diretório de outro usuário é recusado.
+
+    ``obter_ou_calcular`` calcula cada chave uma vez só: quem pede uma chave
+    que já está sendo calculada (por outra thread ou, com disco, por outro
+    processo) espera e recebe o mesmo valor.
+    """
+
+    def __init__(self, limite_bytes, diretorio=None, limite_disco_bytes=None, validade_s=None, limite_entradas=None):
+        self.limite_bytes = limite_bytes
+        self.limite_entradas = limite_entradas
+        self.diretorio = diretorio
+        self.limite_disco_bytes = limite_disco_bytes
+        self.validade_s = validade_s
+        self.acertos = 0
+        self.acertos_disco = 0
+        self.falhas = 0
+        self.despejos = 0
+        self.expiradas = 0
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._calculando = {}
+        if diretorio:
+            _preparar_diretorio(diretorio)
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def _expirou(self, criado_em):
+        return self.validade_s is not None and time.time() - criado_em > self.validade_s
+
+    @property
+    def bytes_em_uso(self):
+        return self._bytes
+
+    def obter(self, chave, padrao=None):
+        valor, origem = self._procurar(chave)
+        self._contar(origem)
+        return padrao if origem is None else valor
+
+    def _procurar(self, chave):
+        """(valor, "memoria" | "disco" | None), sem contar acertos e falhas."""
+        expirada = False
+        with self._lock:
+            if chave in self._entradas:
+                valor, tamanho, criado_em = self._entradas[chave]
+                if not self._expirou(criado_em):
+                    self._entradas.move_to_end(chave)
+                    return valor, "memoria"
+                del self._entradas[chave]
+                self._bytes -= tamanho
+                self.expiradas += 1
+                expirada = True
+
+        entrada = self._ler_disco(chave)
+        if entrada is None:
+            return None, None
+        if self._expirou(entrada.criado_em):
+            self._remover(self._caminho(chave))
+            if not expirada:
+                with self._lock:
+                    self.expiradas += 1
+            return None, None
+        with self._lock:
+            self._guardar_memoria(chave, entrada.valor, entrada.criado_em)
+        return entrada.valor, "disco"
+
+    def _contar(self, origem):
+        with self._lock:
+            if origem == "memoria":
+                self.acertos += 1
+            elif origem == "disco":
+                self.acertos_disco += 1
+            else:
+                self.falhas += 1
+
+    def guardar(self, chave, valor):
+        criado_em = time.time()
+        with self._lock:
+            self._guardar_memoria(chave, valor, criado_em)
+        self._gravar_disco(chave, _EntradaDisco(criado_em, valor))
+
+    def obter_ou_calcular(self, chave, calcular, guardar_como=None):
+        """Valor de ``chave``, calculado com ``calcular()`` se ausente.
+
+        Com ``guardar_como``, quem calcula recebe o valor de ``calcular()`` e
+        o cache guarda ``guardar_como(valor)`` (por exemplo, sem as partes
+        que não devem ser compartilhadas); os demais recebem o guardado.
+        """
+        valor, origem = self._procurar(chave)
+        if origem is None:
+            with self._trava_chave(chave):
+                # Quem esperou a trava encontra o valor calculado por quem a tinha
+                valor, origem = self._procurar(chave)
+                if origem is None:
+                    valor = calcular()
+                    self.guardar(chave, valor if guardar_como is None else guardar_como(valor))
+        self._contar(origem)
+        return valor
+
+    @contextmanager
+    def _trava_chave(self, chave):
+        with self._lock:
+            trava, usos = self._calculando.get(chave, (None, 0))
+            trava = trava or threading.Lock()
+            self._calculando[chave] = (trava, usos + 1)
+        try:
+            with trava, self._trava_disco(chave):
+                yield
+        finally:
+            with self._lock:
+                trava, usos = self._calculando[chave]
+                if usos == 1:
+                    del self._calculando[chave]
+                else:
+                    self._calculando[chave] = (trava, usos - 1)
+
+    @contextmanager
+    def _trava_disco(self, chave):
+        # Entre processos que compartilham o diretório (workers do servidor)
+        if not self.diretorio or fcntl is None:
+            yield
+            return
+        with open(f"{self._caminho(chave)}.lock", "a") as arquivo:
+            fcntl.flock(arquivo, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(arquivo, fcntl.LOCK_UN)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+        if self.diretorio:
+            for nome in os.listdir(self.diretorio):
+                if nome.endswith(".pkl"):
+                    self._remover(os.path.join(self.diretorio, nome))
+
+    def estatisticas(self):
+        consultas = self.acertos + self.acertos_disco + self.falhas
+        return {
+            "Acertos (memória)": self.acertos,
+            "Acertos (disco)": self.acertos_disco,
+            "Falhas": self.falhas,
+            "Taxa de acerto": (self.acertos + self.acertos_disco) / consultas if consultas else 0.0,
+            "Entradas": len(self._entradas),
+            "Memória usada (MB)": self._bytes / 1024 ** 2,
+            "Limite de memória (MB)": self.limite_bytes / 1024 ** 2,
+            "Despejos": self.despejos,
+            "Expiradas": self.expiradas,
+        }
+
+    # Memória -----------------------------------------------------------------
+
+    def _guardar_memoria(self, chave, valor, criado_em):
+        tamanho = tamanho_em_bytes(valor)
+        if chave in self._entradas:
+            self._bytes -= self._entradas.pop(chave)[1]
+        if tamanho > self.limite_bytes:
+            # Maior que o orçamento inteiro: fica só no disco, se houver
+            return
+        self._entradas[chave] = (valor, tamanho, criado_em)
+        self._bytes += tamanho
+        while self._bytes > self.limite_bytes or (self.limite_entradas and len(self._entradas) > self.limite_entradas):
+            _, (_, tamanho_antigo, _) = self._entradas.popitem(last=False)
+            self._bytes -= tamanho_antigo
+            self.despejos += 1
+
+    # Disco -------------------------------------------------------------------
+
+    def _caminho(self, chave):
+        nome = hashlib.blake2b(repr(chave).encode(), digest_size=20).hexdigest()
+        return os.path.join(self.diretorio, f"{nome}.pkl")
+
+    def _ler_disco(self, chave):
+        if not self.diretorio:
+            return None
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "rb") as f:
+                entrada = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if not isinstance(entrada, _EntradaDisco):
+            # Gravada por uma versão anterior do cache, sem a data de criação
+            self._remover(caminho)
+            return None
+        try:
+            os.utime(caminho)
+        except OSError:
+            pass
+        return entrada
+
+    def _gravar_disco(self, chave, valor):
+        if not self.diretorio:
+            return
+        caminho = self._caminho(chave)
+        temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporario, "wb") as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, caminho)
+        except OSError:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            return
+        self._despejar_disco()
+
+    def _despejar_disco(self):
+        if not self.limite_disco_bytes:
+            return
+        arquivos = []
+        for nome in os.listdir(self.diretorio):
+            if not nome.endswith(".pkl"):
+                continue
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                info = os.stat(caminho)
+            except OSError:
+                continue
+            arquivos.append((info.st_mtime, info.st_size, caminho))
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.limite_disco_bytes:
+                break
+            if not self._remover(caminho):
+                continue
+            total -= tamanho
+            self.despejos += 1
+
+    @staticmethod
+    def _remover(caminho):
+        # Outro processo pode ter removido (ou despejado) o arquivo antes
+        try:
+            os.remove(caminho)
+        except OSError:
+            return False
+        return True
@@ -0,0 +1,9 @@
+"""Nomes de colunas esperados nos arquivos da Prévia e da Base."""
+
+COL_CIRCUITO = "Circuito"
+COL_DISP_MENSAL = "Disponibilidade"
+COL_SLA_DISP = "SLA disponibilidade"
+COL_VALOR_CONTRATADO = "Valor Contratado"
+
+# Colunas de porcentagem da Prévia que podem vir como 0-100 ou 0-1
+COLUNAS_PORCENTAGEM = [COL_DISP_MENSAL, COL_SLA_DISP]
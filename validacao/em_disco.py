@@ -0,0 +1,273 @@
+"""Modo em disco para Bases que não cabem na memória (DuckDB).
+
+``ler_base`` monta a Base inteira num DataFrame e o ``pd.concat`` das abas
+dobra o pico. Aqui cada aba é lida em streaming, em blocos já projetados nas
+colunas usadas (``leitura.ler_base_em_blocos``), e cada bloco vai direto para
+uma tabela DuckDB num arquivo temporário. O índice de circuitos, as
+diferenças de conjuntos (faltantes/extras) e a junção com a Prévia são
+consultas SQL sobre essa tabela; com ``limite_memoria`` o DuckDB despeja em
+disco o que não couber. Só a Prévia e o resultado ficam em memória.
+
+``validar`` aceita uma ``BaseEmDisco`` no lugar do DataFrame da Base. As
+colunas F/G voltam como texto, e o Valor Contratado já convertido em número
+(os valores que não são números ficam vazios, como em ``calcular_penalidades``).
+"""
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from validacao.colunas import COL_CIRCUITO, COL_VALOR_CONTRATADO
+from validacao.indice import POLITICAS_CONFLITO, ConflitoCircuitos
+from validacao.instrumentacao import medir
+from validacao.leitura import ler_base_em_blocos
+from validacao.motor import chaves_circuito
+
+LINHAS_POR_BLOCO = 50_000
+LIMITE_MEMORIA = "1GB"
+
+# Ordem das linhas de um mesmo circuito: a primeira vence
+_ORDEM_POLITICA = {
+    "primeira": "ordem",
+    "ultima": "ordem DESC",
+    "maior_valor": f'"{COL_VALOR_CONTRATADO}" DESC NULLS LAST, ordem',
+    "erro": "ordem",
+}
+
+
+def duckdb_disponivel():
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def _importar_duckdb():
+    if not duckdb_disponivel():
+        raise ImportError("O modo em disco requer o pacote duckdb (pip install duckdb)")
+    import duckdb
+
+    return duckdb
+
+
+def _identificador(nome):
+    return '"' + str(nome).replace('"', '""') + '"'
+
+
+def _como_texto(serie):
+    # Colunas F/G misturam números e textos entre abas; guardadas como texto,
+    # mantendo os vazios (como nos snapshots)
+    return serie.map(str, na_action="ignore").astype(object)
+
+
+class BaseEmDisco:
+    """Base consolidada numa tabela DuckDB em ``diretorio`` (temporário, se omitido).
+
+    Só as colunas usadas na validação são gravadas: a chave normalizada do
+    circuito, as colunas F/G e o Valor Contratado, além da posição de cada
+    linha na Base (para as políticas ``primeira``/``ultima``).
+    """
+
+    def __init__(self, colunas_fg, diretorio=None, limite_memoria=LIMITE_MEMORIA):
+        duckdb = _importar_duckdb()
+        self._temporario = diretorio is None
+        self.diretorio = diretorio or tempfile.mkdtemp(prefix="validacao_base_")
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.caminho = os.path.join(self.diretorio, "base.duckdb")
+        self.attrs = {"colunas_fg": list(colunas_fg)}
+        self.colunas = [c for c in colunas_fg if c not in (COL_CIRCUITO, COL_VALOR_CONTRATADO)]
+        self.colunas.append(COL_VALOR_CONTRATADO)
+        self.linhas = 0
+        self._indices = {}
+        self._trava = threading.Lock()
+
+        self._con = duckdb.connect(self.caminho)
+        self._con.execute(f"SET memory_limit = '{limite_memoria}'")
+        self._con.execute(f"SET temp_directory = '{os.path.join(self.diretorio, 'spill')}'")
+        self._con.execute("SET preserve_insertion_order = false")
+        colunas_sql = ", ".join(f"{_identificador(c)} VARCHAR" for c in self.colunas[:-1])
+        self._con.execute(
+            "CREATE OR REPLACE TABLE base (ordem BIGINT, chave VARCHAR, "
+            + (colunas_sql + ", " if colunas_sql else "")
+            + f"{_identificador(COL_VALOR_CONTRATADO)} DOUBLE)"
+        )
+
+    def __len__(self):
+        return self.linhas
+
+    @classmethod
+    def de_excel(cls, arquivo, linhas_por_bloco=LINHAS_POR_BLOCO, diretorio=None,
+                 limite_memoria=LIMITE_MEMORIA, instrumentacao=None):
+        """Lê a Base .xlsx em streaming, bloco a bloco, direto para o disco."""
+        colunas_fg, blocos = ler_base_em_blocos(arquivo, linhas_por_bloco)
+        base = cls(colunas_fg, diretorio, limite_memoria)
+        with medir(instrumentacao, "carga_base_em_disco"):
+            for bloco in blocos:
+                base.acrescentar(bloco)
+        return base
+
+    @classmethod
+    def de_parquet(cls, caminho, colunas_fg, linhas_por_bloco=LINHAS_POR_BLOCO, diretorio=None,
+                   limite_memoria=LIMITE_MEMORIA, instrumentacao=None):
+        """Carrega um snapshot Parquet (``validacao.snapshots``) em lotes."""
+        import pyarrow.parquet as pq
+
+        arquivo = pq.ParquetFile(caminho)
+        # Snapshots antigos não guardam os nomes das colunas F/G: posições 5 e 6
+        base = cls(colunas_fg or arquivo.schema_arrow.names[5:7], diretorio, limite_memoria)
+        colunas = [c for c in [COL_CIRCUITO] + base.colunas if c in arquivo.schema_arrow.names]
+        with medir(instrumentacao, "carga_base_em_disco"):
+            for lote in arquivo.iter_batches(batch_size=linhas_por_bloco, columns=colunas):
+                base.acrescentar(lote.to_pandas())
+        return base
+
+    def acrescentar(self, bloco):
+        """Grava um bloco de linhas da Base (colunas que faltam entram vazias)."""
+        def coluna(nome):
+            if nome in bloco.columns:
+                return bloco[nome]
+            return pd.Series([None] * len(bloco), index=bloco.index, dtype=object)
+
+        gravar = pd.DataFrame({
+            "ordem": np.arange(self.linhas, self.linhas + len(bloco), dtype=np.int64),
+            "chave": chaves_circuito(coluna(COL_CIRCUITO)).astype(object),
+        }, index=bloco.index)
+        for nome in self.colunas[:-1]:
+            gravar[nome] = _como_texto(coluna(nome))
+        gravar[COL_VALOR_CONTRATADO] = pd.to_numeric(coluna(COL_VALOR_CONTRATADO), errors="coerce").astype(float)
+
+        with self._trava:
+            self._con.register("bloco_base", gravar)
+            try:
+                self._con.execute("INSERT INTO base SELECT * FROM bloco_base")
+            finally:
+                self._con.unregister("bloco_base")
+            self.linhas += len(bloco)
+            self._indices.clear()
+
+    def cursor(self):
+        """Conexão própria para a thread que chama (a do DuckDB não é compartilhável)."""
+        return self._con.cursor()
+
+    def indexar(self, politica="primeira"):
+        """``IndiceEmDisco`` da política; montado uma vez por política."""
+        if politica not in POLITICAS_CONFLITO:
+            raise ValueError(f"Política de conflito desconhecida: {politica!r} (opções: {', '.join(POLITICAS_CONFLITO)})")
+        with self._trava:
+            if politica not in self._indices:
+                self._indices[politica] = IndiceEmDisco.construir(self, politica)
+            return self._indices[politica]
+
+    def fechar(self):
+        self._con.close()
+        if self._temporario:
+            shutil.rmtree(self.diretorio, ignore_errors=True)
+
+    def __del__(self):
+        try:
+            self.fechar()
+        except Exception:
+            pass
+
+
+class IndiceEmDisco:
+    """Mesma interface de ``IndiceCircuitos``, com as consultas no DuckDB.
+
+    ``tabela`` é uma visão com uma linha por circuito: a Base sem as linhas
+    que perderam na política (só circuitos repetidos, poucas linhas), sem
+    copiar a Base inteira.
+    """
+
+    def __init__(self, base, tabela, duplicados, politica):
+        self.base = base
+        self.tabela = tabela
+        self.duplicados = duplicados
+        self.politica = politica
+
+    @classmethod
+    def construir(cls, base, politica):
+        tabela = f"indice_{politica}"
+        with base.cursor() as con:
+            con.execute(
+                "CREATE OR REPLACE TABLE repetidos AS SELECT chave FROM base "
+                "WHERE chave IS NOT NULL GROUP BY chave HAVING count(*) > 1"
+            )
+            duplicados = cls._relatorio_duplicados(con, base.colunas)
+            if politica == "erro" and len(duplicados):
+                raise ConflitoCircuitos(duplicados)
+            con.execute(
+                f"CREATE OR REPLACE TABLE descartadas_{politica} AS "
+                f"SELECT ordem FROM base SEMI JOIN repetidos USING (chave) "
+                f"QUALIFY row_number() OVER (PARTITION BY chave ORDER BY {_ORDEM_POLITICA[politica]}) > 1"
+            )
+            con.execute(
+                f"CREATE OR REPLACE VIEW {tabela} AS SELECT * EXCLUDE (ordem) FROM base "
+                f"ANTI JOIN descartadas_{politica} USING (ordem) WHERE chave IS NOT NULL"
+            )
+        return cls(base, tabela, duplicados, politica)
+
+    @staticmethod
+    def _relatorio_duplicados(con, colunas):
+        # Valores divergentes: mais de um valor distinto (vazio conta como valor)
+        divergencias = " OR ".join(
+            f"count(DISTINCT {_identificador(c)}) + max(({_identificador(c)} IS NULL)::INT) > 1" for c in colunas
+        )
+        duplicados = con.execute(
+            f"SELECT chave AS {_identificador(COL_CIRCUITO)}, count(*) AS \"Ocorrências\", "
+            f"({divergencias}) AS \"Valores divergentes\" "
+            f"FROM base SEMI JOIN repetidos USING (chave) GROUP BY chave ORDER BY chave"
+        ).df()
+        duplicados["Ocorrências"] = duplicados["Ocorrências"].astype("int64")
+        return duplicados
+
+    def _consultar(self, chaves, *consultas):
+        """Executa as ``consultas`` com as chaves da Prévia registradas como
+        ``previa``; devolve uma tabela Arrow por consulta."""
+        import pyarrow as pa
+
+        # Arrow em vez de DataFrame de objetos: o DuckDB lê sem converter valor a valor
+        previa = pa.table({
+            "posicao": np.arange(len(chaves), dtype=np.int64),
+            "chave": pa.array(chaves.to_numpy(dtype=object, na_value=None), type=pa.string()),
+        })
+        resultados = []
+        with self.base.cursor() as con:
+            con.register("previa", previa)
+            for sql in consultas:
+                resultado = con.execute(sql).arrow()
+                # A partir do DuckDB 1.4, ``arrow()`` devolve um leitor de lotes
+                resultados.append(resultado.read_all() if hasattr(resultado, "read_all") else resultado)
+        return resultados
+
+    def presentes(self, chaves):
+        """Máscara das ``chaves`` (já normalizadas) que existem na Base."""
+        encontradas, = self._consultar(chaves, f"SELECT posicao FROM previa SEMI JOIN {self.tabela} USING (chave)")
+        mascara = np.zeros(len(chaves), dtype=bool)
+        mascara[encontradas.column("posicao").to_numpy()] = True
+        return mascara
+
+    def diferencas(self, circuitos_previa):
+        """(circuitos da Base que faltam na Prévia, circuitos da Prévia que não estão na Base)."""
+        faltantes, extras = self._consultar(
+            pd.Series(list(circuitos_previa), dtype=object),
+            f"SELECT chave FROM {self.tabela} ANTI JOIN previa USING (chave)",
+            f"SELECT chave FROM previa ANTI JOIN {self.tabela} USING (chave)",
+        )
+        return set(faltantes.column("chave").to_pylist()), set(extras.column("chave").to_pylist())
+
+    def juntar(self, previa, chaves_previa, sufixo="_Base"):
+        """Acrescenta à Prévia as colunas da Base, buscadas pela chave do circuito.
+
+        Colunas que já existem na Prévia recebem ``sufixo``, como no ``merge``.
+        """
+        colunas = ", ".join(f"i.{_identificador(c)}" for c in self.base.colunas)
+        encontrados, = self._consultar(
+            chaves_previa,
+            f"SELECT p.posicao, {colunas} FROM previa p LEFT JOIN {self.tabela} i USING (chave) ORDER BY p.posicao",
+        )
+        encontrados = encontrados.drop_columns("posicao").to_pandas()
+        encontrados.index = previa.index
+        encontrados.columns = [f"{c}{sufixo}" if c in previa.columns else c for c in encontrados.columns]
+        return pd.concat([previa, encontrados], axis=1).reset_index(drop=True)
@@ -0,0 +1,117 @@
+"""Geração dos arquivos de saída (Excel, CSV e Parquet).
+
+O Excel é escrito em streaming, em blocos de linhas: com xlsxwriter no modo
+``constant_memory`` (ou, sem ele, com o openpyxl em modo ``write_only``), de
+modo que a planilha nunca existe inteira em memória além do DataFrame de
+origem. CSV e Parquet são alternativas bem mais baratas para arquivos
+grandes.
+"""
+
+import importlib.util
+from io import BytesIO
+
+from validacao.faturamento import cabecalho_faturamento, linha_total_faturamento, totais_faturamento
+from validacao.snapshots import tabela_arrow
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# formato -> (extensão, mime)
+FORMATOS_EXPORTACAO = {
+    "xlsx": ("xlsx", MIME_XLSX),
+    "csv": ("csv", "text/csv"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+TAMANHO_BLOCO = 50_000
+
+
+def _linhas(blocos, tamanho_bloco):
+    """Linhas (tuplas de valores Python, NaN -> None) dos DataFrames em sequência."""
+    for df in blocos:
+        for inicio in range(0, len(df), tamanho_bloco):
+            bloco = df.iloc[inicio:inicio + tamanho_bloco]
+            colunas = [
+                bloco[col].astype(object).where(bloco[col].notna(), None).tolist()
+                for col in bloco.columns
+            ]
+            yield from zip(*colunas)
+
+
+def _xlsx_xlsxwriter(output, nome_aba, colunas, linhas):
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(output, {
+        "constant_memory": True,
+        "default_date_format": "dd/mm/yyyy",
+    })
+    worksheet = workbook.add_worksheet(nome_aba)
+    negrito = workbook.add_format({"bold": True})
+    worksheet.write_row(0, 0, [str(c) for c in colunas], negrito)
+    for numero, linha in enumerate(linhas, start=1):
+        worksheet.write_row(numero, 0, linha)
+    workbook.close()
+
+
+def _xlsx_openpyxl(output, nome_aba, colunas, linhas):
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet(nome_aba)
+    worksheet.append([str(c) for c in colunas])
+    for linha in linhas:
+        worksheet.append(linha)
+    workbook.save(output)
+
+
+def escrever_xlsx(blocos, nome_aba, colunas=None, tamanho_bloco=TAMANHO_BLOCO):
+    """Escreve um ou mais DataFrames, em sequência e na mesma aba, num .xlsx.
+
+    Todos os DataFrames devem ter as mesmas colunas (as do primeiro, ou
+    ``colunas``).
+    """
+    blocos = list(blocos)
+    colunas = list(colunas if colunas is not None else blocos[0].columns)
+    blocos = [df if list(df.columns) == colunas else df.reindex(columns=colunas) for df in blocos]
+    output = BytesIO()
+    if importlib.util.find_spec("xlsxwriter") is not None:
+        _xlsx_xlsxwriter(output, nome_aba, colunas, _linhas(blocos, tamanho_bloco))
+    else:
+        _xlsx_openpyxl(output, nome_aba, colunas, _linhas(blocos, tamanho_bloco))
+    return output.getvalue()
+
+
+def exportar(df, formato, nome_aba="Dados"):
+    """Bytes de ``df`` no ``formato`` pedido (ver ``FORMATOS_EXPORTACAO``)."""
+    if formato == "xlsx":
+        return escrever_xlsx([df], nome_aba)
+    if formato == "csv":
+        # BOM para o Excel reconhecer os acentos ao abrir o CSV
+        return df.to_csv(index=False).encode("utf-8-sig")
+    if formato == "parquet":
+        import pyarrow.parquet as pq
+
+        output = BytesIO()
+        pq.write_table(tabela_arrow(df), output)
+        return output.getvalue()
+    raise ValueError(f"Formato de exportação desconhecido: {formato!r} (opções: {', '.join(FORMATOS_EXPORTACAO)})")
+
+
+def exportar_validacao(previa_final, formato="xlsx"):
+    return exportar(previa_final, formato, 'Validacao_Completa')
+
+
+def exportar_faturamento(df_faturamento_final, mes, formato="xlsx", totais=None):
+    """Planilha de faturamento; no Excel com cabeçalho e linha de TOTAL.
+
+    CSV e Parquet levam só as linhas de faturamento (colunas tipadas).
+    """
+    if formato != "xlsx":
+        return exportar(df_faturamento_final, formato)
+    totais = totais or totais_faturamento(df_faturamento_final)
+    blocos = [
+        cabecalho_faturamento(mes),
+        df_faturamento_final,
+        linha_total_faturamento(totais),
+    ]
+    return escrever_xlsx(blocos, 'Faturamento_Pronto', colunas=blocos[0].columns)
+
@@ -0,0 +1,76 @@
+"""Planilha de faturamento derivada da Prévia validada."""
+
+import datetime
+
+import pandas as pd
+
+# Colunas da Prévia validada -> colunas da planilha de faturamento
+COLUNAS_FATURAMENTO = {
+    'Circuito': 'Circuito',
+    'Valor Contratado': 'Valor Contratado',
+    'Disponibilidade': 'Disponibilidade',
+    'SLA disponibilidade': 'SLA Disponibilidade',
+    'Penalidade': 'Penalidade',
+    'Desconto_Alternativo': 'Desconto Alternativo'
+}
+
+COLUNAS_PLANILHA = list(COLUNAS_FATURAMENTO.values()) + ['Valor Final']
+
+
+def mes_referencia(data=None):
+    data = data or datetime.datetime.now()
+    return data.strftime("%B de %Y")
+
+
+def montar_faturamento(previa_final):
+    """Seleciona e renomeia as colunas de faturamento e calcula o Valor Final."""
+    # Uma única seleção; com copy-on-write as colunas só são copiadas se alteradas
+    colunas = [col for col in COLUNAS_FATURAMENTO if col in previa_final.columns]
+    df_faturamento_final = previa_final[colunas].rename(columns=COLUNAS_FATURAMENTO)
+
+    # Calcular Valor Final (Valor Contratado + Penalidade)
+    if 'Valor Contratado' in df_faturamento_final.columns and 'Penalidade' in df_faturamento_final.columns:
+        df_faturamento_final['Valor Final'] = df_faturamento_final['Valor Contratado'] + df_faturamento_final['Penalidade']
+
+    return df_faturamento_final
+
+
+def totais_faturamento(df_faturamento_final):
+    def total(col):
+        return df_faturamento_final[col].sum() if col in df_faturamento_final.columns else 0
+
+    return {
+        'Valor Contratado': total('Valor Contratado'),
+        'Penalidade': total('Penalidade'),
+        'Desconto Alternativo': total('Desconto Alternativo'),
+        'Valor Final': total('Valor Final'),
+    }
+
+
+def cabecalho_faturamento(mes):
+    # Linhas de cabeçalho da planilha (como no exemplo)
+    header_rows = pd.DataFrame({col: ['', '', '', ''] for col in COLUNAS_PLANILHA})
+    header_rows.loc[2, 'Circuito'] = f'Planilha de faturamento referente aos serviços prestados em {mes}'
+    return header_rows
+
+
+def linha_total_faturamento(totais):
+    return pd.DataFrame({
+        'Circuito': ['TOTAL'],
+        'Valor Contratado': [totais['Valor Contratado']],
+        'Disponibilidade': [''],
+        'SLA Disponibilidade': [''],
+        'Penalidade': [totais['Penalidade']],
+        'Desconto Alternativo': [totais['Desconto Alternativo']],
+        'Valor Final': [totais['Valor Final']]
+    })
+
+
+def planilha_faturamento(df_faturamento_final, mes, totais=None):
+    """Planilha completa em um DataFrame: cabeçalho, linhas de faturamento e TOTAL."""
+    totais = totais or totais_faturamento(df_faturamento_final)
+    return pd.concat([
+        cabecalho_faturamento(mes),
+        df_faturamento_final,
+        linha_total_faturamento(totais),
+    ], ignore_index=True)
@@ -0,0 +1,67 @@
+"""Filtro, ordenação e paginação da tabela de resultados no servidor.
+
+Só a página visível sai daqui: o filtro e a ordenação trabalham com posições
+(máscaras e ``argsort``) e apenas as linhas da página são copiadas, para que
+o navegador nunca receba o DataFrame inteiro.
+"""
+
+import math
+import numbers
+
+import numpy as np
+
+from validacao.colunas import COL_CIRCUITO
+
+TAMANHOS_PAGINA = [50, 100, 500, 1000]
+
+
+def filtrar(df, status_sla=None, status_circuito=None, busca=""):
+    """Posições das linhas que passam nos filtros."""
+    mascara = np.ones(len(df), dtype=bool)
+    if status_sla:
+        mascara &= df["SLA_Status"].isin(status_sla).to_numpy(dtype=bool)
+    if status_circuito:
+        mascara &= df["Status_Circuito"].isin(status_circuito).to_numpy(dtype=bool)
+    busca = busca.strip()
+    if busca:
+        mascara &= df[COL_CIRCUITO].astype(str).str.contains(busca, case=False, regex=False, na=False).to_numpy(dtype=bool)
+    return np.flatnonzero(mascara)
+
+
+def ordenar(df, posicoes, coluna=None, decrescente=False):
+    """Reordena ``posicoes`` pelos valores de ``coluna`` (vazios por último)."""
+    if not coluna:
+        return posicoes
+    valores = df[coluna].iloc[posicoes].reset_index(drop=True)
+    try:
+        ordem = valores.sort_values(ascending=not decrescente, kind="stable", na_position="last").index.to_numpy()
+    except TypeError:
+        # Coluna object com tipos misturados (ex.: números e textos na coluna
+        # F): números antes dos textos, o resto comparado como texto
+        ordem = valores.sort_values(
+            ascending=not decrescente, kind="stable", na_position="last", key=_chave_mista,
+        ).index.to_numpy()
+    return posicoes[ordem]
+
+
+def _chave_mista(serie):
+    def chave(valor):
+        if isinstance(valor, numbers.Number):
+            return (0, valor)
+        if isinstance(valor, str):
+            return (1, valor)
+        return (2, str(valor))
+
+    return serie.map(chave, na_action="ignore")
+
+
+def total_paginas(total_linhas, tamanho_pagina):
+    return max(1, math.ceil(total_linhas / tamanho_pagina))
+
+
+def fatiar_pagina(df, posicoes, pagina, tamanho_pagina):
+    """Linhas da ``pagina`` (1-based, limitada ao intervalo válido)."""
+    pagina = min(max(1, pagina), total_paginas(len(posicoes), tamanho_pagina))
+    inicio = (pagina - 1) * tamanho_pagina
+    return df.iloc[posicoes[inicio:inicio + tamanho_pagina]]
+
@@ -0,0 +1,383 @@
+"""Histórico mensal do SLA por circuito, em Parquet particionado por mês.
+
+Cada Prévia validada grava um arquivo ``meses/AAAA-MM/<origem>.parquet``
+com o circuito, a disponibilidade, o SLA, o status e a penalidade de cada
+linha. A ``origem`` identifica de onde veio o registro (o arquivo da
+Prévia, por exemplo): vários contratos ou regiões no mesmo mês ficam lado a
+lado, e registrar de novo a mesma origem no mesmo mês substitui só o
+arquivo dela. Se um circuito aparece em mais de uma origem do mesmo mês,
+vale o registro mais recente.
+
+As consultas do painel não releem os meses: vêm de três resumos
+recalculados a cada registro,
+
+- ``resumo_mensal.parquet``: uma linha por mês (registros, circuitos, SLA
+  excedido, disponibilidade média, penalidade total...);
+- ``resumo_circuitos.parquet``: uma linha por circuito (meses com SLA
+  excedido, sequência atual de meses excedidos, penalidade acumulada...),
+  ordenada dos maiores reincidentes para os menores;
+- ``resumo_series.parquet``: todas as linhas ordenadas por circuito e mês,
+  em grupos pequenos com estatísticas; a série de um circuito lê só o grupo
+  que o contém.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from validacao.colunas import COL_CIRCUITO, COL_DISP_MENSAL, COL_SLA_DISP, COL_VALOR_CONTRATADO
+from validacao.motor import STATUS_SLA, chaves_circuito
+from validacao.snapshots import validar_mes
+
+COL_MES = "Mês"
+
+# Colunas gravadas por mês (as da Prévia validada que existirem)
+COLUNAS_HISTORICO = [
+    COL_CIRCUITO, COL_DISP_MENSAL, COL_SLA_DISP, "SLA_Status", "Penalidade", "Desconto_Alternativo",
+    COL_VALOR_CONTRATADO,
+]
+
+# Colunas de ``serie``
+COLUNAS_SERIE = [COL_MES, COL_CIRCUITO, COL_DISP_MENSAL, COL_SLA_DISP, "SLA_Status", "Penalidade"]
+
+RESUMOS = ("mensal", "circuitos", "series")
+
+LINHAS_POR_GRUPO = 64_000
+# Menor nas séries: cada consulta lê só o grupo do circuito
+LINHAS_POR_GRUPO_SERIES = 32_768
+
+# Chave dos metadados do mês no schema do Parquet
+_CHAVE_METADADOS = b"validacao.historico"
+
+
+def _nome_origem(origem):
+    """Nome de arquivo da origem (qualquer texto vira um hash curto)."""
+    return hashlib.sha256(origem.encode()).hexdigest()[:16]
+
+
+def _gravar(tabela, caminho, **opcoes):
+    import pyarrow.parquet as pq
+
+    temporario = f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pq.write_table(tabela, temporario, compression="zstd", **opcoes)
+    os.replace(temporario, caminho)
+
+
+def _somar(codigos, valores, tamanho):
+    """(soma, quantidade) dos ``valores`` não vazios de cada código."""
+    validos = ~np.isnan(valores)
+    return (
+        np.bincount(codigos[validos], weights=valores[validos], minlength=tamanho),
+        np.bincount(codigos[validos], minlength=tamanho),
+    )
+
+
+def _media(codigos, valores, tamanho):
+    soma, quantidade = _somar(codigos, valores, tamanho)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return soma / quantidade
+
+
+class HistoricoSLA:
+    """Histórico em ``diretorio``: um Parquet por mês e origem, e os três resumos."""
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        self._dir_meses = os.path.join(diretorio, "meses")
+        os.makedirs(self._dir_meses, exist_ok=True)
+        # Resumos já lidos: {nome: (mtime, DataFrame)}
+        self._lidos = {}
+        self._trava = threading.Lock()
+
+    def _caminho_registro(self, mes, origem):
+        return os.path.join(self._dir_meses, mes, f"{_nome_origem(origem)}.parquet")
+
+    def _caminhos_mes(self, mes):
+        diretorio = os.path.join(self._dir_meses, mes)
+        return [os.path.join(diretorio, nome) for nome in sorted(os.listdir(diretorio)) if nome.endswith(".parquet")]
+
+    def _caminho_resumo(self, nome):
+        return os.path.join(self.diretorio, f"resumo_{nome}.parquet")
+
+    def meses(self):
+        """Meses com algum registro, do mais antigo para o mais recente."""
+        return sorted(
+            mes for mes in os.listdir(self._dir_meses)
+            if os.path.isdir(os.path.join(self._dir_meses, mes)) and self._caminhos_mes(mes)
+        )
+
+    @staticmethod
+    def _ler_metadados(caminho):
+        import pyarrow.parquet as pq
+
+        try:
+            metadados = pq.read_schema(caminho).metadata or {}
+            return json.loads(metadados[_CHAVE_METADADOS])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def registro(self, mes, origem):
+        """Metadados do registro da ``origem`` no mês (origem, assinatura,
+        linhas, registrado_em) ou None."""
+        return self._ler_metadados(self._caminho_registro(mes, origem))
+
+    def registros(self, mes):
+        """Metadados de todos os registros do mês, do mais antigo para o mais recente."""
+        if not os.path.isdir(os.path.join(self._dir_meses, mes)):
+            return []
+        registros = [self._ler_metadados(caminho) for caminho in self._caminhos_mes(mes)]
+        return sorted((r for r in registros if r is not None), key=lambda r: r["registrado_em"])
+
+    def registrar(self, previa_final, mes, origem, assinatura="", atualizar=True):
+        """Grava (ou substitui) o registro da ``origem`` no mês com as linhas
+        da Prévia validada.
+
+        ``assinatura`` identifica exatamente o que foi registrado (por
+        exemplo, os hashes da Prévia e da Base), para não regravar o mesmo
+        resultado. Com ``atualizar=False`` os resumos ficam para
+        ``atualizar_resumos`` (útil ao carregar vários meses de uma vez).
+        """
+        import pyarrow as pa
+
+        validar_mes(mes)
+        colunas = [c for c in COLUNAS_HISTORICO if c in previa_final.columns]
+        dados = previa_final[colunas].assign(**{COL_CIRCUITO: chaves_circuito(previa_final[COL_CIRCUITO])})
+        dados = dados[dados[COL_CIRCUITO].notna()]
+        if dados.empty:
+            raise ValueError(f"Prévia sem circuitos para registrar no histórico de {mes}")
+        if "SLA_Status" in dados.columns:
+            dados["SLA_Status"] = dados["SLA_Status"].astype(str)
+        dados = dados.sort_values(COL_CIRCUITO, kind="stable")
+
+        tabela = pa.Table.from_pandas(dados, preserve_index=False)
+        tabela = tabela.replace_schema_metadata({
+            **(tabela.schema.metadata or {}),
+            _CHAVE_METADADOS: json.dumps({
+                "mes": mes,
+                "origem": origem,
+                "assinatura": assinatura,
+                "linhas": len(dados),
+                "registrado_em": datetime.datetime.now().isoformat(timespec="microseconds"),
+            }).encode(),
+        })
+        caminho = self._caminho_registro(mes, origem)
+        with self._trava:
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            _gravar(tabela, caminho, row_group_size=LINHAS_POR_GRUPO, use_dictionary=["SLA_Status"])
+            if atualizar:
+                self._atualizar_resumos()
+        return len(dados)
+
+    def remover(self, mes, origem=None):
+        """Remove o registro da ``origem`` no mês, ou o mês inteiro."""
+        with self._trava:
+            caminhos = self._caminhos_mes(mes) if origem is None else [self._caminho_registro(mes, origem)]
+            for caminho in caminhos:
+                os.remove(caminho)
+            self._atualizar_resumos()
+
+    def atualizar_resumos(self):
+        """Recalcula os resumos a partir dos meses gravados."""
+        with self._trava:
+            self._atualizar_resumos()
+
+    @staticmethod
+    def _ler_colunas(caminho):
+        """Colunas dos resumos num registro, como arrays numpy (vazios como NaN)."""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        tabela = pq.read_table(caminho, memory_map=True, columns=[
+            c for c in COLUNAS_HISTORICO if c in pq.read_schema(caminho).names
+        ])
+
+        def numeros(coluna):
+            if coluna not in tabela.column_names:
+                return np.full(tabela.num_rows, np.nan)
+            return pc.fill_null(tabela.column(coluna).cast(pa.float64()), np.nan).to_numpy()
+
+        def status(valor):
+            if "SLA_Status" not in tabela.column_names:
+                return np.zeros(tabela.num_rows, dtype=bool)
+            return pc.fill_null(pc.equal(tabela.column("SLA_Status").cast(pa.string()), valor), False).to_numpy()
+
+        return {
+            COL_CIRCUITO: tabela.column(COL_CIRCUITO).cast(pa.string()),
+            "disponibilidade": numeros(COL_DISP_MENSAL),
+            "sla": numeros(COL_SLA_DISP),
+            "penalidade": numeros("Penalidade"),
+            "desconto": numeros("Desconto_Alternativo"),
+            "valor": numeros(COL_VALOR_CONTRATADO),
+            "excedido": status("Excedido"),
+            "nao_excedido": status("Não Excedido"),
+        }
+
+    def _atualizar_resumos(self):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        meses = self.meses()
+        if not meses:
+            for nome in RESUMOS:
+                if os.path.exists(self._caminho_resumo(nome)):
+                    os.remove(self._caminho_resumo(nome))
+            return
+        # Registros de cada mês, do mais recente para o mais antigo
+        registros = [
+            (posicao_mes, caminho)
+            for posicao_mes, mes in enumerate(meses)
+            for _, caminho in sorted(
+                ((self._ler_metadados(c) or {}).get("registrado_em", ""), c) for c in self._caminhos_mes(mes)
+            )[::-1]
+        ]
+        partes = [self._ler_colunas(caminho) for _, caminho in registros]
+        linhas_registro = np.array([len(p["excedido"]) for p in partes], dtype=np.int64)
+        posicao = np.repeat(np.array([p for p, _ in registros], dtype=np.int64), linhas_registro)
+        colunas = {
+            nome: np.concatenate([p[nome] for p in partes])
+            for nome in ("disponibilidade", "sla", "penalidade", "desconto", "valor", "excedido", "nao_excedido")
+        }
+
+        # Circuitos viram códigos inteiros, com um dicionário só para todos os meses
+        chaves = pa.chunked_array(
+            [pedaco for p in partes for pedaco in p[COL_CIRCUITO].chunks], type=pa.string()
+        ).dictionary_encode()
+        # Cada pedaço traz o dicionário acumulado até ele; sem linhas (registros
+        # vazios de versões anteriores) não há pedaço algum
+        if chaves.num_chunks:
+            dicionario = chaves.chunk(chaves.num_chunks - 1).dictionary
+        else:
+            dicionario = pa.array([], type=pa.string())
+        nomes = dicionario.to_numpy(zero_copy_only=False)
+        codigos = np.concatenate(
+            [np.empty(0, dtype=np.int64)] + [pedaco.indices.to_numpy() for pedaco in chaves.chunks]
+        ).astype(np.int64)
+
+        # Circuito em mais de um registro do mesmo mês: fica o do registro mais recente
+        manter = np.ones(len(codigos), dtype=bool)
+        vistos = np.zeros(len(nomes), dtype=bool)
+        inicio = 0
+        for indice, (posicao_mes, _) in enumerate(registros):
+            fim = inicio + linhas_registro[indice]
+            if indice and registros[indice - 1][0] != posicao_mes:
+                vistos[:] = False
+            trecho = codigos[inicio:fim]
+            manter[inicio:fim] = ~vistos[trecho]
+            vistos[trecho] = True
+            inicio = fim
+        if not manter.all():
+            codigos, posicao = codigos[manter], posicao[manter]
+            colunas = {nome: valores[manter] for nome, valores in colunas.items()}
+        excedido = colunas["excedido"].astype(bool)
+        linhas_mes = np.bincount(posicao, minlength=len(meses))
+        registros_mes = np.bincount([p for p, _ in registros], minlength=len(meses))
+
+        # Matrizes circuito x mês: presença e SLA excedido
+        presentes = np.zeros((len(nomes), len(meses)), dtype=bool)
+        presentes[codigos, posicao] = True
+        excedidos = np.zeros_like(presentes)
+        excedidos[codigos[excedido], posicao[excedido]] = True
+
+        mensal = pd.DataFrame({
+            COL_MES: meses,
+            "Registros": registros_mes,
+            "Circuitos": presentes.sum(axis=0),
+            "SLA Excedido": np.bincount(posicao[excedido], minlength=len(meses)),
+            "SLA Não Excedido": np.bincount(posicao[colunas["nao_excedido"].astype(bool)], minlength=len(meses)),
+            "Disponibilidade média": _media(posicao, colunas["disponibilidade"], len(meses)),
+            "Penalidade total": _somar(posicao, colunas["penalidade"], len(meses))[0],
+            "Desconto Alternativo total": _somar(posicao, colunas["desconto"], len(meses))[0],
+            "Valor Contratado total": _somar(posicao, colunas["valor"], len(meses))[0],
+        })
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mensal["% SLA Excedido"] = mensal["SLA Excedido"] / linhas_mes
+
+        # Sequência atual: meses excedidos seguidos, contados do mais recente para trás
+        invertidos = excedidos[:, ::-1]
+        meses_excedido = excedidos.sum(axis=1)
+        sequencia = np.where(invertidos.all(axis=1), len(meses), invertidos.argmin(axis=1))
+        ultimo = len(meses) - 1 - invertidos.argmax(axis=1)
+        minimos = pd.Series(colunas["disponibilidade"]).groupby(codigos).min().reindex(range(len(nomes)))
+        circuitos = pd.DataFrame({
+            COL_CIRCUITO: nomes,
+            "Meses registrados": presentes.sum(axis=1),
+            "Meses com SLA excedido": meses_excedido,
+            "Sequência atual": sequencia,
+            "Último mês excedido": np.where(meses_excedido > 0, np.array(meses, dtype=object)[ultimo], None),
+            "Disponibilidade média": _media(codigos, colunas["disponibilidade"], len(nomes)),
+            "Disponibilidade mínima": minimos.to_numpy(),
+            "Penalidade total": _somar(codigos, colunas["penalidade"], len(nomes))[0],
+        }).sort_values(
+            ["Meses com SLA excedido", "Sequência atual", "Penalidade total", COL_CIRCUITO],
+            ascending=[False, False, True, True], kind="stable",
+        )
+
+        # Séries: o histórico inteiro ordenado por circuito (e mês, pela ordem de
+        # leitura), para a série de um circuito ler um grupo de linhas de um arquivo só
+        posto = np.empty(len(nomes), dtype=np.int64)
+        posto[pc.sort_indices(dicionario).to_numpy()] = np.arange(len(nomes))
+        ordem = np.argsort(posto[codigos], kind="stable")
+        status = np.where(excedido, 0, np.where(colunas["nao_excedido"].astype(bool), 1, 2)).astype(np.int8)
+        series = pa.table({
+            COL_MES: pa.DictionaryArray.from_arrays(pa.array(posicao[ordem], pa.int32()), pa.array(meses)),
+            COL_CIRCUITO: dicionario.take(pa.array(codigos[ordem])),
+            COL_DISP_MENSAL: colunas["disponibilidade"][ordem],
+            COL_SLA_DISP: colunas["sla"][ordem],
+            "SLA_Status": pa.DictionaryArray.from_arrays(pa.array(status[ordem]), pa.array(STATUS_SLA)),
+            "Penalidade": colunas["penalidade"][ordem],
+        })
+
+        _gravar(pa.Table.from_pandas(mensal, preserve_index=False), self._caminho_resumo("mensal"))
+        _gravar(pa.Table.from_pandas(circuitos, preserve_index=False), self._caminho_resumo("circuitos"),
+                row_group_size=LINHAS_POR_GRUPO)
+        _gravar(series, self._caminho_resumo("series"), row_group_size=LINHAS_POR_GRUPO_SERIES)
+
+    def _ler_resumo(self, nome):
+        import pyarrow.parquet as pq
+
+        caminho = self._caminho_resumo(nome)
+        try:
+            versao = os.stat(caminho).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        lido = self._lidos.get(nome)
+        if lido is None or lido[0] != versao:
+            lido = self._lidos[nome] = (versao, pq.read_table(caminho, memory_map=True).to_pandas())
+        return lido[1]
+
+    def resumo_mensal(self):
+        """Uma linha por mês registrado, do mais antigo para o mais recente."""
+        resumo = self._ler_resumo("mensal")
+        return resumo if resumo is not None else pd.DataFrame(columns=[COL_MES])
+
+    def resumo_circuitos(self):
+        """Uma linha por circuito, dos maiores reincidentes para os menores."""
+        resumo = self._ler_resumo("circuitos")
+        return resumo if resumo is not None else pd.DataFrame(columns=[COL_CIRCUITO])
+
+    def reincidentes(self, minimo_meses=2, limite=None):
+        """Circuitos com SLA excedido em pelo menos ``minimo_meses`` meses."""
+        resumo = self.resumo_circuitos()
+        if not len(resumo):
+            return resumo
+        # O resumo já vem ordenado: os reincidentes são o começo da tabela
+        fim = int((resumo["Meses com SLA excedido"] >= minimo_meses).sum())
+        return resumo.iloc[:fim if limite is None else min(fim, limite)].reset_index(drop=True)
+
+    def serie(self, circuitos):
+        """Linhas dos ``circuitos`` em cada mês, por circuito e mês."""
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        chaves = [str(c).strip() for c in circuitos]
+        caminho = self._caminho_resumo("series")
+        if not chaves or not os.path.exists(caminho):
+            return pd.DataFrame(columns=COLUNAS_SERIE)
+        serie = pq.read_table(caminho, filters=ds.field(COL_CIRCUITO).isin(chaves), memory_map=True).to_pandas()
+        return serie.astype({COL_MES: str, "SLA_Status": str})
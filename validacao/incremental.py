@@ -0,0 +1,258 @@
+"""Revalidação incremental entre versões da Prévia.
+
+Ao longo do mês chegam várias Prévias revisadas que diferem em poucos
+circuitos. Com a mesma Base (e a mesma política de conflito), o resultado de
+uma linha só depende dela mesma; então a nova Prévia é comparada com a
+anterior, linha a linha pela chave do circuito, e só as linhas alteradas ou
+incluídas passam de novo por ``validar``. O ``previa_final`` anterior é
+remendado com elas e os totais do ``resumo`` são ajustados pela diferença.
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from validacao.colunas import COL_CIRCUITO
+from validacao.instrumentacao import Instrumentacao
+from validacao.memoria import compactar, relatorio_memoria
+from validacao.motor import Resultado, chaves_circuito, indexar_base, montar_resumo, validar
+
+ETAPAS_INCREMENTAIS = (
+    "indice_base", "comparacao_previas", "recalculo_incremental", "montagem_incremental", "resumo_incremental",
+)
+
+# Totais do resumo que são somas linha a linha (os demais vêm de conjuntos)
+_TOTAIS_POR_LINHA = (
+    "Total linhas prévia",
+    "SLA Excedido",
+    "SLA Não Excedido",
+    "SLA Dados faltando/erro",
+    "Total Penalidade Calculada",
+    "Total Desconto Alternativo",
+)
+
+_SEM_CIRCUITO = "\x00sem circuito"
+
+COLUNAS_DELTA = [
+    COL_CIRCUITO, "Mudança", "Colunas alteradas",
+    "SLA antes", "SLA depois", "Status antes", "Status depois",
+    "Penalidade antes", "Penalidade depois",
+]
+
+
+@dataclass
+class Delta:
+    """O que mudou da Prévia anterior para a nova."""
+
+    alterados: int = 0
+    incluidos: int = 0
+    removidos: int = 0
+    inalterados: int = 0
+    # Uma linha por linha da Prévia alterada, incluída ou removida
+    tabela: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=COLUNAS_DELTA))
+    # True quando não deu para comparar e a Prévia foi validada inteira
+    completo: bool = False
+    motivo: str = ""
+
+    @property
+    def variacao_penalidade(self):
+        if self.tabela.empty:
+            return 0.0
+        return self.tabela["Penalidade depois"].sum() - self.tabela["Penalidade antes"].sum()
+
+
+def _chaves_linhas(chaves):
+    """Chave única de cada linha: o circuito normalizado e, a partir da
+    segunda vez que ele aparece na Prévia, o número da ocorrência.
+
+    Linhas sem circuito entram todas com a mesma chave de ausente.
+    """
+    valores = chaves.fillna(_SEM_CIRCUITO).to_numpy(dtype=object)
+    indice = pd.Index(valores, dtype=object)
+    if indice.is_unique:
+        return indice
+    repetida = indice.duplicated()
+    ocorrencia = pd.Series(valores).groupby(valores, sort=False).cumcount().to_numpy()
+    valores[repetida] = [f"{v}\x1f{o}" for v, o in zip(valores[repetida], ocorrencia[repetida])]
+    return pd.Index(valores, dtype=object)
+
+
+def _comparar(previa, anterior, pos_nova, pos_anterior):
+    """Matriz (linhas pareadas x colunas) com True onde o valor mudou."""
+    diferencas = np.zeros((len(pos_nova), len(previa.columns)), dtype=bool)
+    for i, col in enumerate(previa.columns):
+        novo = previa[col].take(pos_nova).reset_index(drop=True)
+        antigo = anterior[col].take(pos_anterior).reset_index(drop=True)
+        try:
+            iguais = (novo == antigo).to_numpy(dtype=bool, na_value=False)
+        except TypeError:
+            # Tipos que o pandas não compara entre si (a coluna mudou de tipo)
+            iguais = novo.to_numpy(dtype=object) == antigo.to_numpy(dtype=object)
+        ambos_vazios = (novo.isna() & antigo.isna()).to_numpy(dtype=bool)
+        diferencas[:, i] = ~(iguais | ambos_vazios)
+    return diferencas
+
+
+def _tabela_delta(mudanca, circuitos, antes, depois, colunas_alteradas):
+    def coluna(df, col):
+        if df is None:
+            return [None] * len(circuitos)
+        return df[col].to_numpy(dtype=object) if col in df.columns else [None] * len(circuitos)
+
+    return pd.DataFrame({
+        COL_CIRCUITO: circuitos,
+        "Mudança": mudanca,
+        "Colunas alteradas": colunas_alteradas,
+        "SLA antes": coluna(antes, "SLA_Status"),
+        "SLA depois": coluna(depois, "SLA_Status"),
+        "Status antes": coluna(antes, "Status_Circuito"),
+        "Status depois": coluna(depois, "Status_Circuito"),
+        "Penalidade antes": coluna(antes, "Penalidade"),
+        "Penalidade depois": coluna(depois, "Penalidade"),
+    }, columns=COLUNAS_DELTA)
+
+
+def validar_incremental(previa, anterior, base, instrumentacao=None, politica_conflito="primeira"):
+    """Valida ``previa`` reaproveitando ``anterior`` (um ``Resultado`` da mesma Base).
+
+    Devolve (``Resultado``, ``Delta``). Se as colunas da Prévia mudaram, ou
+    ``anterior`` não guarda as entradas, a Prévia é validada inteira e o
+    ``Delta`` sai com ``completo=True``. Um ``anterior`` sem o índice da Base
+    (vindo do cache compartilhado) tem o índice remontado com
+    ``politica_conflito``, a mesma usada nele.
+    """
+    if instrumentacao is None:
+        instrumentacao = Instrumentacao()
+    indice = anterior.indice
+    if indice is None and anterior.previa is not None:
+        with instrumentacao.etapa("indice_base"):
+            indice = indexar_base(base, politica_conflito)
+    if anterior.previa is None or indice is None:
+        motivo = "o resultado anterior não guarda a Prévia"
+    elif list(previa.columns) != list(anterior.previa.columns):
+        motivo = "as colunas da Prévia mudaram"
+    else:
+        motivo = ""
+    if motivo:
+        politica = indice.politica if indice is not None else politica_conflito
+        resultado = validar(previa, base, politica, indice=indice, instrumentacao=instrumentacao)
+        return resultado, Delta(incluidos=len(previa), completo=True, motivo=motivo)
+
+    with instrumentacao.etapa("comparacao_previas"):
+        circuitos_nova = chaves_circuito(previa[COL_CIRCUITO])
+        chaves_nova = _chaves_linhas(circuitos_nova)
+        circuitos_anterior = chaves_circuito(anterior.previa[COL_CIRCUITO])
+        chaves_anterior = _chaves_linhas(circuitos_anterior)
+        if chaves_nova.equals(chaves_anterior):
+            # Caso comum: mesmas linhas, na mesma ordem, só com valores revistos
+            correspondente = np.arange(len(chaves_nova))
+        else:
+            correspondente = chaves_anterior.get_indexer(chaves_nova)
+        pareadas = correspondente >= 0
+        pos_nova = np.flatnonzero(pareadas)
+        pos_anterior = correspondente[pareadas]
+        diferencas = _comparar(previa, anterior.previa, pos_nova, pos_anterior)
+        alterada = diferencas.any(axis=1)
+
+        pos_inalteradas_nova = pos_nova[~alterada]
+        pos_inalteradas_anterior = pos_anterior[~alterada]
+        pos_alteradas_anterior = pos_anterior[alterada]
+        pos_incluidas = np.flatnonzero(~pareadas)
+        pos_recalcular = np.sort(np.concatenate([pos_nova[alterada], pos_incluidas]))
+        removida = np.ones(len(anterior.previa), dtype=bool)
+        removida[pos_anterior] = False
+        pos_removidas = np.flatnonzero(removida)
+
+    with instrumentacao.etapa("recalculo_incremental"):
+        if len(pos_recalcular):
+            recalculadas = validar(
+                previa.iloc[pos_recalcular], base, indice.politica, indice=indice, instrumentacao=instrumentacao,
+            ).previa_final
+        else:
+            recalculadas = anterior.previa_final.iloc[:0]
+
+    with instrumentacao.etapa("montagem_incremental"):
+        partes = pd.concat(
+            [anterior.previa_final.iloc[pos_inalteradas_anterior], recalculadas], ignore_index=True,
+        )
+        ordem = np.argsort(np.concatenate([pos_inalteradas_nova, pos_recalcular]), kind="stable")
+        previa_final = partes.iloc[ordem].reset_index(drop=True)
+        # Categorias diferentes nas duas partes viram texto no concat
+        compacta = compactar(previa_final)
+        memoria = relatorio_memoria(previa_final, compacta)
+        previa_final = compacta
+
+    with instrumentacao.etapa("resumo_incremental"):
+        saiu = montar_resumo(anterior.previa_final.iloc[np.concatenate([pos_alteradas_anterior, pos_removidas])], 0, (), ())
+        entrou = montar_resumo(recalculadas, 0, (), ())
+        resumo = dict(anterior.resumo)
+        for chave in _TOTAIS_POR_LINHA:
+            resumo[chave] = anterior.resumo[chave] - saiu[chave] + entrou[chave]
+        # Só os circuitos das linhas que mudaram podem entrar ou sair dos
+        # conjuntos de faltantes/extras; a primeira ocorrência de cada
+        # circuito tem como chave o próprio circuito
+        afetados = set(circuitos_nova.iloc[pos_recalcular].dropna()) | set(
+            circuitos_anterior.iloc[np.concatenate([pos_alteradas_anterior, pos_removidas])].dropna()
+        )
+        afetados = pd.Series(list(afetados), dtype=object)
+        faltantes_na_previa = set(anterior.faltantes_na_previa)
+        extras_na_previa = set(anterior.extras_na_previa)
+        for circuito, na_base in zip(afetados, indice.presentes(afetados)):
+            na_previa = circuito in chaves_nova
+            if na_previa and not na_base:
+                extras_na_previa.add(circuito)
+            else:
+                extras_na_previa.discard(circuito)
+            if na_base and not na_previa:
+                faltantes_na_previa.add(circuito)
+            else:
+                faltantes_na_previa.discard(circuito)
+        resumo["Circuitos extras na prévia"] = len(extras_na_previa)
+        resumo["Circuitos faltando na prévia"] = len(faltantes_na_previa)
+
+        # Tabela do que mudou: alteradas, incluídas e removidas, cada grupo na ordem da sua Prévia
+        nomes_colunas = np.array(previa.columns, dtype=object)
+        alteradas_na_ordem = np.isin(pos_recalcular, pos_nova[alterada])
+        colunas_alteradas = dict(zip(
+            pos_nova[alterada], (", ".join(nomes_colunas[linha]) for linha in diferencas[alterada]),
+        ))
+        antes_por_posicao = dict(zip(pos_nova[alterada], pos_alteradas_anterior))
+        antes = anterior.previa_final.iloc[
+            [antes_por_posicao[p] for p in pos_recalcular[alteradas_na_ordem]]
+        ].reset_index(drop=True)
+        depois = recalculadas[alteradas_na_ordem].reset_index(drop=True)
+        tabela = pd.concat([
+            _tabela_delta(
+                "Alterado", previa[COL_CIRCUITO].iloc[pos_recalcular[alteradas_na_ordem]].to_numpy(dtype=object),
+                antes, depois, [colunas_alteradas[p] for p in pos_recalcular[alteradas_na_ordem]],
+            ),
+            _tabela_delta(
+                "Incluído", previa[COL_CIRCUITO].iloc[pos_recalcular[~alteradas_na_ordem]].to_numpy(dtype=object),
+                None, recalculadas[~alteradas_na_ordem].reset_index(drop=True), "",
+            ),
+            _tabela_delta(
+                "Removido", anterior.previa[COL_CIRCUITO].iloc[pos_removidas].to_numpy(dtype=object),
+                anterior.previa_final.iloc[pos_removidas].reset_index(drop=True), None, "",
+            ),
+        ], ignore_index=True)
+
+    resultado = Resultado(
+        previa_final=previa_final,
+        resumo=resumo,
+        faltantes_na_previa=faltantes_na_previa,
+        extras_na_previa=extras_na_previa,
+        duplicados_base=anterior.duplicados_base,
+        tempos=instrumentacao.tempos(ETAPAS_INCREMENTAIS),
+        previa=previa,
+        indice=indice,
+        memoria=memoria,
+    )
+    delta = Delta(
+        alterados=int(alterada.sum()),
+        incluidos=len(pos_incluidas),
+        removidos=len(pos_removidas),
+        inalterados=len(pos_inalteradas_nova),
+        tabela=tabela,
+    )
+    return resultado, delta
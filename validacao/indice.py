@@ -0,0 +1,104 @@
+"""Índice de circuitos da Base: uma linha canônica por circuito.
+
+A Base costuma repetir o mesmo circuito em várias abas. Um ``merge`` direto
+multiplicaria as linhas da Prévia a cada repetição (e somaria a
+``Penalidade`` mais de uma vez no resumo); o índice resolve as repetições
+uma única vez, segundo a política escolhida, e a junção vira uma consulta
+``reindex`` pela chave normalizada.
+"""
+
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from validacao.colunas import COL_CIRCUITO, COL_VALOR_CONTRATADO
+
+# primeira / ultima: ordem das abas na Base; maior_valor: maior Valor Contratado;
+# erro: recusa Bases com circuitos repetidos
+POLITICAS_CONFLITO = ("primeira", "ultima", "maior_valor", "erro")
+
+
+class ConflitoCircuitos(ValueError):
+    """Circuitos repetidos na Base com a política de conflito ``"erro"``."""
+
+    def __init__(self, duplicados):
+        self.duplicados = duplicados
+        exemplos = ", ".join(duplicados[COL_CIRCUITO].astype(str).head(5))
+        super().__init__(f"{len(duplicados)} circuito(s) repetido(s) na Base, por exemplo: {exemplos}")
+
+
+@dataclass
+class IndiceCircuitos:
+    """``linhas`` é indexado pela chave normalizada do circuito."""
+
+    linhas: pd.DataFrame
+    duplicados: pd.DataFrame
+    politica: str
+
+    @cached_property
+    def circuitos(self):
+        # Montado uma vez por índice; via array object é bem mais rápido que
+        # iterar o Index de texto do pandas
+        return set(self.linhas.index.to_numpy(dtype=object))
+
+    @classmethod
+    def construir(cls, base, colunas, chaves, politica="primeira"):
+        """Monta o índice a partir das ``colunas`` da Base (sem ``Circuito``).
+
+        ``chaves`` são as chaves normalizadas de ``base[Circuito]``; linhas sem
+        circuito ficam de fora.
+        """
+        if politica not in POLITICAS_CONFLITO:
+            raise ValueError(f"Política de conflito desconhecida: {politica!r} (opções: {', '.join(POLITICAS_CONFLITO)})")
+
+        linhas = base[colunas].set_axis(pd.Index(chaves, name=COL_CIRCUITO), axis=0)
+        linhas = linhas[linhas.index.notna()]
+
+        repetidos = linhas.index.duplicated(keep=False)
+        duplicados = relatorio_duplicados(linhas[repetidos])
+        if politica == "erro" and len(duplicados):
+            raise ConflitoCircuitos(duplicados)
+
+        if politica == "maior_valor" and COL_VALOR_CONTRATADO in linhas.columns:
+            valor = pd.to_numeric(linhas[COL_VALOR_CONTRATADO], errors="coerce")
+            ordem = valor.reset_index(drop=True).sort_values(ascending=False, kind="stable", na_position="last").index
+            linhas = linhas.iloc[ordem]
+            linhas = linhas[~linhas.index.duplicated(keep="first")]
+        else:
+            linhas = linhas[~linhas.index.duplicated(keep="last" if politica == "ultima" else "first")]
+
+        return cls(linhas=linhas, duplicados=duplicados, politica=politica)
+
+    def presentes(self, chaves):
+        """Máscara das ``chaves`` (já normalizadas) que existem na Base."""
+        valores = chaves.to_numpy(dtype=object, na_value=None)
+        # Consulta direta ao set: mais rápida que Series.isin para chaves de texto,
+        # que reconstrói uma tabela hash a cada chamada
+        return np.fromiter(map(self.circuitos.__contains__, valores), dtype=bool, count=len(valores))
+
+    def diferencas(self, circuitos_previa):
+        """(circuitos da Base que faltam na Prévia, circuitos da Prévia que não estão na Base)."""
+        return self.circuitos - circuitos_previa, circuitos_previa - self.circuitos
+
+    def juntar(self, previa, chaves_previa, sufixo="_Base"):
+        """Acrescenta à Prévia as colunas da Base, buscadas pela chave do circuito.
+
+        Colunas que já existem na Prévia recebem ``sufixo``, como no ``merge``.
+        """
+        encontrados = self.linhas.reindex(chaves_previa.to_numpy())
+        encontrados.index = previa.index
+        encontrados.columns = [f"{c}{sufixo}" if c in previa.columns else c for c in encontrados.columns]
+        return pd.concat([previa, encontrados], axis=1).reset_index(drop=True)
+
+
+def relatorio_duplicados(repetidas):
+    """Uma linha por circuito repetido: ocorrências e se os valores divergem."""
+    if repetidas.empty:
+        return pd.DataFrame(columns=[COL_CIRCUITO, "Ocorrências", "Valores divergentes"])
+    grupos = repetidas.groupby(level=0, sort=True)
+    return pd.DataFrame({
+        "Ocorrências": grupos.size(),
+        "Valores divergentes": grupos.nunique(dropna=False).gt(1).any(axis=1),
+    }).rename_axis(COL_CIRCUITO).reset_index()
@@ -0,0 +1,277 @@
+"""Medição das etapas do pipeline: tempo de parede, tempo de CPU e memória.
+
+Feita para ficar ligada em produção. Cada etapa custa duas leituras de
+relógio e duas de ``/proc/self/status``, algumas dezenas de microssegundos;
+fora do modo exclusivo, cada etapa de nível mais alto também inicia e
+encerra a thread de amostragem (na ordem de 0,1 ms) e, enquanto dura, paga
+uma leitura de ``/proc/self/status`` a cada ``INTERVALO_AMOSTRAGEM_S``.
+O pico de memória depende de quem mais usa o processo:
+
+- por padrão (painel, com várias sessões e tarefas ao mesmo tempo), uma
+  thread amostra o RSS a cada ``INTERVALO_AMOSTRAGEM_S`` enquanto há etapa
+  aberta, e o pico de cada etapa é o maior RSS amostrado nela; picos mais
+  curtos que o intervalo podem escapar;
+- com ``exclusiva=True`` (linha de comando, benchmarks), no Linux o pico de
+  RSS do processo é zerado no início de cada etapa
+  (``/proc/self/clear_refs``) e o pico medido é exato; em outros sistemas
+  fica o pico do processo até o fim da etapa (``ru_maxrss``). Zerar o pico
+  do processo apagaria o de outras medições em andamento, por isso só
+  quando a instrumentação é a única do processo.
+
+A memória é a do processo inteiro, então sessões do Streamlit rodando ao
+mesmo tempo se misturam nos números; o tempo de CPU é o da thread que
+executa a etapa (processos auxiliares, como os da leitura paralela das
+abas, não entram).
+
+O perfil detalhado (cProfile ou pyinstrument) é opcional e tem custo real;
+quando pedido, cobre as etapas de nível mais alto.
+"""
+
+import datetime
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict, dataclass, replace
+
+import pandas as pd
+
+PERFILADORES = ("cprofile", "pyinstrument")
+
+_PROC_STATUS = "/proc/self/status"
+_PROC_CLEAR_REFS = "/proc/self/clear_refs"
+
+INTERVALO_AMOSTRAGEM_S = 0.02
+
+
+@dataclass
+class Medicao:
+    etapa: str
+    nivel: int
+    parede_s: float = 0.0
+    cpu_s: float = 0.0
+    pico_memoria_mb: float = 0.0
+    variacao_memoria_mb: float = 0.0
+    chamadas: int = 0
+
+
+def _memoria_proc():
+    """(RSS atual, pico de RSS) do processo em MB, de /proc/self/status."""
+    atual = pico = 0
+    with open(_PROC_STATUS, "rb") as f:
+        for linha in f:
+            if linha.startswith(b"VmRSS:"):
+                atual = int(linha.split()[1])
+            elif linha.startswith(b"VmHWM:"):
+                pico = int(linha.split()[1])
+    return atual / 1024, pico / 1024
+
+
+def _zerar_pico_proc():
+    with open(_PROC_CLEAR_REFS, "w") as f:
+        f.write("5")
+
+
+def _memoria_rusage():
+    import resource
+
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss vem em bytes no macOS e em KB nos demais
+    pico = pico / 1024 ** 2 if sys.platform == "darwin" else pico / 1024
+    return pico, pico
+
+
+def _detectar_memoria():
+    """(ler, zerar_pico) disponíveis nesta plataforma; ``zerar_pico`` pode ser None.
+
+    Só verifica se ``clear_refs`` aceita escrita, sem escrever: zerar o pico
+    do processo fica para as etapas em modo exclusivo.
+    """
+    try:
+        _memoria_proc()
+    except OSError:
+        pass
+    else:
+        return _memoria_proc, (_zerar_pico_proc if os.access(_PROC_CLEAR_REFS, os.W_OK) else None)
+    try:
+        _memoria_rusage()
+        return _memoria_rusage, None
+    except ImportError:
+        return (lambda: (0.0, 0.0)), None
+
+
+_ler_memoria, _zerar_pico = _detectar_memoria()
+
+
+class _Amostrador:
+    """Thread que leva o RSS atual para os picos das etapas abertas."""
+
+    def __init__(self, picos, trava):
+        self._picos = picos
+        self._trava = trava
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._executar, name="instrumentacao", daemon=True)
+        self._thread.start()
+
+    def _executar(self):
+        while not self._parar.wait(INTERVALO_AMOSTRAGEM_S):
+            atual = _ler_memoria()[0]
+            with self._trava:
+                for posicao, pico in enumerate(self._picos):
+                    if atual > pico:
+                        self._picos[posicao] = atual
+
+    def parar(self):
+        self._parar.set()
+        self._thread.join()
+
+
+class Instrumentacao:
+    """Medições de uma execução, etapa por etapa.
+
+    Etapas podem ser aninhadas (``nivel`` indica a profundidade) e repetidas
+    (os tempos se acumulam e ``chamadas`` conta as repetições).
+    ``ao_iniciar_etapa(nome)`` é chamada antes de cada etapa; é por ela que
+    as tarefas em segundo plano (``validacao.tarefas``) acompanham o
+    progresso e interrompem a execução quando canceladas. ``exclusiva``
+    indica que nada mais mede memória no processo (veja o início do módulo).
+    """
+
+    def __init__(self, perfilador=None, ao_iniciar_etapa=None, exclusiva=False):
+        if perfilador is not None and perfilador not in PERFILADORES:
+            raise ValueError(f"Perfilador desconhecido: {perfilador!r} (opções: {', '.join(PERFILADORES)})")
+        self.perfilador = perfilador
+        self.ao_iniciar_etapa = ao_iniciar_etapa
+        self.exclusiva = exclusiva
+        self.inicio = datetime.datetime.now().isoformat(timespec="seconds")
+        self.medicoes = {}
+        # Pico de memória já visto por cada etapa aberta (atualizado pelo
+        # amostrador, ou guardado antes que uma etapa interna zere o pico do processo)
+        self._picos_abertos = []
+        self._trava = threading.Lock()
+        self._amostrador = None
+        self._perfil = None
+
+    @contextmanager
+    def etapa(self, nome):
+        if self.ao_iniciar_etapa is not None:
+            self.ao_iniciar_etapa(nome)
+        medicao = self.medicoes.get(nome)
+        if medicao is None:
+            medicao = self.medicoes[nome] = Medicao(nome, nivel=len(self._picos_abertos))
+        externa = not self._picos_abertos
+        if self.exclusiva and not externa:
+            self._picos_abertos[-1] = max(self._picos_abertos[-1], _ler_memoria()[1])
+        if externa and self.perfilador:
+            self._ligar_perfil()
+        if self.exclusiva and _zerar_pico is not None:
+            _zerar_pico()
+        memoria_inicio = _ler_memoria()[0]
+        with self._trava:
+            self._picos_abertos.append(memoria_inicio)
+        if externa and not self.exclusiva:
+            self._amostrador = _Amostrador(self._picos_abertos, self._trava)
+        parede, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield medicao
+        finally:
+            medicao.parede_s += time.perf_counter() - parede
+            medicao.cpu_s += time.thread_time() - cpu
+            memoria, pico_processo = _ler_memoria()
+            with self._trava:
+                pico = max(memoria, self._picos_abertos.pop())
+                if self.exclusiva:
+                    pico = max(pico, pico_processo)
+                if self._picos_abertos:
+                    self._picos_abertos[-1] = max(self._picos_abertos[-1], pico)
+            medicao.pico_memoria_mb = max(medicao.pico_memoria_mb, pico)
+            medicao.variacao_memoria_mb += memoria - memoria_inicio
+            medicao.chamadas += 1
+            if externa:
+                if self._amostrador is not None:
+                    self._amostrador.parar()
+                    self._amostrador = None
+                if self.perfilador:
+                    self._desligar_perfil()
+
+    def _ligar_perfil(self):
+        if self.perfilador == "cprofile":
+            import cProfile
+
+            self._perfil = self._perfil or cProfile.Profile()
+            self._perfil.enable()
+        else:
+            from pyinstrument import Profiler
+
+            self._perfil = self._perfil or Profiler()
+            self._perfil.start()
+
+    def _desligar_perfil(self):
+        if self.perfilador == "cprofile":
+            self._perfil.disable()
+        else:
+            self._perfil.stop()
+
+    def perfil(self):
+        """(extensão, bytes) do perfil detalhado, ou None se não houve perfil.
+
+        cProfile gera um ``.prof`` (abre com ``pstats``, snakeviz etc.);
+        pyinstrument gera um relatório ``.html``.
+        """
+        if self._perfil is None:
+            return None
+        if self.perfilador == "cprofile":
+            # Mesmo formato de Profile.dump_stats, sem passar por arquivo
+            self._perfil.create_stats()
+            return "prof", marshal.dumps(self._perfil.stats)
+        return "html", self._perfil.output_html().encode()
+
+    def incorporar(self, outra):
+        """Acrescenta as medições (e o perfil) de ``outra``, por exemplo a de
+        uma tarefa em segundo plano, às desta execução."""
+        for nome, medicao in outra.medicoes.items():
+            if nome not in self.medicoes:
+                self.medicoes[nome] = replace(medicao)
+        if self._perfil is None and outra.perfilador == self.perfilador:
+            self._perfil = outra._perfil
+
+    def tempos(self, etapas=None):
+        """``{etapa: segundos de parede}``, de todas ou só das ``etapas``."""
+        return {
+            nome: medicao.parede_s
+            for nome, medicao in self.medicoes.items()
+            if etapas is None or nome in etapas
+        }
+
+    def total(self):
+        """Totais das etapas de nível mais alto (as internas já estão contidas nelas)."""
+        externas = [m for m in self.medicoes.values() if m.nivel == 0]
+        return {
+            "parede_s": sum(m.parede_s for m in externas),
+            "cpu_s": sum(m.cpu_s for m in externas),
+            "pico_memoria_mb": max((m.pico_memoria_mb for m in externas), default=0.0),
+        }
+
+    def tabela(self):
+        return pd.DataFrame(
+            [asdict(m) for m in self.medicoes.values()],
+            columns=list(Medicao.__dataclass_fields__),
+        )
+
+    def como_dict(self):
+        return {
+            "inicio": self.inicio,
+            "total": self.total(),
+            "etapas": [asdict(m) for m in self.medicoes.values()],
+        }
+
+    def para_json(self):
+        return json.dumps(self.como_dict(), ensure_ascii=False, indent=2)
+
+
+def medir(instrumentacao, nome):
+    """``instrumentacao.etapa(nome)``, ou nada se ``instrumentacao`` for None."""
+    return instrumentacao.etapa(nome) if instrumentacao is not None else nullcontext()
@@ -0,0 +1,295 @@
+"""Leitura e normalização dos arquivos Excel da Prévia e da Base.
+
+A Base costuma ter dezenas de abas e muitas colunas, mas a validação só usa
+``Circuito``, as colunas F e G e ``Valor Contratado``. ``ler_base`` lê
+apenas essas colunas (projeção) e pode processar as abas em paralelo num
+pool de processos. Motores disponíveis:
+
+- ``"calamine"``: leitor em Rust (pacote opcional ``python-calamine``);
+- ``"openpyxl_stream"``: openpyxl em modo ``read_only`` percorrendo as linhas
+  e guardando só as colunas necessárias;
+- ``"padrao"``: ``pd.read_excel`` de todas as colunas, como antes.
+
+``"auto"`` escolhe calamine quando instalado e, caso contrário, o streaming
+do openpyxl.
+"""
+
+import atexit
+import importlib.util
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from validacao.colunas import COL_CIRCUITO, COL_VALOR_CONTRATADO, COLUNAS_PORCENTAGEM
+from validacao.instrumentacao import medir
+
+MOTORES_LEITURA = ("auto", "calamine", "openpyxl_stream", "padrao")
+
+# Abaixo deste tamanho o custo de subir os processos não compensa
+MIN_BYTES_PARALELO = 2 * 1024 ** 2
+
+# Um pool por processo, com um worker por CPU, compartilhado por todas as
+# leituras (sessões e tarefas em segundo plano); só é recriado se quebrar
+# (um worker morto, por exemplo pelo OOM killer)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def calamine_disponivel():
+    return importlib.util.find_spec("python_calamine") is not None
+
+
+def resolver_motor(motor="auto"):
+    if motor not in MOTORES_LEITURA:
+        raise ValueError(f"Motor de leitura desconhecido: {motor!r} (opções: {', '.join(MOTORES_LEITURA)})")
+    if motor == "auto":
+        return "calamine" if calamine_disponivel() else "openpyxl_stream"
+    if motor == "calamine" and not calamine_disponivel():
+        raise ImportError("O motor 'calamine' requer o pacote python-calamine (pip install python-calamine)")
+    return motor
+
+
+def _engine_pandas(motor):
+    return "calamine" if motor == "calamine" else "openpyxl"
+
+
+def normalizar_porcentagens(previa):
+    # Garantir que as colunas de porcentagem sejam tratadas como decimais
+    for col in COLUNAS_PORCENTAGEM:
+        if col in previa.columns:
+            previa[col] = pd.to_numeric(previa[col], errors='coerce')
+            if (previa[col] > 1).any():
+                previa[col] = previa[col] / 100
+    return previa
+
+
+def ler_previa(arquivo, motor="auto"):
+    """Lê a Prévia, remove espaços dos cabeçalhos e normaliza as porcentagens."""
+    motor = resolver_motor(motor)
+    previa = pd.read_excel(arquivo, engine=_engine_pandas(motor))
+    previa.columns = previa.columns.str.strip()
+    return normalizar_porcentagens(previa)
+
+
+def colunas_necessarias(cabecalho):
+    """Nomes (sem espaços) das colunas da Base usadas na validação.
+
+    ``Circuito`` e ``Valor Contratado`` pelo nome; F e G pela posição no
+    cabeçalho da primeira aba, como no consolidado de todas as abas.
+    """
+    cabecalho = [str(c).strip() for c in cabecalho]
+    colunas_fg = cabecalho[5:7]
+    necessarias = [COL_CIRCUITO] + colunas_fg + [COL_VALOR_CONTRATADO]
+    return list(dict.fromkeys(necessarias)), colunas_fg
+
+
+def _ler_aba_pandas(caminho, aba, motor, necessarias):
+    usecols = None
+    if necessarias is not None:
+        necessarias = set(necessarias)
+        usecols = lambda coluna: str(coluna).strip() in necessarias  # noqa: E731
+    return pd.read_excel(caminho, sheet_name=aba, engine=_engine_pandas(motor), usecols=usecols)
+
+
+def _blocos_aba_openpyxl(caminho, aba, necessarias, linhas_por_bloco=None):
+    """Percorre a aba em modo ``read_only`` guardando só as colunas
+    ``necessarias``; gera DataFrames de até ``linhas_por_bloco`` linhas (a aba
+    inteira num bloco só, se omitido)."""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        linhas = wb[aba].iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            yield pd.DataFrame()
+            return
+        necessarias = set(necessarias)
+        indices = [i for i, c in enumerate(cabecalho) if c is not None and str(c).strip() in necessarias]
+
+        def bloco(valores):
+            return pd.DataFrame({cabecalho[i]: lista for i, lista in zip(indices, valores)})
+
+        valores = [[] for _ in indices]
+        no_bloco = 0
+        # Linhas vazias só entram se houver dados depois delas (como no read_excel)
+        vazias_pendentes = 0
+        for linha in linhas:
+            if all(v is None for v in linha):
+                vazias_pendentes += 1
+                continue
+            for lista in valores:
+                lista.extend([None] * vazias_pendentes)
+            no_bloco += vazias_pendentes + 1
+            vazias_pendentes = 0
+            for i, lista in zip(indices, valores):
+                lista.append(linha[i] if i < len(linha) else None)
+            if linhas_por_bloco and no_bloco >= linhas_por_bloco:
+                yield bloco(valores)
+                valores = [[] for _ in indices]
+                no_bloco = 0
+        if no_bloco or not linhas_por_bloco:
+            yield bloco(valores)
+    finally:
+        wb.close()
+
+
+def _ler_aba_openpyxl_stream(caminho, aba, necessarias):
+    return next(_blocos_aba_openpyxl(caminho, aba, necessarias))
+
+
+def _ler_aba(caminho, aba, motor, necessarias):
+    if motor == "openpyxl_stream":
+        return _ler_aba_openpyxl_stream(caminho, aba, necessarias)
+    return _ler_aba_pandas(caminho, aba, motor, necessarias)
+
+
+def _obter_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # forkserver evita herdar as threads do servidor Streamlit num fork
+            metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context(metodo))
+        return _pool
+
+
+def _descartar_pool(quebrado):
+    """Tira do caminho um pool quebrado (se outra thread ainda não o trocou)."""
+    global _pool
+    with _pool_lock:
+        if _pool is quebrado:
+            _pool = None
+    quebrado.shutdown(wait=False, cancel_futures=True)
+
+
+def _ler_abas_em_paralelo(caminho, abas, motor, necessarias, processos):
+    """Lê as abas no pool compartilhado com no máximo ``processos`` abas em
+    andamento por vez (o paralelismo da leitura é limitado pelo que é
+    submetido, não pelo tamanho do pool).
+
+    Se o pool quebrar, ele é recriado e a leitura repetida uma vez; se
+    quebrar de novo, as abas são lidas aqui mesmo, em série.
+    """
+    for _ in range(2):
+        pool = _obter_pool()
+        try:
+            return _ler_abas_no_pool(pool, caminho, abas, motor, necessarias, processos)
+        except BrokenProcessPool:
+            _descartar_pool(pool)
+    return [_ler_aba(caminho, aba, motor, necessarias) for aba in abas]
+
+
+def _ler_abas_no_pool(pool, caminho, abas, motor, necessarias, processos):
+    partes = [None] * len(abas)
+    pendentes = {}
+    for posicao, aba in enumerate(abas):
+        if len(pendentes) >= processos:
+            concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                partes[pendentes.pop(futuro)] = futuro.result()
+        pendentes[pool.submit(_ler_aba, caminho, aba, motor, necessarias)] = posicao
+    for futuro, posicao in pendentes.items():
+        partes[posicao] = futuro.result()
+    return partes
+
+
+@atexit.register
+def _encerrar_pool():
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _como_caminho(arquivo):
+    """Devolve (caminho, temporário) para que os processos possam abrir o arquivo."""
+    if isinstance(arquivo, (str, os.PathLike)):
+        return os.fspath(arquivo), None
+    if hasattr(arquivo, "getvalue"):
+        dados = arquivo.getvalue()
+    else:
+        arquivo.seek(0)
+        dados = arquivo.read()
+    fd, caminho = tempfile.mkstemp(suffix=".xlsx")
+    with os.fdopen(fd, "wb") as f:
+        f.write(dados)
+    return caminho, caminho
+
+
+def ler_base_em_blocos(arquivo, linhas_por_bloco=50_000):
+    """Lê a Base aba por aba em blocos de até ``linhas_por_bloco`` linhas, já
+    projetados nas colunas usadas na validação (streaming do openpyxl).
+
+    Devolve (``colunas_fg``, gerador de blocos); nunca há mais de um bloco
+    em memória. Usado pelo modo em disco (``validacao.em_disco``).
+    """
+    caminho, temporario = _como_caminho(arquivo)
+    try:
+        with pd.ExcelFile(caminho, engine="openpyxl") as xls:
+            abas = xls.sheet_names
+            cabecalho = xls.parse(abas[0], nrows=0).columns
+    except Exception:
+        if temporario:
+            os.remove(temporario)
+        raise
+    necessarias, colunas_fg = colunas_necessarias(cabecalho)
+
+    def blocos():
+        try:
+            for aba in abas:
+                for bloco in _blocos_aba_openpyxl(caminho, aba, necessarias, linhas_por_bloco):
+                    bloco.columns = bloco.columns.map(lambda c: str(c).strip())
+                    yield bloco
+        finally:
+            if temporario:
+                os.remove(temporario)
+
+    return colunas_fg, blocos()
+
+
+def ler_base(arquivo, motor="auto", projetar=True, processos=None, instrumentacao=None):
+    """Lê todas as abas da Base e devolve um único DataFrame consolidado.
+
+    Com ``projetar=True`` só as colunas usadas na validação são lidas e os
+    nomes das colunas F/G ficam em ``base.attrs["colunas_fg"]``. As abas são
+    lidas em paralelo em até ``processos`` processos (padrão: número de CPUs)
+    quando o arquivo é grande o bastante; ``processos=1`` força leitura serial.
+    A leitura das abas e a concatenação são medidas em ``instrumentacao``.
+    """
+    motor = resolver_motor(motor)
+
+    if motor == "padrao" or not projetar:
+        with medir(instrumentacao, "leitura_abas_base"):
+            abas_base = pd.read_excel(arquivo, sheet_name=None, engine=_engine_pandas(motor))
+        with medir(instrumentacao, "concat_base"):
+            base_all = pd.concat(abas_base.values(), ignore_index=True)
+        base_all.columns = base_all.columns.str.strip()
+        return base_all
+
+    caminho, temporario = _como_caminho(arquivo)
+    try:
+        with pd.ExcelFile(caminho, engine=_engine_pandas(motor)) as xls:
+            abas = xls.sheet_names
+            cabecalho = xls.parse(abas[0], nrows=0).columns
+        necessarias, colunas_fg = colunas_necessarias(cabecalho)
+
+        processos = min(processos or os.cpu_count() or 1, len(abas))
+        with medir(instrumentacao, "leitura_abas_base"):
+            if processos > 1 and os.path.getsize(caminho) >= MIN_BYTES_PARALELO:
+                partes = _ler_abas_em_paralelo(caminho, abas, motor, necessarias, processos)
+            else:
+                partes = [_ler_aba(caminho, aba, motor, necessarias) for aba in abas]
+    finally:
+        if temporario:
+            os.remove(temporario)
+
+    with medir(instrumentacao, "concat_base"):
+        base_all = pd.concat(partes, ignore_index=True)
+    base_all.columns = base_all.columns.str.strip()
+    base_all.attrs["colunas_fg"] = colunas_fg
+    return base_all
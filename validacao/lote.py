@@ -0,0 +1,241 @@
+"""Validação em lote: vários pares Prévia/Base processados em paralelo.
+
+Os pares são montados pelo nome dos arquivos (de vários uploads, de um .zip
+ou de um diretório): ``previa_<contrato>.xlsx`` com ``base_<contrato>.xlsx``,
+ou ``<contrato>/previa.xlsx`` com ``<contrato>/base.xlsx``. Cada par roda o
+pipeline completo num processo separado.
+
+Uso pela linha de comando::
+
+    python -m validacao.lote pares.zip --saida resultados/
+"""
+
+import argparse
+import multiprocessing
+import os
+import posixpath
+import re
+import sys
+import time
+import traceback
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from io import BytesIO
+
+import pandas as pd
+
+from validacao.indice import POLITICAS_CONFLITO
+from validacao.instrumentacao import Instrumentacao
+from validacao.leitura import MOTORES_LEITURA, ler_base, ler_previa
+from validacao.motor import validar
+
+_PAPEL = re.compile(r"(^|[_\-\s.])(pr[eé]via|base)($|[_\-\s.])", re.IGNORECASE)
+
+
+@dataclass
+class Par:
+    nome: str
+    previa: bytes
+    base: bytes
+
+
+@dataclass
+class ResultadoPar:
+    nome: str
+    resumo: dict = field(default_factory=dict)
+    tempos: dict = field(default_factory=dict)
+    erro: str = ""
+
+    @property
+    def ok(self):
+        return not self.erro
+
+
+def _papel_e_nome(caminho):
+    """('previa' | 'base' | None, nome do par) a partir do caminho do arquivo."""
+    diretorio, arquivo = posixpath.split(caminho.replace("\\", "/"))
+    raiz = posixpath.splitext(arquivo)[0]
+    encontrado = _PAPEL.search(raiz)
+    if not encontrado:
+        return None, ""
+    papel = "base" if encontrado.group(2).lower() == "base" else "previa"
+    nome = (raiz[:encontrado.start()] + encontrado.group(1) + raiz[encontrado.end():]).strip("_- .")
+    if not nome:
+        nome = posixpath.basename(diretorio)
+    return papel, nome or "par"
+
+
+def parear_arquivos(arquivos):
+    """Monta os pares a partir de ``{caminho: bytes}``.
+
+    Devolve (pares, avisos); arquivos sem par ou sem papel reconhecido
+    entram nos avisos.
+    """
+    previas, bases, avisos = {}, {}, []
+    for caminho, dados in sorted(arquivos.items()):
+        papel, nome = _papel_e_nome(caminho)
+        if papel is None:
+            avisos.append(f"{caminho}: nome sem 'previa' ou 'base', ignorado")
+            continue
+        # O nome do par não diferencia maiúsculas ("Previa_A" casa com "base_a")
+        destino = previas if papel == "previa" else bases
+        chave = nome.casefold()
+        if chave in destino:
+            avisos.append(f"{caminho}: mais de uma {papel} para '{nome}', ignorado")
+            continue
+        destino[chave] = (nome, dados)
+
+    pares = [
+        Par(previas[chave][0], previas[chave][1], bases[chave][1])
+        for chave in sorted(previas.keys() & bases.keys())
+    ]
+    for chave in sorted(previas.keys() ^ bases.keys()):
+        falta = "base" if chave in previas else "prévia"
+        nome = (previas.get(chave) or bases.get(chave))[0]
+        avisos.append(f"'{nome}': sem {falta} correspondente, ignorado")
+    return pares, avisos
+
+
+def extrair_zip(dados):
+    """``{caminho: bytes}`` das planilhas .xlsx dentro de um .zip."""
+    arquivos = {}
+    with zipfile.ZipFile(BytesIO(dados)) as zf:
+        for info in zf.infolist():
+            nome = info.filename
+            if info.is_dir() or not nome.lower().endswith(".xlsx"):
+                continue
+            if nome.startswith("__MACOSX/") or posixpath.basename(nome).startswith(("~$", "._")):
+                continue
+            arquivos[nome] = zf.read(info)
+    return arquivos
+
+
+def ler_diretorio(diretorio):
+    arquivos = {}
+    for raiz, _, nomes in os.walk(diretorio):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            if nome.lower().endswith(".zip"):
+                with open(caminho, "rb") as f:
+                    arquivos.update(extrair_zip(f.read()))
+            elif nome.lower().endswith(".xlsx") and not nome.startswith("~$"):
+                with open(caminho, "rb") as f:
+                    arquivos[os.path.relpath(caminho, diretorio)] = f.read()
+    return arquivos
+
+
+def processar_par(par, motor="auto", politica_conflito="primeira"):
+    """Pipeline completo de um par; erros viram ``ResultadoPar.erro``."""
+    instrumentacao = Instrumentacao()
+    try:
+        with instrumentacao.etapa("leitura_previa"):
+            previa = ler_previa(BytesIO(par.previa), motor=motor)
+        with instrumentacao.etapa("leitura_base"):
+            # Já estamos num processo do lote: sem pool aninhado
+            base = ler_base(BytesIO(par.base), motor=motor, processos=1)
+        resultado = validar(previa, base, politica_conflito, instrumentacao=instrumentacao)
+    except Exception as e:
+        return ResultadoPar(par.nome, erro=f"{type(e).__name__}: {e}", tempos=instrumentacao.tempos())
+    tempos = instrumentacao.tempos()
+    resumo = {chave: valor.item() if hasattr(valor, "item") else valor for chave, valor in resultado.resumo.items()}
+    return ResultadoPar(par.nome, resumo=resumo, tempos=tempos)
+
+
+def processar_lote(pares, processos=None, motor="auto", politica_conflito="primeira", progresso=None):
+    """Processa os pares em paralelo; ``progresso(concluidos, total, resultado)`` a cada par.
+
+    Os resultados voltam na ordem dos ``pares``.
+    """
+    processos = max(1, min(processos or os.cpu_count() or 1, len(pares)))
+    resultados = {}
+
+    if processos == 1:
+        for par in pares:
+            resultados[par.nome] = processar_par(par, motor, politica_conflito)
+            if progresso:
+                progresso(len(resultados), len(pares), resultados[par.nome])
+    else:
+        metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context(metodo)) as pool:
+            futuros = {pool.submit(processar_par, par, motor, politica_conflito): par for par in pares}
+            for futuro in as_completed(futuros):
+                par = futuros[futuro]
+                try:
+                    resultado = futuro.result()
+                except Exception:
+                    resultado = ResultadoPar(par.nome, erro=traceback.format_exc(limit=1).strip())
+                resultados[par.nome] = resultado
+                if progresso:
+                    progresso(len(resultados), len(pares), resultado)
+
+    return [resultados[par.nome] for par in pares]
+
+
+def resumo_combinado(resultados):
+    """Uma linha por par (colunas do ``resumo``) e uma linha TOTAL no final."""
+    linhas = []
+    for resultado in resultados:
+        linha = {"Par": resultado.nome, "Erro": resultado.erro}
+        linha.update(resultado.resumo)
+        linha["Tempo (s)"] = sum(resultado.tempos.values())
+        linhas.append(linha)
+    df = pd.DataFrame(linhas)
+    numericas = df.drop(columns=["Par", "Erro"]).select_dtypes("number").columns
+    total = {"Par": "TOTAL", "Erro": f"{sum(not r.ok for r in resultados)} com erro"}
+    total.update(df[numericas].sum())
+    combinado = pd.concat([df, pd.DataFrame([total])], ignore_index=True)
+    # Contagens continuam inteiras mesmo com linhas de erro (vazias)
+    return combinado.convert_dtypes(convert_string=False, convert_boolean=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m validacao.lote",
+        description="Valida vários pares Prévia/Base em paralelo.",
+    )
+    parser.add_argument("entrada", nargs="+", help="Arquivos .zip, .xlsx ou diretórios com os pares")
+    parser.add_argument("--saida", default=".", help="Diretório de saída (padrão: diretório atual)")
+    parser.add_argument("--processos", type=int, default=None, help="Processos em paralelo (padrão: número de CPUs)")
+    parser.add_argument("--motor", choices=MOTORES_LEITURA, default="auto", help="Motor de leitura do Excel")
+    parser.add_argument("--conflito", choices=POLITICAS_CONFLITO, default="primeira",
+                        help="Linha da Base usada quando um circuito se repete")
+    args = parser.parse_args(argv)
+
+    arquivos = {}
+    for entrada in args.entrada:
+        if os.path.isdir(entrada):
+            arquivos.update(ler_diretorio(entrada))
+        else:
+            with open(entrada, "rb") as f:
+                dados = f.read()
+            if entrada.lower().endswith(".zip"):
+                arquivos.update(extrair_zip(dados))
+            else:
+                arquivos[os.path.basename(entrada)] = dados
+
+    pares, avisos = parear_arquivos(arquivos)
+    for aviso in avisos:
+        print(f"Aviso: {aviso}", file=sys.stderr)
+    if not pares:
+        print("Nenhum par Prévia/Base encontrado.", file=sys.stderr)
+        return 1
+
+    inicio = time.perf_counter()
+
+    def progresso(concluidos, total, resultado):
+        situacao = "ok" if resultado.ok else f"ERRO {resultado.erro}"
+        print(f"[{concluidos}/{total}] {resultado.nome}: {situacao}")
+
+    resultados = processar_lote(pares, args.processos, args.motor, args.conflito, progresso)
+    resumo = resumo_combinado(resultados)
+
+    os.makedirs(args.saida, exist_ok=True)
+    caminho = os.path.join(args.saida, "resumo_lote.csv")
+    resumo.to_csv(caminho, index=False, encoding="utf-8-sig")
+    print(f"{len(pares)} pares em {time.perf_counter() - inicio:.1f} s; resumo em {caminho}")
+    return 0 if all(r.ok for r in resultados) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+"""Representação compacta da Prévia validada e relatório de memória por coluna.
+
+A Prévia validada fica na sessão do Streamlit enquanto o analista trabalha,
+então o pico de RSS por sessão depende dela. ``compactar`` troca os tipos
+largos por equivalentes menores sem mudar nenhum valor:
+
+- texto com poucos valores distintos (Velocidade, UF...) vira ``category``;
+  o resto vira texto em Arrow, em vez de um objeto Python por célula;
+- números de ponto flutuante passam a float32 só quando a conversão é exata.
+  As colunas de dinheiro ficam em float64: o float32 arredonda os centavos e
+  soma com pouca precisão, e os totais vão para a fatura.
+"""
+
+import numpy as np
+import pandas as pd
+
+from validacao.colunas import COL_VALOR_CONTRATADO
+
+# Colunas que nunca saem de float64 (ver docstring do módulo)
+COLUNAS_DINHEIRO = (COL_VALOR_CONTRATADO, "Penalidade", "Desconto_Alternativo", "Desconto Alternativo", "Valor Final")
+
+# Fração máxima de valores distintos para um texto virar categoria
+LIMITE_CATEGORIA = 0.5
+_AMOSTRA_CATEGORIA = 10_000
+
+# Texto em Arrow com vazios como NaN (o padrão do pandas 3)
+_TIPO_TEXTO = pd.StringDtype("pyarrow", na_value=np.nan)
+
+
+def _poucos_distintos(serie):
+    # Amostra primeiro: em colunas quase únicas (Circuito, Endereço) evita
+    # montar as categorias da coluna inteira só para descartá-las
+    amostra = serie.iloc[:_AMOSTRA_CATEGORIA]
+    if amostra.nunique() > LIMITE_CATEGORIA * len(amostra):
+        return False
+    return serie.nunique() <= LIMITE_CATEGORIA * len(serie)
+
+
+def _float32_exato(serie):
+    valores = serie.to_numpy()
+    convertidos = valores.astype(np.float32)
+    with np.errstate(over="ignore", invalid="ignore"):
+        return np.array_equal(convertidos.astype(np.float64), valores, equal_nan=True)
+
+
+def compactar_coluna(serie):
+    """``serie`` no menor tipo que guarda os mesmos valores (ou ela mesma)."""
+    if isinstance(serie.dtype, pd.CategoricalDtype) or serie.name in COLUNAS_DINHEIRO:
+        return serie
+    if serie.dtype == np.float64:
+        return serie.astype(np.float32) if _float32_exato(serie) else serie
+    texto = pd.api.types.is_string_dtype(serie.dtype)
+    if serie.dtype == object:
+        # Colunas F/G podem misturar números e textos; essas ficam como estão
+        texto = pd.api.types.infer_dtype(serie, skipna=True) in ("string", "empty")
+    if not texto:
+        return serie
+    if _poucos_distintos(serie):
+        return serie.astype("category")
+    return serie if serie.dtype == _TIPO_TEXTO else serie.astype(_TIPO_TEXTO)
+
+
+def compactar(df):
+    """Cópia de ``df`` com cada coluna compactada (ver ``compactar_coluna``).
+
+    As colunas que não mudam de tipo não são copiadas (copy-on-write).
+    """
+    compacto = df.copy(deep=False)
+    for col in df.columns:
+        serie = df[col]
+        nova = compactar_coluna(serie)
+        if nova is not serie:
+            compacto[col] = nova
+    return compacto
+
+
+def bytes_por_coluna(df):
+    """Bytes ocupados por coluna, contando o conteúdo dos textos."""
+    return df.memory_usage(index=False, deep=True)
+
+
+def relatorio_memoria(antes, depois):
+    """Tabela por coluna: tipo e bytes em ``antes`` e em ``depois``, a
+    economia e uma linha de TOTAL."""
+    tabela = pd.DataFrame({
+        "Tipo antes": antes.dtypes.astype(str),
+        "Bytes antes": bytes_por_coluna(antes),
+        "Tipo depois": depois.dtypes.astype(str),
+        "Bytes depois": bytes_por_coluna(depois),
+    })
+    tabela.loc["TOTAL"] = ["", tabela["Bytes antes"].sum(), "", tabela["Bytes depois"].sum()]
+    tabela[["Bytes antes", "Bytes depois"]] = tabela[["Bytes antes", "Bytes depois"]].astype("int64")
+    tabela["Economia"] = 1 - tabela["Bytes depois"] / tabela["Bytes antes"].where(tabela["Bytes antes"] > 0)
+    return tabela.rename_axis("Coluna").reset_index()
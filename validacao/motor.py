@@ -0,0 +1,232 @@
+"""Motor de validação Prévia x Base, independente do Streamlit.
+
+O painel e a linha de comando (``python -m validacao``) chamam ``validar``;
+aqui ficam a classificação de SLA, o status dos circuitos, a junção com as
+colunas F/G da Base e o cálculo de ``Penalidade``/``Desconto_Alternativo``.
+"""
+
+from dataclasses import dataclass, field, replace
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from validacao.agregados import contar_categorias, histograma
+from validacao.colunas import (
+    COL_CIRCUITO,
+    COL_DISP_MENSAL,
+    COL_SLA_DISP,
+    COL_VALOR_CONTRATADO,
+)
+from validacao.faturamento import montar_faturamento, totais_faturamento
+from validacao.indice import IndiceCircuitos
+from validacao.instrumentacao import Instrumentacao
+from validacao.memoria import compactar, relatorio_memoria
+
+# Versão dos cálculos de ``validar``, parte da chave dos resultados em cache
+# (``validacao.cache.chave_cache_resultado``): mude sempre que, para as mesmas
+# entradas, o resultado mudar
+VERSAO_MOTOR = 1
+
+# Categorias na ordem dos códigos usados em np.select
+STATUS_SLA = ["Excedido", "Não Excedido", "Dados faltando"]
+STATUS_CIRCUITO = ["OK", "Extra na Prévia", "Circuito ausente"]
+
+ETAPAS_VALIDACAO = (
+    "indice_base", "classificacao_sla", "status_circuito", "juncao", "penalidades", "resumo", "compactacao",
+)
+
+
+@dataclass
+class Resultado:
+    """Saída de ``validar``: a Prévia consolidada e o resumo da validação."""
+
+    previa_final: pd.DataFrame
+    resumo: dict
+    faltantes_na_previa: set
+    extras_na_previa: set
+    duplicados_base: pd.DataFrame = None
+    tempos: dict = field(default_factory=dict)
+    # Entradas da validação, guardadas para a revalidação incremental
+    previa: pd.DataFrame = None
+    indice: IndiceCircuitos = None
+    # Bytes por coluna da Prévia validada antes e depois de ``compactar``
+    memoria: pd.DataFrame = None
+    # Histogramas já calculados (ver ``histograma_faturamento``)
+    _histogramas: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    # Visões derivadas, montadas só quando alguém pede e guardadas no próprio
+    # resultado: enquanto ele não muda, pedir de novo não custa nada
+    @cached_property
+    def faturamento(self):
+        """Planilha de faturamento (ver ``validacao.faturamento``)."""
+        return montar_faturamento(self.previa_final)
+
+    @cached_property
+    def totais_faturamento(self):
+        return totais_faturamento(self.faturamento)
+
+    @cached_property
+    def contagens(self):
+        """Linhas por ``Status_Circuito`` e por ``SLA_Status``, para os gráficos."""
+        return {col: contar_categorias(self.previa_final[col]) for col in ("Status_Circuito", "SLA_Status")}
+
+    def histograma_faturamento(self, coluna, faixas=20):
+        """Faixas de ``coluna`` do faturamento (ver ``validacao.agregados``), guardadas por (coluna, faixas)."""
+        chave = (coluna, faixas)
+        if chave not in self._histogramas:
+            self._histogramas[chave] = histograma(self.faturamento[coluna], faixas)
+        return self._histogramas[chave]
+
+    def compartilhavel(self):
+        """Cópia para o cache compartilhado entre sessões: sem o índice da Base
+        (grande, e ligado a um banco no modo em disco), que a revalidação
+        incremental remonta se precisar."""
+        return replace(self, indice=None)
+
+
+def colunas_base(base):
+    """Colunas da Base levadas para a Prévia: F, G e Valor Contratado."""
+    # Colunas F e G da base (posições 5 e 6, zero-indexed); numa Base lida
+    # com projeção as posições originais se perdem e os nomes vêm em attrs
+    colunas_fg = base.attrs.get("colunas_fg") or list(base.columns[5:7])
+    colunas = [c for c in colunas_fg if c in base.columns and c != COL_CIRCUITO]
+    if COL_VALOR_CONTRATADO in base.columns and COL_VALOR_CONTRATADO not in colunas:
+        colunas.append(COL_VALOR_CONTRATADO)
+    return colunas
+
+
+def indexar_base(base, politica_conflito="primeira"):
+    """Índice de circuitos da Base (ver ``validacao.indice``)."""
+    if not isinstance(base, pd.DataFrame):
+        # Base em disco (``validacao.em_disco``): o índice é montado em SQL
+        return base.indexar(politica_conflito)
+    chaves = chaves_circuito(base[COL_CIRCUITO])
+    return IndiceCircuitos.construir(base, colunas_base(base), chaves, politica_conflito)
+
+
+def chaves_circuito(circuitos):
+    """Chaves normalizadas (texto sem espaços nas pontas); ausentes continuam NaN."""
+    return circuitos.astype(str).str.strip().where(circuitos.notna())
+
+
+def _categorias(codigos, categorias, index):
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=categorias), index=index)
+
+
+def classificar_sla(previa):
+    """``SLA_Status`` de cada linha: Excedido, Não Excedido ou Dados faltando."""
+    if COL_DISP_MENSAL not in previa.columns or COL_SLA_DISP not in previa.columns:
+        return _categorias(np.full(len(previa), 2), STATUS_SLA, previa.index)
+
+    disp = previa[COL_DISP_MENSAL]
+    sla = previa[COL_SLA_DISP]
+    faltando = (disp.isna() | sla.isna()).to_numpy(dtype=bool)
+    excedido = (disp < sla).to_numpy(dtype=bool, na_value=False)
+    codigos = np.select([faltando, excedido], [2, 0], default=1)
+    return _categorias(codigos, STATUS_SLA, previa.index)
+
+
+def status_circuitos(chaves, na_base):
+    """``Status_Circuito`` dadas as chaves e a máscara das que existem na Base."""
+    ausente = chaves.isna().to_numpy(dtype=bool)
+    codigos = np.select([ausente, na_base], [2, 0], default=1)
+    return _categorias(codigos, STATUS_CIRCUITO, chaves.index)
+
+
+def calcular_penalidades(previa_final):
+    previa_final[COL_VALOR_CONTRATADO] = pd.to_numeric(previa_final[COL_VALOR_CONTRATADO], errors='coerce')
+
+    # Aplica as fórmulas apenas quando o SLA for excedido
+    condicao_sla_excedido = (previa_final["SLA_Status"] == "Excedido") & \
+                            (previa_final[COL_VALOR_CONTRATADO].notna()) & \
+                            (previa_final[COL_DISP_MENSAL].notna())
+
+    # Penalidade: (Valor Contratado × Disponibilidade) - Valor Contratado
+    previa_final["Penalidade"] = 0.0
+    previa_final.loc[condicao_sla_excedido, "Penalidade"] = \
+        (previa_final[COL_VALOR_CONTRATADO] * previa_final[COL_DISP_MENSAL]) - previa_final[COL_VALOR_CONTRATADO]
+
+    # Desconto alternativo: (1 - Disponibilidade) × Valor Contratado
+    previa_final["Desconto_Alternativo"] = 0.0
+    previa_final.loc[condicao_sla_excedido, "Desconto_Alternativo"] = \
+        (1 - previa_final[COL_DISP_MENSAL]) * previa_final[COL_VALOR_CONTRATADO]
+
+    return previa_final
+
+
+def montar_resumo(previa_final, total_linhas_base, faltantes_na_previa, extras_na_previa):
+    return {
+        "Total linhas prévia": len(previa_final),
+        "Total linhas base (todas abas)": total_linhas_base,
+        "SLA Excedido": (previa_final["SLA_Status"] == "Excedido").sum(),
+        "SLA Não Excedido": (previa_final["SLA_Status"] == "Não Excedido").sum(),
+        "SLA Dados faltando/erro": (~previa_final["SLA_Status"].isin(["Excedido", "Não Excedido"])).sum(),
+        "Circuitos extras na prévia": len(extras_na_previa),
+        "Circuitos faltando na prévia": len(faltantes_na_previa),
+        "Total Penalidade Calculada": previa_final["Penalidade"].sum(),
+        "Total Desconto Alternativo": previa_final["Desconto_Alternativo"].sum()
+    }
+
+
+def validar(previa, base, politica_conflito="primeira", indice=None, instrumentacao=None):
+    """Valida a Prévia contra a Base consolidada.
+
+    ``previa`` e ``base`` devem estar normalizadas como em
+    ``validacao.leitura`` (cabeçalhos sem espaços, porcentagens em 0-1).
+    Circuitos repetidos na Base são resolvidos por ``politica_conflito``
+    (ver ``validacao.indice.POLITICAS_CONFLITO``); um ``indice`` já montado
+    para esta Base pode ser reaproveitado. Nenhum dos dois DataFrames é
+    alterado. As etapas são medidas em ``instrumentacao`` (uma nova, se
+    omitida); ``Resultado.tempos`` traz o tempo de parede de cada uma.
+
+    A Prévia validada sai compactada (ver ``validacao.memoria``) e divide
+    com a ``previa`` as colunas que não mudam.
+    """
+    if instrumentacao is None:
+        instrumentacao = Instrumentacao()
+    entrada = previa
+    # Cópia rasa: as colunas novas não tocam a entrada e as originais só são
+    # copiadas se alguém as alterar (copy-on-write)
+    previa = previa.copy(deep=False)
+
+    with instrumentacao.etapa("indice_base"):
+        if indice is None:
+            indice = indexar_base(base, politica_conflito)
+
+    with instrumentacao.etapa("classificacao_sla"):
+        previa["SLA_Status"] = classificar_sla(previa)
+
+    with instrumentacao.etapa("status_circuito"):
+        chaves_previa = chaves_circuito(previa[COL_CIRCUITO])
+        circuitos_previa = set(chaves_previa.dropna().to_numpy(dtype=object))
+        previa["Status_Circuito"] = status_circuitos(chaves_previa, indice.presentes(chaves_previa))
+        faltantes_na_previa, extras_na_previa = indice.diferencas(circuitos_previa)
+
+    with instrumentacao.etapa("juncao"):
+        # Junta colunas F, G e Valor Contratado na prévia (uma linha da Base por circuito)
+        previa_final = indice.juntar(previa, chaves_previa)
+
+    with instrumentacao.etapa("penalidades"):
+        previa_final = calcular_penalidades(previa_final)
+
+    with instrumentacao.etapa("resumo"):
+        resumo = montar_resumo(previa_final, len(base), faltantes_na_previa, extras_na_previa)
+        resumo["Circuitos repetidos na base"] = len(indice.duplicados)
+
+    with instrumentacao.etapa("compactacao"):
+        compacta = compactar(previa_final)
+        memoria = relatorio_memoria(previa_final, compacta)
+        previa_final = compacta
+
+    return Resultado(
+        previa_final=previa_final,
+        resumo=resumo,
+        faltantes_na_previa=faltantes_na_previa,
+        extras_na_previa=extras_na_previa,
+        duplicados_base=indice.duplicados,
+        tempos=instrumentacao.tempos(ETAPAS_VALIDACAO),
+        previa=entrada,
+        indice=indice,
+        memoria=memoria,
+    )
@@ -0,0 +1,146 @@
+"""Armazém local de snapshots da Base em Parquet.
+
+A Base muda pouco de um mês para o outro; em vez de reenviar e reler o
+.xlsx a cada ciclo, a Base já consolidada (e projetada) é gravada uma vez
+como Parquet comprimido, identificado pelo mês de referência e pelo hash do
+arquivo original. Carregar um snapshot mapeia o arquivo em memória
+(``memory_map``) e leva uma fração de segundo.
+"""
+
+import datetime
+import json
+import os
+import re
+from dataclasses import dataclass
+
+import pandas as pd
+
+# Chave dos metadados do snapshot no schema do Parquet
+_CHAVE_METADADOS = b"validacao.snapshot"
+
+_PADRAO_MES = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+@dataclass
+class Snapshot:
+    id: str
+    mes: str
+    hash: str
+    nome_arquivo: str
+    linhas: int
+    criado_em: str
+    caminho: str
+    colunas_fg: list
+
+    @property
+    def rotulo(self):
+        return f"{self.mes} · {self.nome_arquivo or self.hash[:12]} · {self.linhas:,} linhas"
+
+
+def mes_atual():
+    return datetime.date.today().strftime("%Y-%m")
+
+
+def validar_mes(mes):
+    if not _PADRAO_MES.match(mes):
+        raise ValueError(f"Mês de referência deve estar no formato AAAA-MM, recebido {mes!r}")
+
+
+def tabela_arrow(base):
+    """Tabela Arrow de ``base``; colunas com tipos misturados viram texto."""
+    import pyarrow as pa
+
+    try:
+        return pa.Table.from_pandas(base, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # Colunas object com tipos misturados (ex.: números e textos na mesma
+        # coluna F) não têm tipo Arrow; viram texto, mantendo os vazios
+        base = base.copy(deep=False)
+        for col in base.columns:
+            if base[col].dtype == object:
+                base[col] = base[col].map(str, na_action="ignore")
+        return pa.Table.from_pandas(base, preserve_index=False)
+
+
+class ArmazemSnapshots:
+    """Snapshots da Base em ``diretorio``, um arquivo Parquet por mês/hash."""
+
+    def __init__(self, diretorio):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, snapshot_id):
+        return os.path.join(self.diretorio, f"{snapshot_id}.parquet")
+
+    @staticmethod
+    def gerar_id(mes, hash_arquivo):
+        return f"{mes}_{hash_arquivo[:16]}"
+
+    def existe(self, mes, hash_arquivo):
+        return os.path.exists(self._caminho(self.gerar_id(mes, hash_arquivo)))
+
+    def salvar(self, base, mes, hash_arquivo, nome_arquivo=""):
+        """Grava a Base como snapshot; se o mesmo mês/hash já existe, só o devolve."""
+        import pyarrow.parquet as pq
+
+        validar_mes(mes)
+
+        snapshot_id = self.gerar_id(mes, hash_arquivo)
+        caminho = self._caminho(snapshot_id)
+        if os.path.exists(caminho):
+            return self._ler_metadados(caminho)
+
+        metadados = {
+            "id": snapshot_id,
+            "mes": mes,
+            "hash": hash_arquivo,
+            "nome_arquivo": nome_arquivo,
+            "linhas": len(base),
+            "criado_em": datetime.datetime.now().isoformat(timespec="seconds"),
+            "colunas_fg": list(base.attrs.get("colunas_fg") or []),
+        }
+        tabela = tabela_arrow(base)
+        tabela = tabela.replace_schema_metadata({
+            **(tabela.schema.metadata or {}),
+            _CHAVE_METADADOS: json.dumps(metadados).encode(),
+        })
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        pq.write_table(tabela, temporario, compression="zstd")
+        os.replace(temporario, caminho)
+        return Snapshot(caminho=caminho, **metadados)
+
+    def _ler_metadados(self, caminho):
+        import pyarrow.parquet as pq
+
+        metadados = pq.read_schema(caminho).metadata or {}
+        return Snapshot(caminho=caminho, **json.loads(metadados[_CHAVE_METADADOS]))
+
+    def listar(self):
+        """Snapshots disponíveis, do mês mais recente para o mais antigo."""
+        snapshots = []
+        for nome in os.listdir(self.diretorio):
+            if not nome.endswith(".parquet"):
+                continue
+            try:
+                snapshots.append(self._ler_metadados(os.path.join(self.diretorio, nome)))
+            except (OSError, KeyError, ValueError):
+                continue
+        return sorted(snapshots, key=lambda s: (s.mes, s.criado_em), reverse=True)
+
+    def obter(self, snapshot_id):
+        """Metadados do snapshot (inclusive o caminho do Parquet), sem ler os dados."""
+        return self._ler_metadados(self._caminho(snapshot_id))
+
+    def carregar(self, snapshot_id):
+        """Base do snapshot, lida com o arquivo mapeado em memória."""
+        import pyarrow.parquet as pq
+
+        caminho = self._caminho(snapshot_id)
+        snapshot = self._ler_metadados(caminho)
+        base = pq.read_table(caminho, memory_map=True).to_pandas()
+        if snapshot.colunas_fg:
+            base.attrs["colunas_fg"] = snapshot.colunas_fg
+        return base
+
+    def remover(self, snapshot_id):
+        os.remove(self._caminho(snapshot_id))
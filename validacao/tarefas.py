@@ -0,0 +1,148 @@
+"""Validações em segundo plano, com progresso por etapa e cancelamento.
+
+No Streamlit o script roda de novo a cada clique; se a validação rodasse no
+próprio script, qualquer interação no meio de uma leitura longa jogaria o
+trabalho fora. Aqui cada trabalho vira uma ``Tarefa`` num registro do
+processo, identificada por uma chave (hash dos arquivos e opções): o rerun
+que encontra a tarefa em andamento só mostra o progresso, e o que a
+encontra concluída pega o resultado.
+
+As tarefas rodam em threads, não em processos: o resultado (DataFrames
+grandes) fica no mesmo processo sem ser serializado, e as partes pesadas
+(leitura do Excel, pandas, DuckDB) liberam o GIL. O progresso vem das
+etapas da ``Instrumentacao`` da tarefa, e o cancelamento é verificado no
+início de cada etapa.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from validacao.instrumentacao import Instrumentacao
+
+ESTADOS = ("na_fila", "executando", "concluida", "cancelada", "erro")
+
+
+class TarefaCancelada(Exception):
+    """Levantada dentro da tarefa, no início da etapa seguinte ao pedido de cancelamento."""
+
+
+@dataclass
+class Tarefa:
+    """Um trabalho do ``RegistroTarefas``.
+
+    ``etapas`` é o plano, na ordem em que as etapas devem acontecer: o
+    ``progresso`` (0 a 1) é a fração do plano já iniciada, e ``etapa`` a
+    última etapa do plano alcançada.
+    """
+
+    chave: object
+    descricao: str = ""
+    etapas: tuple = ()
+    estado: str = "na_fila"
+    etapa: str = ""
+    progresso: float = 0.0
+    resultado: object = None
+    erro: BaseException = None
+    criada_em: float = field(default_factory=time.time)
+    concluida_em: float = None
+    instrumentacao: Instrumentacao = None
+    _cancelamento: threading.Event = field(default_factory=threading.Event, repr=False)
+    _futuro: object = field(default=None, repr=False)
+
+    @property
+    def terminada(self):
+        return self.estado in ("concluida", "cancelada", "erro")
+
+    @property
+    def cancelamento_pedido(self):
+        return self._cancelamento.is_set()
+
+    @property
+    def duracao_s(self):
+        return (self.concluida_em or time.time()) - self.criada_em
+
+    def cancelar(self):
+        """Pede o cancelamento: imediato se a tarefa ainda está na fila."""
+        self._cancelamento.set()
+        if self._futuro is not None and self._futuro.cancel():
+            self.estado = "cancelada"
+            self.concluida_em = time.time()
+
+    def _ao_iniciar_etapa(self, nome):
+        if self._cancelamento.is_set():
+            raise TarefaCancelada(self.chave)
+        if nome in self.etapas:
+            progresso = self.etapas.index(nome) / len(self.etapas)
+            if progresso >= self.progresso:
+                self.progresso = progresso
+                self.etapa = nome
+
+    def _executar(self, funcao):
+        self.estado = "executando"
+        try:
+            self.resultado = funcao(self.instrumentacao)
+        except TarefaCancelada:
+            self.estado = "cancelada"
+        except Exception as e:
+            self.erro = e
+            self.estado = "erro"
+        else:
+            self.progresso = 1.0
+            self.estado = "concluida"
+        finally:
+            self.concluida_em = time.time()
+
+
+class RegistroTarefas:
+    """Tarefas do processo, por chave, num pool de ``max_simultaneas`` threads.
+
+    Pedir de novo uma chave devolve a tarefa que já existe (em andamento ou
+    terminada), em vez de começar outra. Das terminadas, só as
+    ``max_terminadas`` mais recentes são guardadas.
+    """
+
+    def __init__(self, max_simultaneas=2, max_terminadas=32):
+        self.max_terminadas = max_terminadas
+        self._executor = ThreadPoolExecutor(max_simultaneas, thread_name_prefix="validacao")
+        self._tarefas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tarefas)
+
+    def obter(self, chave):
+        with self._lock:
+            return self._tarefas.get(chave)
+
+    def submeter(self, chave, funcao, etapas=(), descricao="", perfilador=None):
+        """Tarefa de ``chave``; se ainda não existe, roda ``funcao(instrumentacao)``
+        em segundo plano e guarda o que ela devolver em ``resultado``."""
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if tarefa is not None:
+                return tarefa
+            tarefa = Tarefa(chave=chave, descricao=descricao, etapas=tuple(etapas))
+            tarefa.instrumentacao = Instrumentacao(perfilador, ao_iniciar_etapa=tarefa._ao_iniciar_etapa)
+            self._tarefas[chave] = tarefa
+            tarefa._futuro = self._executor.submit(tarefa._executar, funcao)
+            self._limpar_terminadas()
+            return tarefa
+
+    def descartar(self, chave):
+        """Tira a tarefa do registro (cancelando-a, se não terminou)."""
+        with self._lock:
+            tarefa = self._tarefas.pop(chave, None)
+        if tarefa is not None and not tarefa.terminada:
+            tarefa.cancelar()
+
+    def tarefas(self):
+        with self._lock:
+            return list(self._tarefas.values())
+
+    def _limpar_terminadas(self):
+        terminadas = [chave for chave, tarefa in self._tarefas.items() if tarefa.terminada]
+        for chave in terminadas[:max(0, len(terminadas) - self.max_terminadas)]:
+            del self._tarefas[chave]